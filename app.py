@@ -1,64 +1,198 @@
-from flask import Flask, render_template, Response
+from flask import Flask, render_template, Response, jsonify, abort
 from flask import request, redirect, url_for, flash
-import cv2
-from gesture_detection import GestureController
-from threading import Thread, Event
-import mediapipe as mp
+import os
+from werkzeug.serving import is_running_from_reloader
+from gesture_detection import GESTURE_NAMES
+from inference import InferencePool
+from sessions import SessionRegistry, client_source, profile_path
+from tracing import TRACER
 
 
-mp_drawing = mp.solutions.drawing_utils
-mp_hands = mp.solutions.hands
-gesture_detection_active = Event()
-gesture_detection_active.clear()
+app = Flask(__name__)
 
+# Video feed settings: JPEG quality, (width, height) of the streamed frames or None for the camera
+# resolution, and the maximum number of frames per second sent to the viewers
+VIDEO_FEED_QUALITY = 80
+VIDEO_FEED_SIZE = None
+VIDEO_FEED_MAX_FPS = 30
 
-app = Flask(__name__)
+# Hand detection settings: detect on a crop around the tracked hands (ROI) and adapt the detection
+# input resolution to reach the target frame rate on this machine (None for full resolution)
+DETECTION_ROI = True
+DETECTION_TARGET_FPS = 30
+# Run full hand detection on every n-th frame only (and whenever there is a lot of motion); the
+# landmarks of the frames in between are predicted
+DETECTION_EVERY = 2
+# Number of worker processes hand detection runs in (see inference.py), shared by all sessions; 0 runs
+# it in this process
+DETECTION_WORKERS = 0
+
+# Power saving: after IDLE_AFTER_FRAMES processed frames without hands, detection pauses and only
+# IDLE_CHECK_FPS small frames per second are checked for motion; detection resumes when more than
+# IDLE_WAKE_MOTION of the pixels moved (see IdleMonitor in pipeline.py). None keeps detection running.
+IDLE_AFTER_FRAMES = 90
+IDLE_CHECK_FPS = 5
+IDLE_WAKE_MOTION = 0.01
+
+# Gesture classification: path of a model trained with 'python gesture_model.py train', or None for the
+# threshold classifier
+GESTURE_MODEL = None
+
+# Cursor smoothing: 'dampening', 'one_euro' or 'kalman' (see cursor_filters.py and
+# benchmarks/bench_cursor.py), optionally predicted ahead by the time since the frame was captured
+CURSOR_FILTER = 'dampening'
+CURSOR_PREDICT = False
+
+# Startup: importing this module opens no camera and loads no model. A session starts on its first use
+# (its pages and feeds or /start_gesture_detection); with DETECTION_WARM_UP, create_app() loads the
+# MediaPipe graph of the default session in the background meanwhile
+# (flask --app "app:create_app()" run, see benchmarks/bench_startup.py)
+DETECTION_WARM_UP = True
+
+# Sessions created through POST /sessions may only use the mapping profiles PROFILES_DIR/NAME.txt (or
+# 'default', mappings.txt) and, besides device indices and 'synthetic', the video files and image
+# directories in MEDIA_DIR (None allows none), requested by name
+PROFILES_DIR = 'profiles'
+MEDIA_DIR = None
+
+# Largest number of spans /trace/start?events=N may ask the tracer to keep (an event takes a few hundred
+# bytes)
+TRACE_MAX_EVENTS = 1000000
+
+# Every camera stream is a session with its own gesture state, mappings and output (see sessions.py).
+# The 'default' session serves the pages and the routes without a session id; GESTURE_CAMERA_SOURCE
+# may name another device index, a video file, an image directory or 'synthetic' (see
+# camera.open_source). Further sessions are added through the /sessions routes.
+pool = InferencePool(DETECTION_WORKERS) if DETECTION_WORKERS else None
+sessions = SessionRegistry(pool, detection_options=dict(roi=DETECTION_ROI, target_fps=DETECTION_TARGET_FPS,
+                                                        detect_every=DETECTION_EVERY),
+                           idle_options=dict(idle_after=IDLE_AFTER_FRAMES, check_fps=IDLE_CHECK_FPS,
+                                             wake_motion=IDLE_WAKE_MOTION) if IDLE_AFTER_FRAMES else None,
+                           gesture_model=GESTURE_MODEL,
+                           cursor_filter=CURSOR_FILTER, cursor_predict=CURSOR_PREDICT,
+                           video_quality=VIDEO_FEED_QUALITY, video_size=VIDEO_FEED_SIZE,
+                           video_max_fps=VIDEO_FEED_MAX_FPS)
+CAMERA_SOURCE = os.environ.get('GESTURE_CAMERA_SOURCE', '0')
+default_session = sessions.create('default', source=CAMERA_SOURCE, start=False)
+gesture_detection_active = default_session.active
+
+
+# create_app function:
+# Application factory: returns the app with the hand detection of the default session warming up in
+# the background if 'warm_up'.
+def create_app(warm_up=DETECTION_WARM_UP):
+    if warm_up:
+        default_session.warm_up()
+    return app
+
+
+# get_session function:
+# Returns the session with the given id, started if 'start', or aborts the request with 404 (503 if
+# the session can not be started, e.g. its camera is unavailable).
+def get_session(session_id, start=False):
+    session = sessions.get(session_id)
+    if session is None:
+        abort(404, f"No session {session_id!r}")
+    if start:
+        try:
+            session.start()
+        except (ValueError, RuntimeError) as e:
+            abort(503, str(e))
+    return session
 
-# capture_frames function:
-# This function captures video frames using the GestureController object and calls the
-# process_frame method to process each frame
-def capture_frames(gc):
-    global gesture_detection_active
-    while True:
-        ret, frame = gc.cap.read()
-        if not ret:
-            break
-
-        frame = gc.process_frame(frame, gesture_detection_active)
-        gc.frame = frame
-
-# gen function:
-# This function generates video frames in the form of byte strings that can be used for streaming
-# purposes. It reads frames from the GestureController object, encodes them as JPEG images, and
-# returns the byte strings.
-def gen(gc):
-    while True:
-        ret, frame = gc.cap.read()  # getattr(gc, 'frame', None)
-        frame = cv2.flip(frame, 1)
-        
-        # Draw hand landmarks on the frame
-        if gc.hr_major or gc.hr_minor:
-            if gc.hr_major:
-                mp_drawing.draw_landmarks(frame, gc.hr_major, mp.solutions.hands.HAND_CONNECTIONS)
-            if gc.hr_minor:
-                mp_drawing.draw_landmarks(frame, gc.hr_minor, mp.solutions.hands.HAND_CONNECTIONS)
-
-        ret, jpeg = cv2.imencode('.jpg', frame)
-        if not ret:
-            print("Failed to encode the frame")
-
-        frame_bytes = jpeg.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-
-# Create the camera object
-camera = cv2.VideoCapture(0)
-gc = GestureController()
-Thread(target=capture_frames, args=(gc,), daemon=True).start()  
 @app.route('/video_feed')
-def video_feed():
-    return Response(gen(gc), mimetype='multipart/x-mixed-replace; boundary=frame')
-   
+@app.route('/sessions/<session_id>/video_feed')
+def video_feed(session_id='default'):
+    session = get_session(session_id, start=True)
+    return Response(session.broadcaster.subscribe(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+# landmarks route:
+# Server-Sent Events stream of the tracked hands and the current gesture, a few hundred bytes per frame
+# instead of a JPEG (see LandmarkStream in streaming.py for the record layout).
+@app.route('/landmarks')
+@app.route('/sessions/<session_id>/landmarks')
+def landmarks(session_id='default'):
+    session = get_session(session_id, start=True)
+    return Response(session.landmarks.subscribe(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+@app.route('/sessions/<session_id>/metrics')
+def metrics(session_id='default'):
+    session = get_session(session_id)
+    return Response(session.metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/stats')
+@app.route('/sessions/<session_id>/stats')
+def stats(session_id='default'):
+    return jsonify(get_session(session_id).metrics.snapshot())
+
+# trace routes:
+# Per-frame tracing of all sessions (see tracing.py). /trace/start clears the buffer and starts
+# recording (optionally keeping the last 'events' spans, at most TRACE_MAX_EVENTS), /trace/stop stops it
+# and /trace downloads the recorded spans as a Chrome trace for chrome://tracing or ui.perfetto.dev.
+@app.route('/trace/start')
+def start_trace():
+    events = None
+    if 'events' in request.args:
+        events = request.args.get('events', type=int)
+        if events is None or events <= 0:
+            return jsonify({'error': "'events' must be a positive integer"}), 400
+        events = min(events, TRACE_MAX_EVENTS)
+    TRACER.clear()
+    TRACER.start(events)
+    return '', 204
+
+@app.route('/trace/stop')
+def stop_trace():
+    TRACER.stop()
+    return '', 204
+
+@app.route('/trace')
+def download_trace():
+    return Response(TRACER.dumps(), mimetype='application/json',
+                    headers={'Content-Disposition': 'attachment; filename=gesture-trace.json'})
+
+# sessions routes:
+# GET lists the sessions, POST creates one from the form or JSON fields 'id' (optional), 'source'
+# (device index, 'synthetic' or a name in MEDIA_DIR), 'mappings' (profile name in PROFILES_DIR) and
+# 'output' ('os' or 'record'), DELETE stops one. Creating a session answers 400 for invalid fields and
+# 503 if the session can not be started.
+@app.route('/sessions', methods=['GET'])
+def list_sessions():
+    return jsonify([session.info() for session in sessions.list()])
+
+@app.route('/sessions', methods=['POST'])
+def create_session():
+    fields = request.get_json(silent=True) or request.form
+    options = {}
+    try:
+        if 'source' in fields:
+            options['source'] = client_source(fields['source'], MEDIA_DIR)
+        if 'mappings' in fields:
+            options['mappings_path'] = profile_path(str(fields['mappings']), PROFILES_DIR)
+        if 'output' in fields:
+            options['output'] = fields['output']
+        session = sessions.create(fields.get('id') or None, **options)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        # the session could not be started, e.g. hand detection could not be set up
+        return jsonify({'error': str(e)}), 503
+    return jsonify(session.info()), 201
+
+@app.route('/sessions/<session_id>', methods=['GET'])
+def session_info(session_id):
+    return jsonify(get_session(session_id).info())
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    if session_id == 'default':
+        return jsonify({'error': 'The default session can not be removed'}), 400
+    get_session(session_id)
+    sessions.remove(session_id)
+    return '', 204
+
 @app.route('/')
 def index():
     return render_template('homepage.html')
@@ -69,20 +203,25 @@ def settings():
 
 @app.route('/virtual_mouse_controller')
 def virtual_mouse_controller():
-    return render_template('virtual_mouse_controller.html')  # Create a virtual_mouse_controller.html file inside the templates folder
+    camera = get_session('default', start=True).camera
+    return render_template('virtual_mouse_controller.html', gesture_names=GESTURE_NAMES,
+                           width=camera.width, height=camera.height)  # Create a virtual_mouse_controller.html file inside the templates folder
 
 @app.route('/update_gesture_mappings', methods=['POST'])
-def update_gesture_mappings():
+@app.route('/sessions/<session_id>/update_gesture_mappings', methods=['POST'])
+def update_gesture_mappings(session_id='default'):
+    mappings = get_session(session_id).controller.mappings
     form_data = request.form
     print("Form data:", form_data)
 
-    with open('mappings.txt', 'r') as f:
+    with open(mappings.path, 'r') as f:
         lines = f.readlines()
 
     updated_lines = []
     used_gestures = set()
     for line in lines:
-        if line.strip():
+        # rule lines ('@...', see HandRules in gesture_detection.py) are kept as they are
+        if line.strip() and not line.lstrip().startswith('@'):
             gesture, action = line.strip().split(':')
             if action in form_data:
                 updated_gesture = form_data[action]
@@ -95,24 +234,26 @@ def update_gesture_mappings():
         else:
             updated_lines.append(line)
 
-    with open('mappings.txt', 'w') as f:
-        f.writelines(updated_lines)
+    # Write the new mappings atomically and swap the in-memory dispatch table used by the capture thread
+    mappings.save(updated_lines)
 
     return redirect(url_for('settings'))
 
 
 
 @app.route('/start_gesture_detection')
-def start_gesture_detection():
-    global gesture_detection_active
-    gesture_detection_active.set()
+@app.route('/sessions/<session_id>/start')
+def start_gesture_detection(session_id='default'):
+    get_session(session_id, start=True).active.set()
     return '', 204
 
 @app.route('/stop_gesture_detection')
-def stop_gesture_detection():
-    global gesture_detection_active
-    gesture_detection_active.clear()
+@app.route('/sessions/<session_id>/stop')
+def stop_gesture_detection(session_id='default'):
+    get_session(session_id).active.clear()
     return '', 204
 
 if __name__ == '__main__':
+    # The reloader serves the app from a child process; the watching parent never needs the model
+    create_app(warm_up=DETECTION_WARM_UP and is_running_from_reloader())
     app.run(host='0.0.0.0', debug=True)
@@ -0,0 +1,79 @@
+# Load test for the /video_feed broadcaster
+# ----------------------------------------
+# Simulates N concurrent viewers (some of them slow) on a synthetic camera and checks that every camera
+# frame is encoded at most once no matter how many clients are connected, and that all clients receive
+# the very same bytes objects.
+#
+#   python benchmarks/bench_broadcast.py --clients 16 --seconds 5
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from camera import CameraProducer, SyntheticSource
+from streaming import FrameBroadcaster
+
+
+def client(broadcaster, delay, received, stop):
+    for chunk in broadcaster.subscribe():
+        received.append(chunk)
+        if stop.is_set():
+            break
+        if delay:
+            time.sleep(delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test for the /video_feed broadcaster')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--slow', type=int, default=2, help='number of clients that take 200 ms per frame')
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--quality', type=int, default=80)
+    args = parser.parse_args()
+
+    camera = CameraProducer(SyntheticSource(args.width, args.height, args.fps)).start()
+    broadcaster = FrameBroadcaster(camera, quality=args.quality, max_fps=None).start()
+
+    stop = threading.Event()
+    received = [[] for _ in range(args.clients)]
+    threads = []
+    for i in range(args.clients):
+        delay = 0.2 if i < args.slow else 0.0
+        t = threading.Thread(target=client, args=(broadcaster, delay, received[i], stop), daemon=True)
+        t.start()
+        threads.append(t)
+
+    time.sleep(args.seconds)
+    stop.set()
+    frames = camera.latest()[0]
+    camera.stop()
+    broadcaster.stop()
+    for t in threads:
+        t.join(timeout=1.0)
+
+    encodes = broadcaster.encode_count
+    distinct = len({id(chunk) for r in received for chunk in r})
+    delivered = sum(len(r) for r in received)
+    print(f"clients:               {args.clients} ({args.slow} slow)")
+    print(f"camera frames:         {frames}")
+    print(f"encodes:               {encodes}")
+    print(f"encodes per frame:     {encodes / max(frames, 1):.2f}")
+    print(f"chunks delivered:      {delivered}")
+    print(f"distinct chunks sent:  {distinct}")
+    for i, r in enumerate(received):
+        print(f"  client {i:2d}: {len(r):4d} frames")
+
+    # One encode per camera frame at most (+1 for the frame in flight when the camera stopped) and
+    # every delivered chunk is one of the encoded ones
+    if encodes > frames + 1 or distinct > encodes:
+        print("FAILED: frames were encoded more than once")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
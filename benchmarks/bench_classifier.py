@@ -0,0 +1,145 @@
+# Threshold vs. learned gesture classifier
+# ---------------------------------------
+# Generates labelled synthetic hands from a simple kinematic hand model (finger flexion and spread per
+# gesture, random pose noise, tilt, turn and in-plane rotation, position and MediaPipe-like landmark
+# jitter) at a range of hand sizes (camera distances), trains a GestureModel on one set and reports,
+# on another, the accuracy of the model and of the threshold classifier of landmarks.py per hand size,
+# as well as the per-frame latency of both for one and two hands. Labelled traces (PATH:GESTURE, see
+# gesture_model.py) can be used instead of the synthetic test hands.
+#
+#   python benchmarks/bench_classifier.py
+#   python benchmarks/bench_classifier.py --model gesture_model.npz --trace fist.jsonl:FIST
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gesture_model import GestureModel, load_traces
+from landmarks import classify
+from gesture_detection import Gest
+
+# (knuckle landmark, knuckle position, spread angle, segment lengths) of index..pinky, in units of the
+# wrist -> middle knuckle distance; image coordinates (y down, z towards the camera negative)
+FINGERS = [(5, (-0.32, -0.92), -0.12, (0.42, 0.25, 0.20)),
+           (9, (-0.08, -1.00), -0.03, (0.47, 0.29, 0.22)),
+           (13, (0.15, -0.94), 0.06, (0.43, 0.27, 0.21)),
+           (17, (0.36, -0.80), 0.16, (0.33, 0.20, 0.18))]
+OPEN = (0.05, 0.05, 0.05)
+CURLED = (1.5, 1.6, 1.0)
+BENT = (0.9, 1.1, 0.5)
+THUMB_OPEN = [(-0.20, -0.25, -0.05), (-0.42, -0.42, -0.08), (-0.58, -0.55, -0.10), (-0.70, -0.65, -0.10)]
+THUMB_FOLDED = [(-0.20, -0.25, -0.05), (-0.35, -0.45, -0.12), (-0.30, -0.60, -0.18), (-0.18, -0.66, -0.22)]
+
+# gesture -> (flexion of index..pinky, extra spread of index..pinky, thumb)
+POSES = {
+    Gest.FIST: ((CURLED,) * 4, (0, 0, 0, 0), 'folded'),
+    Gest.INDEX: ((OPEN, CURLED, CURLED, CURLED), (0, 0, 0, 0), 'folded'),
+    Gest.MID: ((CURLED, OPEN, CURLED, CURLED), (0, 0, 0, 0), 'folded'),
+    Gest.V_GEST: ((OPEN, OPEN, CURLED, CURLED), (-0.25, 0.2, 0, 0), 'folded'),
+    Gest.TWO_FINGER_CLOSED: ((OPEN, OPEN, CURLED, CURLED), (0.07, -0.02, 0, 0), 'folded'),
+    Gest.LAST4: ((OPEN,) * 4, (0, 0, 0, 0), 'open'),
+    Gest.PINCH_MAJOR: ((BENT, OPEN, OPEN, OPEN), (0, 0, 0, 0), 'pinch'),
+}
+
+
+# synthetic_hands:
+# 'n' hands of random gestures: (landmarks (n, 21, 3), gesture codes, hand size). The hand size is the
+# wrist -> middle knuckle distance in normalized image units, uniform in 'sizes'.
+def synthetic_hands(n, sizes=(0.06, 0.3), seed=0):
+    rng = np.random.default_rng(seed)
+    gestures = list(POSES)
+    labels = rng.integers(0, len(gestures), n)
+    hands = np.zeros((n, 21, 3))
+    for i, g in enumerate(labels):
+        flexes, spreads, thumb = POSES[gestures[g]]
+        for (base, (bx, by), spread, lengths), flex, extra in zip(FINGERS, flexes, spreads):
+            point = np.array([bx, by, 0.0])
+            hands[i, base] = point
+            angle = spread + extra + rng.normal(0, 0.04)
+            phi = 0.0
+            for k in range(3):
+                phi += flex[k] + rng.normal(0, 0.12)
+                direction = np.array([np.sin(angle) * np.cos(phi), -np.cos(angle) * np.cos(phi), -np.sin(phi)])
+                point = point + lengths[k] * direction
+                hands[i, base + k + 1] = point
+        if thumb == 'pinch':
+            tip = hands[i, 8] + rng.normal(0, 0.04, 3)
+            hands[i, 1:5] = [THUMB_OPEN[0], THUMB_OPEN[1], (THUMB_OPEN[1] + tip) / 2, tip]
+        else:
+            hands[i, 1:5] = THUMB_OPEN if thumb == 'open' else THUMB_FOLDED
+            hands[i, 1:5] += rng.normal(0, 0.03, (4, 3))
+    # tilt towards / away from the camera (pitch) and turn (yaw)
+    pitch, yaw = rng.uniform(-0.5, 0.5, n)[:, None], rng.uniform(-0.5, 0.5, n)[:, None]
+    x, y, z = hands[..., 0], hands[..., 1], hands[..., 2]
+    y, z = y * np.cos(pitch) - z * np.sin(pitch), y * np.sin(pitch) + z * np.cos(pitch)
+    x, z = x * np.cos(yaw) + z * np.sin(yaw), -x * np.sin(yaw) + z * np.cos(yaw)
+    hands = np.stack([x, y, z], axis=2)
+    size = rng.uniform(sizes[0], sizes[1], n)
+    angle = rng.normal(0, 0.2, n)
+    cos, sin = np.cos(angle)[:, None], np.sin(angle)[:, None]
+    x = (hands[..., 0] * cos - hands[..., 1] * sin) * size[:, None]
+    y = (hands[..., 0] * sin + hands[..., 1] * cos) * size[:, None]
+    z = hands[..., 2] * size[:, None]
+    center = rng.uniform(0.3, 0.7, (n, 1, 2))
+    out = np.stack([x, y + 0.5 * size[:, None], z], axis=2)
+    out[..., :2] += center
+    out += rng.normal(0, 0.003, out.shape) * [1, 1, 0.5]
+    codes = np.array([gestures[g].value for g in labels])
+    return out.astype(np.float32), codes, size
+
+
+def per_call(function, hands, count, repeat=2000):
+    batch = hands[:count]
+    minor = np.zeros(count, bool)
+    t = time.perf_counter()
+    for _ in range(repeat):
+        function(batch, minor)
+    return (time.perf_counter() - t) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Threshold vs. learned gesture classifier')
+    parser.add_argument('--train', type=int, default=8000, help='synthetic training hands')
+    parser.add_argument('--test', type=int, default=4000, help='synthetic test hands')
+    parser.add_argument('--model', help='evaluate this model instead of training one')
+    parser.add_argument('--trace', action='append', default=[], help='labelled test trace PATH:GESTURE')
+    parser.add_argument('--epochs', type=int, default=150)
+    args = parser.parse_args()
+
+    if args.model:
+        model = GestureModel.load(args.model)
+    else:
+        x, y, _ = synthetic_hands(args.train, seed=1)
+        t = time.perf_counter()
+        model = GestureModel.train(x, y, epochs=args.epochs)
+        print(f"trained on {args.train} hands in {time.perf_counter() - t:.1f}s")
+
+    if args.trace:
+        hands, labels = load_traces(args.trace)
+        sizes = np.zeros(len(labels))
+        buckets = [(0, np.inf)]
+    else:
+        hands, labels, sizes = synthetic_hands(args.test, seed=2)
+        buckets = [(0.06, 0.1), (0.1, 0.15), (0.15, 0.2), (0.2, 0.25), (0.25, 0.3)]
+    predicted, _ = model.predict(hands)
+    threshold, _ = classify(hands, np.zeros(len(labels), bool))
+
+    print(f"{'hand size':12s} {'hands':>6s} {'model':>7s} {'threshold':>10s}")
+    for lo, hi in buckets:
+        mask = (sizes >= lo) & (sizes < hi)
+        name = 'all' if hi == np.inf else f"{lo:.2f}-{hi:.2f}"
+        print(f"{name:12s} {mask.sum():6d} {(predicted[mask] == labels[mask]).mean():7.1%} "
+              f"{(threshold[mask] == labels[mask]).mean():10.1%}")
+    if not args.trace:
+        print(f"{'all':12s} {len(labels):6d} {(predicted == labels).mean():7.1%} {(threshold == labels).mean():10.1%}")
+
+    print(f"\n{'per frame':12s} {'model us':>9s} {'threshold us':>13s}")
+    for count in (1, 2):
+        print(f"{str(count) + ' hand(s)':12s} {per_call(model.classify, hands, count) * 1e6:9.1f} "
+              f"{per_call(classify, hands, count) * 1e6:13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+# Jitter vs. lag of the cursor filters
+# ------------------------------------
+# Runs every cursor filter of cursor_filters.py over the cursor landmark (9) of recorded landmark
+# traces, or over a synthetic path with known ground truth (holds, slow and fast moves plus detection
+# noise), and reports for each filter:
+#
+#   jitter  RMS frame-to-frame movement of the cursor while the hand holds still (synthetic), or the
+#           RMS second difference of the cursor path (traces), in px
+#   lag     delay of the cursor movement behind the true (synthetic) or raw (traces) hand movement,
+#           in ms
+#   error   RMS distance to the true path (synthetic only), in px
+#
+# The synthetic landmarks reach the filters --latency seconds after the hand was there, like after
+# capture and detection; filters are run as configured by default and with prediction ahead by that
+# latency, which can make up for it (a negative lag means the cursor leads).
+#
+#   python benchmarks/bench_cursor.py
+#   python benchmarks/bench_cursor.py --trace session.jsonl --trace other.jsonl
+import argparse
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cursor_filters import FILTERS, CursorEngine
+from traces import read_trace
+
+SCREEN = (1920, 1080)
+
+
+# synthetic_path:
+# (t, raw points, true points, raw point holding still) of a hand that alternately holds still and moves between
+# random targets, slowly or fast, sampled at 'fps' with Gaussian noise of 'noise' (normalized units).
+# The raw points show the hand as it was 'latency' seconds earlier.
+def synthetic_path(seconds=60, fps=30, noise=0.002, latency=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    n = int(seconds * fps)
+    truth = np.zeros((n, 2))
+    holding = np.zeros(n, bool)
+    pos = np.array([0.5, 0.5])
+    i = 0
+    while i < n:
+        hold = int(rng.uniform(0.5, 1.5) * fps)
+        truth[i:i + hold] = pos
+        holding[i:i + hold] = True
+        i += hold
+        target = rng.uniform(0.1, 0.9, 2)
+        steps = int(rng.choice([0.25, 1.0]) * fps)
+        for k in range(1, steps + 1):
+            if i >= n:
+                break
+            s = k / steps
+            truth[i] = pos + (target - pos) * (3 * s * s - 2 * s * s * s)
+            i += 1
+        pos = target
+    t = np.arange(n) / float(fps)
+    delayed = np.stack([np.interp(t - latency, t, truth[:, k]) for k in range(2)], axis=1)
+    raw = delayed + rng.normal(0.0, noise, truth.shape)
+    holding = np.interp(t - latency, t, holding.astype(float)) == 1.0
+    return t, raw * SCREEN, truth * SCREEN, holding
+
+
+# trace_paths:
+# Contiguous runs of (t, points) of landmark 9 of the first hand in a trace.
+def trace_paths(path):
+    runs, t, points = [], [], []
+    for record in read_trace(path):
+        if record['hands']:
+            x, y, _ = record['hands'][0]['landmarks'][9]
+            t.append(record['t'])
+            points.append((x * SCREEN[0], y * SCREEN[1]))
+        elif points:
+            runs.append((np.array(t), np.array(points)))
+            t, points = [], []
+    if points:
+        runs.append((np.array(t), np.array(points)))
+    return [run for run in runs if len(run[0]) > 10]
+
+
+def run_filter(engine, t, raw, latency):
+    engine.reset()
+    out = np.zeros_like(raw)
+    current = None
+    for i in range(len(t)):
+        current = engine.update(raw[i], t[i], current, latency)
+        out[i] = current
+    return out
+
+
+# lag_ms:
+# Delay of the cursor movement behind the reference movement: the shift in 1 ms steps (within
+# +-'max_lag' seconds) that best correlates the velocity of 'out' with the delayed velocity of 'ref'.
+# Comparing velocities keeps the measure meaningful for relative filters like the dampening.
+def lag_ms(t, ref, out, max_lag=0.3):
+    if len(t) < 3:
+        return 0.0
+    v_out = np.diff(out, axis=0)
+    best, best_lag = None, 0.0
+    for lag in np.arange(-max_lag, max_lag, 0.001):
+        delayed = np.stack([np.interp(t - lag, t, ref[:, k]) for k in range(2)], axis=1)
+        v_ref = np.diff(delayed, axis=0)
+        score = float((v_out * v_ref).sum() / (np.sqrt((v_out ** 2).sum() * (v_ref ** 2).sum()) + 1e-9))
+        if best is None or score > best:
+            best, best_lag = score, lag
+    return best_lag * 1000.0
+
+
+def rms(values):
+    return float(np.sqrt((values ** 2).sum(axis=-1).mean())) if len(values) else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Jitter vs. lag of the cursor filters')
+    parser.add_argument('--trace', action='append', default=[], help='landmark trace (repeatable)')
+    parser.add_argument('--latency', type=float, default=0.05, help='pipeline latency predicted ahead, in s')
+    parser.add_argument('--seconds', type=float, default=60, help='length of the synthetic path')
+    args = parser.parse_args()
+
+    variants = [(name, False) for name in FILTERS] + [(name, True) for name in FILTERS if name != 'dampening']
+    print(f"{'filter':22s} {'jitter px':>10s} {'lag ms':>8s} {'error px':>9s}")
+    for name, predict in variants:
+        engine = CursorEngine(name, predict=predict)
+        latency = args.latency if predict else 0.0
+        label = name + (' +predict' if predict else '')
+        if args.trace:
+            jitter, lags, samples = [], [], 0
+            for path in args.trace:
+                for t, raw in trace_paths(path):
+                    out = run_filter(engine, t, raw, latency)
+                    jitter.append(np.diff(out, 2, axis=0))
+                    lags.append(lag_ms(t, raw, out) * len(t))
+                    samples += len(t)
+            if not samples:
+                print("no hands in the traces")
+                return
+            print(f"{label:22s} {rms(np.concatenate(jitter)):10.2f} {sum(lags) / samples:8.1f} {'':>9s}")
+        else:
+            t, raw, truth, holding = synthetic_path(args.seconds, latency=args.latency)
+            out = run_filter(engine, t, raw, latency)
+            still = holding[1:] & holding[:-1]
+            jitter = rms(np.diff(out, axis=0)[still])
+            # the dampening moves the cursor relative to its previous position, so it has no absolute error
+            error = f"{rms(out - truth):9.2f}" if name != 'dampening' else f"{'-':>9s}"
+            print(f"{label:22s} {jitter:10.2f} {lag_ms(t, truth, out):8.1f} {error}")
+
+
+if __name__ == '__main__':
+    main()
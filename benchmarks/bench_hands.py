@@ -0,0 +1,187 @@
+# Two-handed operation: one action per frame vs. per-hand action channels
+# -----------------------------------------------------------------------
+# Two hands are in view: the major hand moves the cursor (V gesture) while the minor hand scrolls
+# (pinch), both moving up and down. The gestures are forced by a classifier that runs the threshold
+# classifier for its cost and then reports V_GEST and PINCH_MINOR, so both runs see the same gestures.
+# Compares GestureController.process_frame (without detection) with the rules of the former single
+# action per frame ('@conflict:*=minor': a scrolling minor hand stops the major hand) and with the
+# default per-hand channels:
+#
+#   fps          frames per second process_frame reaches on the gesture stages alone (unpaced)
+#   hand_recog   mean ms of the batched classification of both hands (HandRecog.set_finger_states)
+#   controls     mean ms of Controller.handle_hands
+#   moves/s      cursor moves and scroll changes per second sent to the OS at --fps camera frames
+#   scroll/s
+#
+# and the cost of classifying the two hands in one batch against one call per hand, for classify alone
+# and for HandRecog.set_finger_states (classification plus the per-hand TemporalEngine). classify runs
+# one or two hands through its scalar path either way, so batching is not expected to gain anything;
+# the benchmark reports whether it does.
+#
+#   python benchmarks/bench_hands.py --frames 3000 --fps 30 --seconds 2
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gesture_detection import Controller, GestureController, Gest, HandRecog
+from input_dispatch import InputDispatcher, RecordingBackend
+from landmarks import classify
+from pipeline import StageTimer
+from traces import results_from_record
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ResultsPipeline class:
+# Stands in for the HandPipeline and returns prepared detection results in a loop.
+class ResultsPipeline:
+
+    def __init__(self, records):
+        self.records = records
+        self.index = 0
+        self.timer = StageTimer()
+
+    def process(self, frame=None, stamp=None):
+        results = self.records[self.index % len(self.records)]
+        self.index += 1
+        self.timer.frames += 1
+        return results
+
+    def close(self):
+        pass
+
+
+# two_handed:
+# Classifier that reports V_GEST for the major and PINCH_MINOR for the minor hand.
+def two_handed(batch, minor):
+    gestures, fingers = classify(batch, minor)
+    gestures = np.where(np.asarray(minor), int(Gest.PINCH_MINOR), int(Gest.V_GEST))
+    return gestures, fingers
+
+
+# hand_records:
+# Detection results of two open hands side by side moving up and down together.
+def hand_records(n, seed=0):
+    rng = np.random.default_rng(seed)
+    palm = np.array([[0.5, 0.9, 0.0]] + [[0.45 + 0.03 * (i // 4), 0.8 - 0.05 * (i % 4 + 1), -0.02]
+                                         for i in range(20)])
+    records = []
+    for i in range(n):
+        lift = 0.15 * np.sin(i / 20.0)
+        hands = []
+        for dx, label in ((0.2, 'Right'), (-0.2, 'Left')):
+            landmarks = palm + [dx, -lift, 0.0] + rng.normal(0.0, 0.002, palm.shape)
+            hands.append({'label': label, 'score': 0.95, 'landmarks': landmarks.astype(np.float32).tolist()})
+        records.append(results_from_record({'hands': hands}))
+    return records
+
+
+# controller:
+# A GestureController with recording outputs and the repository's mappings plus 'rules' lines.
+def controller(records, rules, directory):
+    path = os.path.join(directory, 'mappings.txt')
+    shutil.copy(os.path.join(ROOT, 'mappings.txt'), path)
+    with open(path, 'a') as f:
+        f.writelines(rule + '\n' for rule in rules)
+    backend = RecordingBackend()
+    control = Controller(InputDispatcher(backend, move_duration=0), mappings_path=path)
+    gc = GestureController(pipeline=ResultsPipeline(records), controller=control, classifier=two_handed)
+    gc.timing_report_every = 0
+    return gc, backend
+
+
+def close(gc):
+    gc.controller.stop()
+    gc.controller.dispatcher.flush()
+    gc.controller.dispatcher.stop()
+
+
+# throughput:
+# (fps, mean ms of hand_recog, mean ms of controls) of process_frame over 'frames' unpaced frames.
+def throughput(records, rules, frames, directory):
+    gc, _ = controller(records, rules, directory)
+    recog, controls = [], []
+    original = gc.pipeline.timer.add
+
+    def add(stage, seconds, end=None):
+        if stage == 'hand_recog':
+            recog.append(seconds)
+        elif stage == 'controls':
+            controls.append(seconds)
+        original(stage, seconds, end)
+
+    gc.pipeline.timer.add = add
+    start = time.perf_counter()
+    for _ in range(frames):
+        gc.process_frame(None)
+    elapsed = time.perf_counter() - start
+    close(gc)
+    return frames / elapsed, np.mean(recog) * 1000, np.mean(controls) * 1000
+
+
+# outputs:
+# (cursor moves per second, scroll changes per second) sent to the backend at 'fps' camera frames.
+def outputs(records, rules, fps, seconds, directory):
+    gc, backend = controller(records, rules, directory)
+    start = time.monotonic()
+    for i in range(int(fps * seconds)):
+        gc.process_frame(None, time.monotonic())
+        time.sleep(max(0.0, start + (i + 1) / fps - time.monotonic()))
+    close(gc)
+    names = [call[1] for call in backend.calls]
+    return names.count('move_to') / seconds, names.count('scroll') / seconds
+
+
+# classification:
+# Microseconds per frame to classify both hands in one batch and with one call per hand:
+# {'classify': (batched, serial), 'set_finger_states': (batched, serial)}.
+def classification(records, number=3000):
+    gc = GestureController(pipeline=ResultsPipeline(records), controller=Controller(InputDispatcher(RecordingBackend())))
+    gc.classify_hands(records[0])
+    hands = [gc.handmajor, gc.handminor]
+    minor = [False, True]
+    timings = {
+        'classify': (lambda: classify(np.stack([hand.landmarks for hand in hands]), minor),
+                     lambda: [classify(hand.landmarks, [m]) for hand, m in zip(hands, minor)]),
+        'set_finger_states': (lambda: HandRecog.set_finger_states(hands, classify),
+                              lambda: [HandRecog.set_finger_states([hand], classify) for hand in hands]),
+    }
+    results = {name: tuple(timeit.timeit(fn, number=number) / number * 1e6 for fn in fns)
+               for name, fns in timings.items()}
+    gc.controller.dispatcher.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='One action per frame vs. per-hand action channels')
+    parser.add_argument('--frames', type=int, default=3000, help='frames of the throughput run')
+    parser.add_argument('--fps', type=int, default=30, help='camera frame rate of the output run')
+    parser.add_argument('--seconds', type=float, default=2.0, help='duration of the output run')
+    args = parser.parse_args()
+
+    records = hand_records(200)
+    paths = [('single action', ['@conflict:*=minor']), ('per-hand channels', [])]
+    directory = tempfile.mkdtemp()
+    try:
+        print(f"{'path':18s} {'fps':>8s} {'hand_recog':>11s} {'controls':>9s} {'moves/s':>8s} {'scroll/s':>9s}")
+        for name, rules in paths:
+            fps, recog, controls = throughput(records, rules, args.frames, directory)
+            moves, scrolls = outputs(records, rules, args.fps, args.seconds, directory)
+            print(f"{name:18s} {fps:8.0f} {recog:8.3f} ms {controls:6.3f} ms {moves:8.1f} {scrolls:9.1f}")
+    finally:
+        shutil.rmtree(directory)
+    print("\nclassifying two hands:")
+    for name, (batched, serial) in classification(records).items():
+        gain = serial / batched - 1.0
+        verdict = f"batching {gain:.0%} faster" if gain > 0.05 else "no gain from batching"
+        print(f"  {name:18s} batched {batched:6.1f} us, one call per hand {serial:6.1f} us: {verdict}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Benchmark of OS input dispatch from the recognition loop
+# --------------------------------------------------------
+# Simulates the recognition thread moving the cursor every frame (with an occasional click) against a
+# RecordingBackend, once with the old blocking moveTo(duration=0.1) behaviour and once through the
+# InputDispatcher. Reports the time the recognition loop spends per frame, the frame rate it reaches
+# and the gesture -> action latency measured by the dispatcher.
+#
+#   python benchmarks/bench_input.py --frames 150 --fps 30
+import argparse
+import math
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from input_dispatch import InputDispatcher, RecordingBackend
+
+
+def targets(n):
+    for i in range(n):
+        yield 960 + 400 * math.cos(i / 15.0), 540 + 300 * math.sin(i / 15.0), i % 30 == 29
+
+
+# run_blocking:
+# Old behaviour: every move blocks the recognition loop for the whole 0.1 s motion.
+def run_blocking(frames, fps):
+    backend = RecordingBackend()
+    loop = []
+    start = time.monotonic()
+    for x, y, click in targets(frames):
+        t = time.monotonic()
+        time.sleep(0.1)
+        backend.move_to(int(x), int(y))
+        if click:
+            backend.click()
+        loop.append(time.monotonic() - t)
+        time.sleep(max(0.0, 1.0 / fps - (time.monotonic() - t)))
+    return loop, time.monotonic() - start, [], backend
+
+
+def run_dispatcher(frames, fps):
+    backend = RecordingBackend()
+    dispatcher = InputDispatcher(backend).start()
+    loop = []
+    start = time.monotonic()
+    for x, y, click in targets(frames):
+        t = time.monotonic()
+        dispatcher.begin_frame(t)
+        dispatcher.move_to(x, y)
+        if click:
+            dispatcher.click()
+        loop.append(time.monotonic() - t)
+        time.sleep(max(0.0, 1.0 / fps - (time.monotonic() - t)))
+    elapsed = time.monotonic() - start
+    dispatcher.flush()
+    dispatcher.stop()
+    return loop, elapsed, list(dispatcher.latencies), backend
+
+
+def report(name, frames, loop, elapsed, latencies, backend):
+    loop = np.array(loop) * 1000
+    print(f"{name}")
+    print(f"  recognition loop per frame: p50 {np.percentile(loop, 50):8.3f} ms   p95 {np.percentile(loop, 95):8.3f} ms")
+    print(f"  frame rate reached:         {frames / elapsed:8.1f} fps")
+    print(f"  OS calls:                   {len(backend.calls)}")
+    if latencies:
+        lat = np.array(latencies) * 1000
+        print(f"  gesture -> action latency:  p50 {np.percentile(lat, 50):8.3f} ms   p95 {np.percentile(lat, 95):8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of OS input dispatch from the recognition loop')
+    parser.add_argument('--frames', type=int, default=150)
+    parser.add_argument('--fps', type=int, default=30)
+    args = parser.parse_args()
+
+    report('blocking moveTo(duration=0.1)', args.frames, *run_blocking(args.frames, args.fps))
+    report('InputDispatcher', args.frames, *run_dispatcher(args.frames, args.fps))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+# Micro-benchmark of the landmark feature extraction
+# --------------------------------------------------
+# Compares the original per-landmark scalar HandRecog code (kept here as the reference) with
+# landmarks.classify on random hands, checks that both produce exactly the same finger states and
+# gestures, and times them. classify computes one or two hands per call (the per-frame case) with its
+# scalar path and larger batches with NumPy; 'numpy, two hands per call' forces the NumPy path for
+# comparison. The hands are MediaPipe NormalizedLandmarkList messages, as detection returns them.
+#
+#   python benchmarks/bench_landmarks.py --hands 20000
+import argparse
+import math
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import landmarks
+from landmarks import classify, landmarks_to_array, PINCH_MAJOR, PINCH_MINOR, V_GEST, TWO_FINGER_CLOSED, MID
+
+
+# Reference implementation: set_finger_state/get_gesture as they were before vectorization, without
+# the debouncing.
+class ReferenceHandRecog:
+
+    def __init__(self, hand_result, minor):
+        self.hand_result = hand_result
+        self.minor = minor
+        self.finger = 0
+
+    def get_signed_dist(self, point):
+        sign = -1
+        if self.hand_result.landmark[point[0]].y < self.hand_result.landmark[point[1]].y:
+            sign = 1
+        dist = (self.hand_result.landmark[point[0]].x - self.hand_result.landmark[point[1]].x)**2
+        dist += (self.hand_result.landmark[point[0]].y - self.hand_result.landmark[point[1]].y)**2
+        dist = math.sqrt(dist)
+        return dist*sign
+
+    def get_dist(self, point):
+        dist = (self.hand_result.landmark[point[0]].x - self.hand_result.landmark[point[1]].x)**2
+        dist += (self.hand_result.landmark[point[0]].y - self.hand_result.landmark[point[1]].y)**2
+        dist = math.sqrt(dist)
+        return dist
+
+    def get_dz(self, point):
+        return abs(self.hand_result.landmark[point[0]].z - self.hand_result.landmark[point[1]].z)
+
+    def set_finger_state(self):
+        points = [[8,5,0],[12,9,0],[16,13,0],[20,17,0]]
+        self.finger = 0
+        for idx,point in enumerate(points):
+            dist = self.get_signed_dist(point[:2])
+            dist2 = self.get_signed_dist(point[1:])
+            try:
+                ratio = round(dist/dist2,1)
+            except:
+                ratio = round(dist/0.01,1)
+            self.finger = self.finger << 1
+            if ratio > 0.5 :
+                self.finger = self.finger | 1
+
+    def get_gesture(self):
+        if self.finger in [7, 15] and self.get_dist([8,4]) < 0.05:
+            return PINCH_MINOR if self.minor else PINCH_MAJOR
+        elif self.finger == 12:
+            dist2 = self.get_dist([5,9])
+            ratio = self.get_dist([8,12])/dist2 if dist2 else math.inf
+            if ratio > 1.7:
+                return V_GEST
+            if self.get_dz([8,12]) < 0.1:
+                return TWO_FINGER_CLOSED
+            return MID
+        return self.finger
+
+
+# random_hands:
+# Random (n, 21, 3) float32 hands. Coordinates are snapped to a coarse grid for part of them, which
+# produces exact ties at the classification thresholds, and part of them get the thumb moved next to
+# the index tip so that pinches occur.
+def random_hands(n, seed=0):
+    rng = np.random.default_rng(seed)
+    hands = rng.uniform(0.0, 1.0, (n, 21, 3))
+    hands[..., 2] = rng.normal(0.0, 0.1, (n, 21))
+    grid = rng.random(n) < 0.3
+    hands[grid] = np.round(hands[grid] * 20) / 20
+    pinch = rng.random(n) < 0.3
+    hands[pinch, 4, :2] = hands[pinch, 8, :2] + rng.normal(0.0, 0.03, (pinch.sum(), 2))
+    return hands.astype(np.float32)
+
+
+def to_landmark_list(hand):
+    from mediapipe.framework.formats import landmark_pb2
+    landmark_list = landmark_pb2.NormalizedLandmarkList()
+    for x, y, z in hand:
+        landmark_list.landmark.add(x=float(x), y=float(y), z=float(z))
+    return landmark_list
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmark of the landmark feature extraction')
+    parser.add_argument('--hands', type=int, default=20000)
+    args = parser.parse_args()
+
+    hands = random_hands(args.hands)
+    minor = np.arange(args.hands) % 2 == 0
+    results = [to_landmark_list(hand) for hand in hands]
+
+    t = time.perf_counter()
+    ref = []
+    for hand_result, m in zip(results, minor):
+        recog = ReferenceHandRecog(hand_result, m)
+        recog.set_finger_state()
+        ref.append((recog.get_gesture(), recog.finger))
+    t_ref = time.perf_counter() - t
+
+    # Per-frame path: convert the landmarks of one hand and classify it
+    buf = np.empty((21, 3), np.float32)
+    t = time.perf_counter()
+    single = []
+    for hand_result, m in zip(results, minor):
+        gesture, finger = classify(landmarks_to_array(hand_result, buf), [m])
+        single.append((int(gesture[0]), int(finger[0])))
+    t_single = time.perf_counter() - t
+
+    # The same without the landmark conversion
+    t = time.perf_counter()
+    for hand, m in zip(hands, minor):
+        classify(hand, [m])
+    t_classify = time.perf_counter() - t
+
+    # Two hands per frame classified together
+    t = time.perf_counter()
+    pairs = []
+    for i in range(0, args.hands - 1, 2):
+        gesture, finger = classify(hands[i:i + 2], minor[i:i + 2])
+        pairs.extend(zip(gesture.tolist(), finger.tolist()))
+    t_pair = time.perf_counter() - t
+
+    scalar_max_hands = landmarks.SCALAR_MAX_HANDS
+    landmarks.SCALAR_MAX_HANDS = 0
+    t = time.perf_counter()
+    numpy_pairs = []
+    for i in range(0, args.hands - 1, 2):
+        gesture, finger = classify(hands[i:i + 2], minor[i:i + 2])
+        numpy_pairs.extend(zip(gesture.tolist(), finger.tolist()))
+    t_numpy_pair = time.perf_counter() - t
+    landmarks.SCALAR_MAX_HANDS = scalar_max_hands
+
+    t = time.perf_counter()
+    gesture, finger = classify(hands, minor)
+    t_batch = time.perf_counter() - t
+    batch = list(zip(gesture.tolist(), finger.tolist()))
+
+    mismatches = sum(r != s for r, s in zip(ref, single)) + sum(r != b for r, b in zip(ref, batch))
+    mismatches += sum(r != p for r, p in zip(ref, pairs)) + sum(r != p for r, p in zip(ref, numpy_pairs))
+    # the landmark conversion must reproduce the float32 landmarks exactly
+    mismatches += sum(not np.array_equal(landmarks_to_array(hand_result), hand)
+                      for hand_result, hand in zip(results, hands))
+    counts = {}
+    for g, _ in ref:
+        counts[g] = counts.get(g, 0) + 1
+
+    n = args.hands
+    print(f"hands:                      {n}")
+    print(f"gesture histogram:          {dict(sorted(counts.items()))}")
+    print(f"scalar reference:           {t_ref / n * 1e6:8.2f} us/hand")
+    print(f"one hand per call:          {t_single / n * 1e6:8.2f} us/hand (incl. landmark conversion)")
+    print(f"one hand per call:          {t_classify / n * 1e6:8.2f} us/hand (classify only)")
+    print(f"two hands per call:         {t_pair / n * 1e6:8.2f} us/hand")
+    print(f"numpy, two hands per call:  {t_numpy_pair / n * 1e6:8.2f} us/hand")
+    print(f"numpy, whole batch:         {t_batch / n * 1e6:8.2f} us/hand")
+    print(f"mismatches:                 {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
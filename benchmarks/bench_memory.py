@@ -0,0 +1,102 @@
+# Memory churn of the frame path: allocating copies vs. reusable buffers
+# ---------------------------------------------------------------------
+# Measures, per frame and in steady state (after --warmup frames), how much memory the frame path
+# allocates on top of what it holds between frames (tracemalloc peak above the baseline; OpenCV and
+# numpy images are traced, MediaPipe's internal buffers are not) and the time per frame, for
+#
+#   capture     reading a frame into a new array vs. into a preallocated FrameRing slot
+#   detection   the former HandPipeline.detect (resize, flip and RGB copies per frame) vs. the current
+#               one (BufferPool buffers, landmarks mirrored instead of pixels), MediaPipe included
+#   video feed  the former FrameBroadcaster.encode (flipped copy, JPEG copied twice) vs. the current
+#               one (BufferPool buffers, JPEG copied once into the chunk)
+#
+# and the allocation rate this is at --fps frames per second.
+#
+#   python benchmarks/bench_memory.py --resolution 1920x1080 --frames 60
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from camera import FrameRing, SyntheticSource
+from pipeline import HandPipeline
+from streaming import FrameBroadcaster
+
+
+# copying_detect / copying_encode:
+# The frame path before the buffer pool, kept here as the reference.
+def copying_detect(pipeline, frame, scale):
+    if scale < 1.0:
+        frame = cv2.resize(frame, (int(frame.shape[1] * scale), int(frame.shape[0] * scale)),
+                           interpolation=cv2.INTER_AREA)
+    image = cv2.cvtColor(cv2.flip(frame, 1), cv2.COLOR_BGR2RGB)
+    image.flags.writeable = False
+    return pipeline.hands.process(image)
+
+
+def copying_encode(frame, quality):
+    frame = cv2.flip(frame, 1)
+    ret, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
+
+
+# measure:
+# (bytes allocated above the baseline per frame, seconds per frame) of function(frame) in steady state.
+def measure(function, frames, warmup):
+    for frame in frames[:warmup]:
+        function(frame)
+    peaks = []
+    t = time.perf_counter()
+    for frame in frames[warmup:]:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = function(frame)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        del result
+    seconds = (time.perf_counter() - t) / max(len(frames) - warmup, 1)
+    return sum(peaks) / max(len(peaks), 1), seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory churn of the frame path')
+    parser.add_argument('--resolution', default='1920x1080')
+    parser.add_argument('--frames', type=int, default=60)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--scale', type=float, default=1.0, help='detection input scale')
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--fps', type=int, default=30)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.resolution.split('x'))
+    source = SyntheticSource(width, height, fps=None)
+    frames = [source.read()[1] for _ in range(args.frames)]
+    ring = FrameRing(4, frames[0].shape)
+    pipeline = HandPipeline()
+    broadcaster = FrameBroadcaster(None, quality=args.quality)
+
+    tracemalloc.start()
+    rows = [
+        ('capture', 'new array', measure(lambda f: source.read()[1], frames, args.warmup)),
+        ('capture', 'ring slot', measure(lambda f: source.read(ring.write_slot())[1], frames, args.warmup)),
+        ('detection', 'copies', measure(lambda f: copying_detect(pipeline, f, args.scale), frames, args.warmup)),
+        ('detection', 'buffers', measure(lambda f: pipeline.detect(f, args.scale), frames, args.warmup)),
+        ('video feed', 'copies', measure(lambda f: copying_encode(f, args.quality), frames, args.warmup)),
+        ('video feed', 'buffers', measure(broadcaster.encode, frames, args.warmup)),
+    ]
+    tracemalloc.stop()
+
+    print(f"{width}x{height}, frame {frames[0].nbytes / 1e6:.1f} MB")
+    print(f"{'stage':12s} {'path':10s} {'KB/frame':>10s} {'MB/s @' + str(args.fps):>10s} {'ms/frame':>9s}")
+    for stage, path, (allocated, seconds) in rows:
+        print(f"{stage:12s} {path:10s} {allocated / 1e3:10.1f} {allocated * args.fps / 1e6:10.1f} "
+              f"{seconds * 1000:9.2f}")
+    print(f"\nbuffer pool allocations: detection {pipeline.buffers.allocations}, "
+          f"video feed {broadcaster.buffers.allocations}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+# Pinch control: frame-count steps vs. the pinch engine
+# ----------------------------------------------------
+# A pinching hand moves its index tip 0.1 of the frame up within a third of a second, holds it there and
+# lets go after --hold seconds, at several camera frame rates. Compares the pinch control before the
+# PinchEngine (a volume step of level/50 whenever the level was stable for 5 frames, simulated here as
+# the reference) with Controller + PinchEngine driving the volume and scrolling:
+#
+#   changes/s   output changes per second while the pinch is held
+#   gap ms      mean and largest time between two changes (smoothness)
+#   total       volume change or scroll amount in the end, including the glide after letting go
+#
+# The reference only depends on the frame rate, the engine should not.
+#
+#   python benchmarks/bench_pinch.py --fps 10,30,60 --hold 2
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gesture_detection import Controller, Gest
+from input_dispatch import InputDispatcher, RecordingBackend
+
+
+# RecordingVolume class:
+# Stands in for the VolumeController and records every change with its time.
+class RecordingVolume:
+
+    def __init__(self):
+        self.calls = []
+
+    def change(self, delta):
+        self.calls.append((time.monotonic(), delta))
+
+    def stop(self):
+        pass
+
+
+def hand(lift):
+    landmark = [SimpleNamespace(x=0.5, y=0.5, z=0.0) for _ in range(21)]
+    landmark[8] = SimpleNamespace(x=0.5, y=0.5 - lift, z=0.0)
+    return SimpleNamespace(landmark=landmark)
+
+
+def lift_at(t):
+    return 0.1 * min(t / 0.33, 1.0)
+
+
+# frame_count_steps:
+# The former pinch_control for the volume, in frame time: (times, changes).
+def frame_count_steps(fps, hold, threshold=0.3):
+    times, changes = [], []
+    prev, count = 0.0, 0
+    for i in range(int(hold * fps)):
+        t = i / fps
+        if count == 5:
+            count = 0
+            times.append(t)
+            changes.append(prev / 50.0)
+        level = round(lift_at(t) * 10, 1)
+        if abs(level) > threshold:
+            if abs(prev - level) < threshold:
+                count += 1
+            else:
+                prev, count = level, 0
+    return times, changes
+
+
+# engine:
+# Drives a Controller with the pinch engine in real time: (times, changes) of the volume or scroll.
+def engine(fps, hold, gesture):
+    backend = RecordingBackend()
+    volume = RecordingVolume()
+    controller = Controller(InputDispatcher(backend, move_duration=0), volume)
+    start = time.monotonic()
+    for i in range(int(hold * fps)):
+        controller.dispatcher.begin_frame(time.monotonic())
+        controller.handle_controls(gesture, hand(lift_at(i / fps)))
+        time.sleep(max(0.0, start + (i + 1) / fps - time.monotonic()))
+    controller.handle_controls(Gest.PALM, hand(0.0))
+    time.sleep(1.5)
+    controller.stop()
+    controller.dispatcher.flush()
+    controller.dispatcher.stop()
+    if gesture == Gest.PINCH_MAJOR:
+        calls = volume.calls
+    else:
+        calls = [(t, args[0]) for t, name, args in backend.calls if name == 'scroll']
+    return [t - start for t, _ in calls], [amount for _, amount in calls]
+
+
+def row(name, fps, hold, times, changes):
+    times = np.array(times)
+    held = times[times < hold]
+    gaps = np.diff(held) * 1000 if len(held) > 1 else np.array([np.nan])
+    print(f"{name:22s} {fps:4d} {len(held) / hold:10.1f} {np.mean(gaps):8.1f} {np.max(gaps):8.1f} "
+          f"{sum(changes):10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Frame-count pinch steps vs. the pinch engine')
+    parser.add_argument('--fps', default='10,30,60', help='camera frame rates')
+    parser.add_argument('--hold', type=float, default=2.0, help='seconds the pinch is held')
+    args = parser.parse_args()
+
+    print(f"{'control':22s} {'fps':>4s} {'changes/s':>10s} {'gap ms':>8s} {'max gap':>8s} {'total':>10s}")
+    for fps in (int(f) for f in args.fps.split(',')):
+        row('volume, frame count', fps, args.hold, *frame_count_steps(fps, args.hold))
+        row('volume, pinch engine', fps, args.hold, *engine(fps, args.hold, Gest.PINCH_MAJOR))
+        row('scroll, pinch engine', fps, args.hold, *engine(fps, args.hold, Gest.PINCH_MINOR))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+# Benchmark suite of the gesture pipeline
+# ---------------------------------------
+# Measures every stage of a frame's way through the pipeline on recorded or synthetic frames:
+#
+#   capture         source.read()
+#   convert         cvtColor to RGB, as timed by HandPipeline.detect
+#   detect          the rest of HandPipeline.detect (hands.process and mirroring the results)
+#   classify_hands  GestureController.classify_hands (hand tracking + HandRecog.update_hand_result)
+#   hand_recog      HandRecog.set_finger_states + get_gesture
+#   controls        Controller.handle_hands (with recording outputs)
+#   encode          flip + JPEG encoding of the video feed
+#
+# for a set of resolutions and hand counts, and reports p50/p95/p99 per stage, the frame rate and the
+# resident memory. Synthetic frames contain no hands, so unless the source shows real hands the
+# gesture stages are fed synthetic detection results with the requested number of hands (or the
+# records of a landmark trace). Results can be saved as a baseline and later runs compared to it.
+# Micro-benchmarks of the pure-Python parts (HandRecog, Controller.get_position, read_mappings) are
+# run with --micro.
+#
+#   python benchmarks/bench_pipeline.py --resolutions 320x240,640x480,1280x720 --hands 0,1,2
+#   python benchmarks/bench_pipeline.py --save baseline.json
+#   python benchmarks/bench_pipeline.py --compare baseline.json
+#   python benchmarks/bench_pipeline.py --source session.mp4 --trace session.jsonl --micro
+import argparse
+import json
+import os
+import sys
+import time
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cv2
+from camera import open_source
+from gesture_detection import GestureController, HandRecog, HLabel
+from pipeline import HandPipeline
+from streaming import FrameBroadcaster
+from traces import read_trace, results_from_record
+from replay import offline_controller
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+STAGES = ['capture', 'convert', 'detect', 'classify_hands', 'hand_recog', 'controls', 'encode']
+
+
+# rss_mb:
+# Peak resident set size of this process in MB (None where the resource module is unavailable).
+def rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024.0 if sys.platform != 'darwin' else peak / (1024.0 * 1024.0)
+
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000.0
+    return {'p50': float(np.percentile(ms, 50)), 'p95': float(np.percentile(ms, 95)),
+            'p99': float(np.percentile(ms, 99)), 'mean': float(ms.mean())}
+
+
+# synthetic_results:
+# Detection results with 'hands' random but plausible hands (an open palm with jitter), alternating
+# the handedness labels.
+def synthetic_results(hands, n, seed=0):
+    rng = np.random.default_rng(seed)
+    palm = np.array([[0.5, 0.9, 0.0]] + [[0.3 + 0.1 * (i // 4), 0.8 - 0.1 * (i % 4 + 1), -0.02] for i in range(20)])
+    records = []
+    for _ in range(n):
+        hand_list = []
+        for h in range(hands):
+            landmarks = palm + [0.3 * h - 0.15, 0.0, 0.0] + rng.normal(0.0, 0.01, palm.shape)
+            hand_list.append({'label': 'Right' if h % 2 == 0 else 'Left', 'score': 0.95,
+                              'landmarks': landmarks.astype(np.float32).tolist()})
+        records.append(results_from_record({'hands': hand_list}))
+    return records
+
+
+# run_case:
+# Processes 'frames' frames of one resolution/hand count combination and returns the per-stage
+# percentiles, the frame rate and the memory use.
+def run_case(source_spec, resolution, frames, gesture_results, quality, controller):
+    spec = source_spec or f'synthetic:{resolution[0]}x{resolution[1]}'
+    source = open_source(spec, realtime=False)
+    pipeline = HandPipeline()
+    encoder = FrameBroadcaster(None, quality=quality, max_fps=None)
+    gc = GestureController(pipeline=pipeline, controller=controller)
+    samples = {stage: [] for stage in STAGES}
+    errors = 0
+
+    start = time.perf_counter()
+    for i in range(frames):
+        t0 = time.perf_counter()
+        success, frame = source.read()
+        if not success:
+            break
+        if source_spec and (frame.shape[1], frame.shape[0]) != resolution:
+            frame = cv2.resize(frame, resolution)
+        t1 = time.perf_counter()
+        pipeline.timer.last.clear()
+        results = pipeline.detect(frame)
+        t2 = time.perf_counter()
+        convert = pipeline.timer.last.get('convert', 0.0) / 1000.0
+        samples['capture'].append(t1 - t0)
+        samples['convert'].append(convert)
+        samples['detect'].append(t2 - t1 - convert)
+
+        if not results.multi_hand_landmarks and gesture_results:
+            results = gesture_results[i % len(gesture_results)]
+        if results.multi_hand_landmarks:
+            t4 = time.perf_counter()
+            gc.classify_hands(results)
+            t5 = time.perf_counter()
+            handmajor, handminor = gc.handmajor, gc.handminor
+            HandRecog.set_finger_states([handmajor, handminor])
+            gestures = {hand.hand_label: (hand.get_gesture(), hand.hand_result)
+                        for hand in (handmajor, handminor) if hand.hand_result is not None}
+            t6 = time.perf_counter()
+            try:
+                controller.handle_hands(gestures)
+            except Exception:
+                errors += 1
+            t7 = time.perf_counter()
+            samples['classify_hands'].append(t5 - t4)
+            samples['hand_recog'].append(t6 - t5)
+            samples['controls'].append(t7 - t6)
+
+        t8 = time.perf_counter()
+        encoder.encode(frame)
+        samples['encode'].append(time.perf_counter() - t8)
+    elapsed = time.perf_counter() - start
+    processed = len(samples['capture'])
+    pipeline.close()
+    source.release()
+
+    return {'frames': processed, 'fps': processed / max(elapsed, 1e-9), 'rss_mb': rss_mb(), 'errors': errors,
+            'stages': {stage: percentiles(s) for stage, s in samples.items() if s}}
+
+
+# micro_benchmarks:
+# Per-call cost of the pure-Python parts, in microseconds.
+def micro_benchmarks(controller, number=2000):
+    results = synthetic_results(2, 1)[0]
+    pipeline = HandPipeline()
+    gc = GestureController(pipeline=pipeline, controller=controller)
+    gc.classify_hands(results)
+    hand = HandRecog(HLabel.MAJOR)
+    hand_result = gc.hr_major
+
+    def hand_recog():
+        hand.update_hand_result(hand_result)
+        hand.set_finger_state()
+        hand.get_gesture()
+
+    def get_position():
+        controller.get_position(hand_result)
+
+    controller.mappings.reload()
+    timings = {
+        'HandRecog (update + finger state + gesture)': hand_recog,
+        'Controller.get_position': get_position,
+        'Controller.read_mappings (cached)': controller.read_mappings,
+        'MappingRegistry.reload (parse file)': controller.mappings.reload,
+        'GestureController.classify_hands': lambda: gc.classify_hands(results),
+    }
+    micro = {name: timeit.timeit(fn, number=number) / number * 1e6 for name, fn in timings.items()}
+    pipeline.close()
+    return micro
+
+
+def print_case(name, case, baseline=None, threshold=0.1):
+    regressions = []
+    rss = f"{case['rss_mb']:.0f} MB" if case['rss_mb'] is not None else 'n/a'
+    print(f"{name}: {case['fps']:.1f} fps over {case['frames']} frames, peak RSS {rss}"
+          + (f", {case['errors']} controller errors" if case['errors'] else ''))
+    for stage, p in case['stages'].items():
+        line = f"  {stage:15s} p50 {p['p50']:8.3f} ms  p95 {p['p95']:8.3f} ms  p99 {p['p99']:8.3f} ms"
+        base = baseline['stages'].get(stage) if baseline else None
+        if base:
+            change = p['p50'] / base['p50'] - 1.0 if base['p50'] > 0 else 0.0
+            line += f"   p50 {change:+7.1%} vs baseline"
+            if change > threshold and p['p50'] - base['p50'] > 0.01:
+                line += '  REGRESSION'
+                regressions.append((name, stage))
+        print(line)
+    if baseline:
+        print(f"  fps {case['fps'] / baseline['fps'] - 1.0:+.1%} vs baseline ({baseline['fps']:.1f} fps)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark suite of the gesture pipeline')
+    parser.add_argument('--source', default=None, help='video file or image directory (default: synthetic frames)')
+    parser.add_argument('--trace', default=None, help='landmark trace feeding the gesture stages')
+    parser.add_argument('--resolutions', default='640x480')
+    parser.add_argument('--hands', default='1', help='comma separated synthetic hand counts')
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--micro', action='store_true', help='also run the micro-benchmarks')
+    parser.add_argument('--save', default=None, help='store the results as a baseline JSON file')
+    parser.add_argument('--compare', default=None, help='compare against a baseline JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1, help='p50 slowdown reported as regression')
+    args = parser.parse_args()
+
+    controller = offline_controller()[0]
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report = {'cases': {}, 'micro': {}}
+    regressions = []
+    resolutions = [tuple(int(v) for v in r.split('x')) for r in args.resolutions.split(',')]
+    for resolution in resolutions:
+        for hands in [int(h) for h in args.hands.split(',')]:
+            if args.trace:
+                gesture_results, name = [results_from_record(r) for r in read_trace(args.trace)], 'trace'
+            else:
+                gesture_results, name = synthetic_results(hands, 64), f'{hands} hands'
+            name = f"{resolution[0]}x{resolution[1]} {name}"
+            case = run_case(args.source, resolution, args.frames, gesture_results, args.quality, controller)
+            report['cases'][name] = case
+            base = baseline['cases'].get(name) if baseline else None
+            regressions += print_case(name, case, base, args.threshold)
+            if args.trace:
+                break
+
+    if args.micro:
+        report['micro'] = micro_benchmarks(controller)
+        print("micro-benchmarks:")
+        for name, us in report['micro'].items():
+            line = f"  {name:45s} {us:9.2f} us/call"
+            if baseline and name in baseline.get('micro', {}):
+                line += f"   {us / baseline['micro'][name] - 1.0:+7.1%} vs baseline"
+            print(line)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline written to {args.save}")
+    if regressions:
+        print(f"{len(regressions)} stage(s) slower than baseline by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
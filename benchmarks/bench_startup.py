@@ -0,0 +1,93 @@
+# Startup time: cold import and time to the first processed frame
+# ----------------------------------------------------------------
+# Every measurement runs in a fresh interpreter, so nothing is cached in the process:
+#
+#   import            'import app': the time, whether mediapipe, pyautogui or pycaw were loaded and
+#                     whether a camera was opened by it
+#   first frame       import, then --delay seconds until /start_gesture_detection is requested (the
+#                     time between starting the server and the first click), then until the first frame
+#                     was processed; with and without the background warm-up of create_app()
+#
+# For reference, the cost of 'import mediapipe' alone is what importing the app used to include.
+#
+#   python benchmarks/bench_startup.py --runs 3
+#   python benchmarks/bench_startup.py --source 0
+import argparse
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT = """
+import json, sys, time
+t = time.perf_counter()
+import app
+seconds = time.perf_counter() - t
+print(json.dumps({'seconds': seconds, 'modules': [m for m in ('mediapipe', 'pyautogui', 'pycaw') if m in sys.modules],
+                  'camera_open': app.default_session.camera.is_running()}))
+"""
+
+MEDIAPIPE = """
+import json, time
+t = time.perf_counter()
+import mediapipe
+print(json.dumps({'seconds': time.perf_counter() - t}))
+"""
+
+FIRST_FRAME = """
+import json, sys, time
+t = time.perf_counter()
+import app
+imported = time.perf_counter() - t
+app.create_app(warm_up=%(warm_up)s)
+time.sleep(%(delay)s)
+session = app.default_session
+client = app.app.test_client()
+t = time.perf_counter()
+client.get('/start_gesture_detection')
+started = time.perf_counter() - t
+while session.metrics.counters['frames_processed'] < 1:
+    time.sleep(0.001)
+first_frame = time.perf_counter() - t
+session.stop()
+print(json.dumps({'import': imported, 'start': started, 'first_frame': first_frame}))
+"""
+
+
+def run(code, source):
+    env = dict(os.environ, GESTURE_CAMERA_SOURCE=source)
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True)
+    lines = [line for line in out.stdout.splitlines() if line.startswith('{')]
+    if out.returncode != 0 and not lines:
+        raise RuntimeError(out.stderr[-2000:])
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold import and time to the first processed frame')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--source', default='synthetic:640x480', help='camera source (see camera.open_source)')
+    parser.add_argument('--delay', type=float, default=3.0, help='seconds from startup to the first request')
+    args = parser.parse_args()
+
+    imports = [run(IMPORT, args.source) for _ in range(args.runs)]
+    mediapipe = [run(MEDIAPIPE, args.source)['seconds'] for _ in range(args.runs)]
+    print(f"import app        {np.median([r['seconds'] for r in imports]) * 1000:8.1f} ms   "
+          f"heavy modules loaded: {', '.join(imports[0]['modules']) or 'none'}, "
+          f"camera opened: {'yes' if imports[0]['camera_open'] else 'no'}")
+    print(f"import mediapipe  {np.median(mediapipe) * 1000:8.1f} ms   (no longer paid on import)")
+
+    print(f"\n{'first frame':18s} {'start request ms':>17s} {'first frame ms':>15s}")
+    for warm_up in (False, True):
+        results = [run(FIRST_FRAME % {'warm_up': warm_up, 'delay': args.delay}, args.source)
+                   for _ in range(args.runs)]
+        name = 'with warm-up' if warm_up else 'without warm-up'
+        print(f"{name:18s} {np.median([r['start'] for r in results]) * 1000:17.1f} "
+              f"{np.median([r['first_frame'] for r in results]) * 1000:15.1f}")
+
+
+if __name__ == '__main__':
+    main()
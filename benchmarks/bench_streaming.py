@@ -0,0 +1,94 @@
+# Video feed vs. landmark stream per viewer
+# -----------------------------------------
+# Compares what a viewer costs on the /video_feed (annotate + JPEG encode, multipart chunk) and on the
+# /landmarks stream (record pack + base64, Server-Sent Event): server CPU per frame and bytes per
+# frame, and the bandwidth at --fps. Frames come from a video source or are synthetic frames with
+# sensor noise added (noise-free synthetic frames compress unrealistically well); the landmarks are
+# the records of a trace or random hands.
+#
+#   python benchmarks/bench_streaming.py --resolutions 320x240,640x480,1280x720 --hands 2
+#   python benchmarks/bench_streaming.py --source session.mp4 --trace session.jsonl
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from camera import SyntheticSource, open_source
+from streaming import FrameBroadcaster, LandmarkStream
+from traces import read_trace
+
+
+def frames_from(source, count, noise, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    while len(frames) < count:
+        ok, frame = source.read()
+        if not ok:
+            break
+        if noise:
+            frame = np.clip(frame + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8)
+        frames.append(frame)
+    return frames
+
+
+def hands_from(trace, count, hands, seed=0):
+    if trace:
+        records = [[(i + 1, 1 - i % 2, hand['label'], np.array(hand['landmarks'], np.float32))
+                    for i, hand in enumerate(record['hands'])] for record in read_trace(trace)]
+        return (records * (count // max(len(records), 1) + 1))[:count]
+    rng = np.random.default_rng(seed)
+    return [[(i + 1, 1 - i % 2, 'Right' if i % 2 == 0 else 'Left', rng.uniform(0, 1, (21, 3)).astype(np.float32))
+             for i in range(hands)] for _ in range(count)]
+
+
+def per_frame(function, items):
+    sizes = []
+    t = time.perf_counter()
+    for item in items:
+        sizes.append(len(function(item)))
+    return (time.perf_counter() - t) / len(items), float(np.mean(sizes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Video feed vs. landmark stream per viewer')
+    parser.add_argument('--resolutions', default='320x240,640x480,1280x720')
+    parser.add_argument('--source', help='video file or image directory instead of synthetic frames')
+    parser.add_argument('--trace', help='landmark trace instead of random hands')
+    parser.add_argument('--hands', type=int, default=2)
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--noise', type=float, default=6.0, help='sensor noise added to the frames (std)')
+    args = parser.parse_args()
+
+    hands = hands_from(args.trace, args.frames, args.hands)
+    stream = LandmarkStream()
+    stream.subscribers = 1
+
+    def landmark_event(record):
+        stream.publish(time.monotonic(), 8, record)
+        return stream._event
+
+    cpu, size = per_frame(landmark_event, hands)
+    rows = [('landmarks', cpu, size)]
+    resolutions = [None] if args.source else [tuple(map(int, r.split('x'))) for r in args.resolutions.split(',')]
+    for resolution in resolutions:
+        if args.source:
+            source, noise = open_source(args.source, realtime=False), 0
+        else:
+            source, noise = SyntheticSource(resolution[0], resolution[1], fps=None), args.noise
+        frames = frames_from(source, args.frames, noise)
+        broadcaster = FrameBroadcaster(None, quality=args.quality)
+        cpu, size = per_frame(broadcaster.encode, frames)
+        height, width = frames[0].shape[:2]
+        rows.append((f'video {width}x{height}', cpu, size))
+
+    print(f"{'stream':20s} {'cpu ms/frame':>13s} {'bytes/frame':>12s} {'Mbit/s @' + str(args.fps):>12s}")
+    for name, cpu, size in rows:
+        print(f"{name:20s} {cpu * 1000:13.3f} {size:12.0f} {size * 8 * args.fps / 1e6:12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# Gesture debouncing: frame-count debounce vs. confidence-weighted voting
+# ------------------------------------------------------------------------
+# Simulates a user holding a sequence of gestures for random durations while the per-frame classifier
+# misclassifies a fraction (--error) of the frames, with confidences like a learned classifier (lower
+# on the wrong frames). Compares the FrameCountDebounce (same gesture in more than 4 consecutive frames,
+# used for the threshold classifier, which has no confidences) with the GestureVoter, with and without
+# confidences:
+#
+#   latency   frames from a real gesture change until the stable gesture follows
+#   spurious  stable gesture changes to a gesture the user did not make
+#
+# and times TemporalEngine.update (history, voting and dynamic gesture check) per hand and frame. Fails
+# if a decider the TemporalEngine uses (debounce without confidences, voting with classifier
+# confidences) switches spuriously more often than the debounce.
+#
+#   python benchmarks/bench_temporal.py --error 0.1
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from temporal import FrameCountDebounce, GestureVoter, TemporalEngine
+
+GESTURES = [0, 8, 4, 12, 33, 35, 31]
+
+
+# EngineDecider class:
+# The stable gesture of a TemporalEngine fed like the threshold classifier feeds it (no confidences).
+class EngineDecider:
+
+    def __init__(self):
+        self.engine = TemporalEngine()
+        self.landmarks = np.zeros((21, 3), np.float32)
+        self.frame = 0
+
+    def update(self, gesture, confidence=1.0):
+        self.frame += 1
+        return self.engine.update(self.landmarks, self.frame / 30.0, gesture, None)[0]
+
+
+def simulate(frames, error, seed=0):
+    rng = np.random.default_rng(seed)
+    truth = np.empty(frames, int)
+    i, current = 0, 31
+    while i < frames:
+        current = rng.choice([g for g in GESTURES if g != current])
+        hold = int(rng.uniform(15, 60))
+        truth[i:i + hold] = current
+        i += hold
+    wrong = rng.random(frames) < error
+    observed = np.where(wrong, rng.choice(GESTURES, frames), truth)
+    confidence = np.where(wrong, rng.uniform(0.3, 0.7, frames), rng.uniform(0.7, 1.0, frames))
+    return truth, observed, confidence
+
+
+def evaluate(decider, truth, observed, confidence):
+    latencies, spurious = [], 0
+    stable, changed_at = 31, None
+    for i in range(len(truth)):
+        if i and truth[i] != truth[i - 1]:
+            changed_at = i
+        new = decider.update(int(observed[i]), float(confidence[i]))
+        if new != stable:
+            if new == truth[i] and changed_at is not None:
+                latencies.append(i - changed_at)
+                changed_at = None
+            elif new != truth[i]:
+                spurious += 1
+            stable = new
+    return float(np.mean(latencies)) if latencies else float('nan'), spurious
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Frame-count debounce vs. confidence-weighted voting')
+    parser.add_argument('--frames', type=int, default=30000)
+    parser.add_argument('--error', type=float, default=0.1, help='fraction of misclassified frames')
+    args = parser.parse_args()
+
+    truth, observed, confidence = simulate(args.frames, args.error)
+    ones = np.ones_like(confidence)
+    print(f"{'decider':28s} {'latency frames':>15s} {'spurious':>9s}")
+    spurious = {}
+    for name, decider, conf in [('debounce (>4 frames)', FrameCountDebounce(), ones),
+                                ('voting, confidence 1', GestureVoter(), ones),
+                                ('voting, classifier conf.', GestureVoter(), confidence),
+                                ('engine, no confidences', EngineDecider(), ones)]:
+        latency, spurious[name] = evaluate(decider, truth, observed, conf)
+        print(f"{name:28s} {latency:15.2f} {spurious[name]:9d}")
+    for name in ('voting, classifier conf.', 'engine, no confidences'):
+        assert spurious[name] <= spurious['debounce (>4 frames)'], \
+            f'{name} switches spuriously more often than the debounce'
+
+    engine = TemporalEngine()
+    landmarks = np.random.default_rng(0).uniform(0, 1, (1000, 21, 3)).astype(np.float32)
+    t = time.perf_counter()
+    for i in range(len(landmarks)):
+        engine.update(landmarks[i], i / 30.0, int(observed[i]), float(confidence[i]))
+    per_frame = (time.perf_counter() - t) / len(landmarks)
+    print(f"\nTemporalEngine.update: {per_frame * 1e6:.1f} us per hand and frame, "
+          f"{engine.history.landmarks.nbytes + engine.history.stamps.nbytes} bytes of history")
+
+
+if __name__ == '__main__':
+    main()
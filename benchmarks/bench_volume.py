@@ -0,0 +1,59 @@
+# Benchmark of the pinch -> volume path
+# -------------------------------------
+# Drives Controller.handle_system_volume with a synthetic pinching hand whose index tip moves up and
+# down, using the in-memory volume backend, so it runs on any (headless) box. Reports the time the
+# recognition loop spends in the pinch handling per frame and how many volume changes were queued
+# versus how many actually reached the backend.
+#
+#   python benchmarks/bench_volume.py --frames 300 --fps 30
+import argparse
+import math
+import os
+import sys
+import time
+from types import SimpleNamespace
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gesture_detection import Controller
+from volume import MemoryVolumeBackend, VolumeController
+
+
+def pinching_hand(i):
+    lift = 0.15 * math.sin(i / 20.0)
+    landmark = [SimpleNamespace(x=0.5, y=0.5, z=0.0) for _ in range(21)]
+    landmark[8] = SimpleNamespace(x=0.5, y=0.5 - lift, z=0.0)
+    return SimpleNamespace(landmark=landmark)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the pinch -> volume path')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--max-rate', type=int, default=20, help='volume updates per second')
+    args = parser.parse_args()
+
+    backend = MemoryVolumeBackend()
+    controller = Controller(volume=VolumeController(lambda: backend, max_rate=args.max_rate).start())
+
+    loop = []
+    for i in range(args.frames):
+        hand = pinching_hand(i)
+        t = time.perf_counter()
+        controller.handle_system_volume(hand)
+        loop.append(time.perf_counter() - t)
+        time.sleep(max(0.0, 1.0 / args.fps - loop[-1]))
+    controller.stop()
+    controller.volume.flush()
+    controller.volume.stop()
+
+    loop = np.array(loop) * 1e6
+    print(f"frames:                 {args.frames}")
+    print(f"pinch handling:         p50 {np.percentile(loop, 50):8.2f} us   p99 {np.percentile(loop, 99):8.2f} us")
+    print(f"volume changes queued:  {controller.volume.changes}")
+    print(f"backend set_level:      {backend.sets}")
+    print(f"final level:            {backend.level:.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,367 @@
+import glob
+import os
+import threading
+import time
+import cv2
+import numpy as np
+from tracing import TRACER
+
+
+# Frame sources
+# -------------
+# Everything the CameraProducer (or an offline run) can read frames from. A source behaves like a
+# cv2.VideoCapture: isOpened(), read(image=None) -> (success, frame) and release(). A capture device is
+# simply a cv2.VideoCapture; the other sources are defined below and open_source() picks one from a
+# spec string.
+
+# VideoFileSource class:
+# Frames of a video file. With 'realtime' the frames are delivered at the file's frame rate like a
+# camera would, otherwise as fast as they can be decoded. 'loop' restarts the file at the end.
+class VideoFileSource:
+
+    def __init__(self, path, realtime=False, loop=False):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        self.realtime = realtime
+        self.loop = loop
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.period = 1.0 / fps if fps and fps > 0 else 1.0 / 30
+        self._next = None
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self, image=None):
+        if self.realtime:
+            now = time.monotonic()
+            if self._next is None:
+                self._next = now
+            elif self._next > now:
+                time.sleep(self._next - now)
+            self._next = max(self._next + self.period, time.monotonic() - self.period)
+        success, frame = self.cap.read(image)
+        if not success and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success, frame = self.cap.read(image)
+        return success, frame
+
+    def release(self):
+        self.cap.release()
+
+
+# ImageDirSource class:
+# Images of a directory in sorted file name order, optionally paced at 'fps' and looped.
+class ImageDirSource:
+
+    EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+    def __init__(self, path, fps=None, loop=False):
+        self.files = sorted(f for f in glob.glob(os.path.join(path, '*'))
+                            if f.lower().endswith(self.EXTENSIONS))
+        self.period = 1.0 / fps if fps else None
+        self.loop = loop
+        self.index = 0
+        self._next = None
+
+    def isOpened(self):
+        return self.index < len(self.files) or (self.loop and len(self.files) > 0)
+
+    def read(self, image=None):
+        if not self.isOpened():
+            return False, None
+        if self.index >= len(self.files):
+            self.index = 0
+        if self.period:
+            now = time.monotonic()
+            self._next = now if self._next is None else self._next + self.period
+            if self._next > now:
+                time.sleep(self._next - now)
+        frame = cv2.imread(self.files[self.index])
+        self.index += 1
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            frame = image
+        return True, frame
+
+    def release(self):
+        self.index = len(self.files)
+        self.loop = False
+
+
+# SyntheticSource class:
+# Generated frames: a static gradient background with a bright disc moving along a circle. Useful to
+# run the pipeline, benchmarks and the web UI without a camera. 'frames' limits the number of frames
+# (None is endless) and 'fps' paces them (None is as fast as possible).
+class SyntheticSource:
+
+    def __init__(self, width=640, height=480, fps=30, frames=None):
+        self.width = width
+        self.height = height
+        self.period = 1.0 / fps if fps else None
+        self.frames = frames
+        self.count = 0
+        ramp = np.linspace(0, 255, width, dtype=np.float32)
+        self.background = np.empty((height, width, 3), np.uint8)
+        self.background[:] = ramp[None, :, None].astype(np.uint8)
+        self._next = None
+
+    def isOpened(self):
+        return self.frames is None or self.count < self.frames
+
+    def read(self, image=None):
+        if not self.isOpened():
+            return False, None
+        if self.period:
+            now = time.monotonic()
+            self._next = now if self._next is None else self._next + self.period
+            if self._next > now:
+                time.sleep(self._next - now)
+        if image is None or image.shape != self.background.shape:
+            image = np.empty_like(self.background)
+        np.copyto(image, self.background)
+        angle = self.count / 30.0
+        center = (int(self.width * (0.5 + 0.3 * np.cos(angle))), int(self.height * (0.5 + 0.3 * np.sin(angle))))
+        cv2.circle(image, center, max(4, self.height // 12), (255, 255, 255), -1)
+        self.count += 1
+        return True, image
+
+    def release(self):
+        self.frames = self.count
+
+
+# open_source:
+# Creates a frame source from a spec: an int (or digit string) is a capture device index, a directory is
+# an ImageDirSource, 'synthetic' or 'synthetic:WIDTHxHEIGHT' a SyntheticSource and anything else a video
+# file. Objects that already are sources are returned unchanged. 'realtime' paces files like a camera.
+def open_source(spec, realtime=True):
+    if not isinstance(spec, (int, str)):
+        return spec
+    if isinstance(spec, int) or spec.isdigit():
+        return cv2.VideoCapture(int(spec))
+    if spec.startswith('synthetic'):
+        width, height = 640, 480
+        if ':' in spec:
+            width, height = (int(v) for v in spec.split(':', 1)[1].split('x'))
+        return SyntheticSource(width, height, fps=30 if realtime else None)
+    if os.path.isdir(spec):
+        return ImageDirSource(spec, fps=30 if realtime else None)
+    return VideoFileSource(spec, realtime=realtime)
+
+
+# FrameRing class:
+# ----------------
+# Fixed-size ring of preallocated frame buffers with sequence numbers. There is exactly one writer
+# (the capture thread) which fills the slot after the latest one and then publishes it by bumping
+# 'seq'. Readers never take a lock: they read 'seq' and get a read-only view of that slot. A slot is
+# only overwritten after 'size - 1' newer frames have been published, and is_current() tells a
+# reader whether the frame it holds has been recycled in the meantime.
+class FrameRing:
+
+    def __init__(self, size, shape, dtype=np.uint8):
+        self.size = size
+        self.shape = tuple(shape)
+        self.slots = np.empty((size,) + self.shape, dtype)
+        self.seqs = [0] * size
+        self.timestamps = [0.0] * size
+        self.seq = 0
+
+    # write_slot:
+    # Returns the preallocated buffer the next frame should be written into.
+    def write_slot(self):
+        return self.slots[(self.seq + 1) % self.size]
+
+    # publish:
+    # Marks the buffer returned by write_slot() as the latest frame.
+    def publish(self, timestamp):
+        seq = self.seq + 1
+        idx = seq % self.size
+        self.seqs[idx] = seq
+        self.timestamps[idx] = timestamp
+        self.seq = seq
+        return seq
+
+    # latest:
+    # Returns (seq, timestamp, frame) for the newest published frame without copying it. The frame is a
+    # read-only view; seq is 0 and frame is None while nothing has been published yet.
+    def latest(self):
+        seq = self.seq
+        if seq == 0:
+            return 0, 0.0, None
+        idx = seq % self.size
+        frame = self.slots[idx].view()
+        frame.flags.writeable = False
+        return seq, self.timestamps[idx], frame
+
+    def is_current(self, seq):
+        return self.seqs[seq % self.size] == seq
+
+
+# BufferPool class:
+# -----------------
+# Reusable per-frame work buffers (resized, converted, mirrored and mask images) by name, to be passed
+# as 'dst' to OpenCV. get() returns a contiguous array of the requested shape that views a backing
+# buffer, which only grows when a larger shape is requested, so the frame path stops allocating image
+# memory once it has seen its largest frame or crop. A buffer is reused by the next get() of the
+# same name; 'allocations' counts the backing buffers allocated.
+class BufferPool:
+
+    def __init__(self):
+        self.buffers = {}
+        self.views = {}
+        self.allocations = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        view = self.views.get(name)
+        if view is not None and view.shape == shape and view.dtype == dtype:
+            view.flags.writeable = True
+            return view
+        dtype = np.dtype(dtype)
+        nbytes = dtype.itemsize
+        for n in shape:
+            nbytes *= n
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.size < nbytes:
+            buffer = self.buffers[name] = np.empty(nbytes, np.uint8)
+            self.allocations += 1
+        view = self.views[name] = buffer[:nbytes].view(dtype).reshape(shape)
+        return view
+
+
+# CameraProducer class:
+# ---------------------
+# Owns the capture device (or any other frame source, see open_source) and runs the only thread that
+# ever calls read() on it. Frames are read straight into the buffers of a FrameRing, so the gesture
+# pipeline and every /video_feed viewer can share the same frames instead of competing for them.
+class CameraProducer:
+
+    def __init__(self, device=0, ring_size=4):
+        self.device = device
+        self.ring_size = ring_size
+        self.ring = None
+        self.cap = None
+        self.running = False
+        self.dropped = 0
+        self._thread = None
+        self._new_frame = threading.Condition()
+        self._ready = threading.Event()
+
+    @property
+    def width(self):
+        return self.ring.shape[1] if self.ring is not None else None
+
+    @property
+    def height(self):
+        return self.ring.shape[0] if self.ring is not None else None
+
+    # start:
+    # Opens the device on the capture thread and waits (up to 'timeout' seconds) for the first frame,
+    # so that width and height are known when start() returns.
+    def start(self, timeout=5.0):
+        if self._thread is not None:
+            return self
+        self._ready.clear()
+        self.ring = None
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name='camera-producer', daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout)
+        return self
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        with self._new_frame:
+            self._new_frame.notify_all()
+
+    def is_running(self):
+        return self.running
+
+    def _run(self):
+        self.cap = open_source(self.device)
+        try:
+            while self.running and self.cap.isOpened():
+                t = time.perf_counter() if TRACER.enabled else None
+                if self.ring is None:
+                    success, frame = self.cap.read()
+                    if not success:
+                        self.dropped += 1
+                        time.sleep(0.01)
+                        continue
+                    self.ring = FrameRing(self.ring_size, frame.shape, frame.dtype)
+                    np.copyto(self.ring.write_slot(), frame)
+                else:
+                    slot = self.ring.write_slot()
+                    success, frame = self.cap.read(slot)
+                    if not success:
+                        self.dropped += 1
+                        time.sleep(0.01)
+                        continue
+                    if frame.shape != self.ring.shape:
+                        # Resolution changed: start a new ring, readers pick it up on their next call
+                        self.ring = FrameRing(self.ring_size, frame.shape, frame.dtype)
+                        slot = self.ring.write_slot()
+                    if frame.ctypes.data != slot.ctypes.data:
+                        np.copyto(slot, frame)
+                seq = self.ring.publish(time.monotonic())
+                if t is not None:
+                    TRACER.span('capture', t, time.perf_counter(), 'capture', seq)
+                self._ready.set()
+                with self._new_frame:
+                    self._new_frame.notify_all()
+        finally:
+            self.running = False
+            self.cap.release()
+            self._ready.set()
+            with self._new_frame:
+                self._new_frame.notify_all()
+
+    # latest:
+    # Returns (seq, frame) for the newest frame without blocking; frame is None if there is none yet.
+    def latest(self):
+        ring = self.ring
+        if ring is None:
+            return 0, None
+        seq, _, frame = ring.latest()
+        return seq, frame
+
+    # timestamp:
+    # Capture time (time.monotonic()) of frame 'seq', or None if its slot was already reused.
+    def timestamp(self, seq):
+        ring = self.ring
+        if ring is None or not ring.is_current(seq):
+            return None
+        return ring.timestamps[seq % ring.size]
+
+    # fps:
+    # Capture frame rate over the frames currently held in the ring.
+    def fps(self):
+        ring = self.ring
+        if ring is None or ring.seq < 2:
+            return 0.0
+        n = min(ring.seq, ring.size)
+        newest = ring.timestamps[ring.seq % ring.size]
+        oldest = ring.timestamps[(ring.seq - n + 1) % ring.size]
+        return (n - 1) / (newest - oldest) if newest > oldest else 0.0
+
+    # wait_frame:
+    # Blocks until a frame newer than 'after_seq' is available and returns (seq, frame). Returns
+    # (after_seq, None) on timeout or when the producer stopped.
+    def wait_frame(self, after_seq=0, timeout=1.0):
+        seq, frame = self.latest()
+        if seq > after_seq or (frame is not None and seq < after_seq):
+            return seq, frame
+        deadline = time.monotonic() + timeout
+        with self._new_frame:
+            while self.running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._new_frame.wait(remaining)
+                seq, frame = self.latest()
+                if seq != after_seq and frame is not None:
+                    return seq, frame
+        return after_seq, None
@@ -0,0 +1,168 @@
+import math
+import numpy as np
+
+# Cursor filters
+# --------------
+# Smoothing of the cursor target derived from the hand landmarks. Every filter turns the raw screen
+# point of a frame (pixels) and its capture time (seconds) into the cursor target:
+#
+#   dampening  - the original piecewise dampening: small moves are ignored, medium ones scaled by the
+#                distance travelled and large ones amplified (ratio 2.1)
+#   one_euro   - One Euro filter: a low-pass filter whose cutoff frequency rises with the speed, so slow
+#                moves are smoothed strongly and fast ones follow with little lag
+#   kalman     - constant-velocity Kalman filter on (x, y, vx, vy)
+#
+# The state of each filter is a small NumPy vector. Filters that estimate the velocity can predict
+# the target ahead, e.g. by the latency of the pipeline (see CursorEngine).
+
+
+# DampeningFilter class:
+# ----------------------
+# Moves the current cursor position by the hand movement since the previous frame times a ratio that
+# depends on the distance moved: 0 up to 5 px, 0.07 * distance up to 30 px, 2.1 beyond.
+class DampeningFilter:
+
+    def __init__(self):
+        self.prev = None
+        self.output = None
+        self.velocity = np.zeros(2)
+
+    def reset(self):
+        self.prev = None
+        self.output = None
+
+    def update(self, point, t, current=None):
+        point = np.array([int(point[0]), int(point[1])], float)
+        if current is None:
+            current = self.output if self.output is not None else point
+        if self.prev is None:
+            self.prev = point
+        delta = point - self.prev
+        self.prev = point
+
+        distsq = delta[0] ** 2 + delta[1] ** 2
+        if distsq <= 25:
+            ratio = 0
+        elif distsq <= 900:
+            ratio = 0.07 * (distsq ** (1 / 2))
+        else:
+            ratio = 2.1
+        self.output = np.asarray(current, float) + delta * ratio
+        return self.output
+
+
+# OneEuroFilter class:
+# --------------------
+# One Euro filter (Casiez et al.) on the 2D point. The cutoff frequency is 'min_cutoff' Hz plus 'beta'
+# times the smoothed speed in px/s; the speed itself is low-pass filtered at 'd_cutoff' Hz.
+class OneEuroFilter:
+
+    def __init__(self, min_cutoff=1.0, beta=0.01, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.output = None
+        self.velocity = np.zeros(2)
+        self.t = None
+
+    @staticmethod
+    def alpha(cutoff, dt):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def update(self, point, t, current=None):
+        point = np.asarray(point, float)
+        if self.output is None:
+            self.output = point.copy()
+            self.t = t
+            return self.output
+        dt = t - self.t if t > self.t else 1.0 / 30
+        self.t = t
+        velocity = (point - self.output) / dt
+        self.velocity += self.alpha(self.d_cutoff, dt) * (velocity - self.velocity)
+        cutoff = self.min_cutoff + self.beta * math.hypot(self.velocity[0], self.velocity[1])
+        self.output = self.output + self.alpha(cutoff, dt) * (point - self.output)
+        return self.output
+
+
+# KalmanFilter class:
+# -------------------
+# Constant-velocity Kalman filter. 'accel_noise' is the standard deviation of the (white) acceleration
+# in px/s^2, 'measurement_noise' the standard deviation of the measured point in px.
+class KalmanFilter:
+
+    def __init__(self, accel_noise=4000.0, measurement_noise=6.0):
+        self.accel_noise = accel_noise
+        self.measurement_noise = measurement_noise
+        self.H = np.array([[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0]])
+        self.R = np.eye(2) * measurement_noise ** 2
+        self.reset()
+
+    def reset(self):
+        self.state = None
+        self.P = None
+        self.t = None
+        self.output = None
+        self.velocity = np.zeros(2)
+
+    def update(self, point, t, current=None):
+        point = np.asarray(point, float)
+        if self.state is None:
+            self.state = np.array([point[0], point[1], 0.0, 0.0])
+            self.P = np.diag([self.measurement_noise ** 2] * 2 + [1000.0 ** 2] * 2)
+            self.t = t
+        else:
+            dt = t - self.t if t > self.t else 1.0 / 30
+            self.t = t
+            F = np.eye(4)
+            F[0, 2] = F[1, 3] = dt
+            g = np.array([0.5 * dt * dt, 0.5 * dt * dt, dt, dt])
+            Q = np.zeros((4, 4))
+            for i, j in ((0, 0), (0, 2), (2, 0), (2, 2)):
+                Q[i, j] = Q[i + 1, j + 1] = g[i] * g[j]
+            Q *= self.accel_noise ** 2
+            self.state = F @ self.state
+            self.P = F @ self.P @ F.T + Q
+
+            residual = point - self.state[:2]
+            S = self.P[:2, :2] + self.R
+            K = self.P[:, :2] @ np.linalg.inv(S)
+            self.state = self.state + K @ residual
+            self.P = (np.eye(4) - K @ self.H) @ self.P
+        self.output = self.state[:2]
+        self.velocity = self.state[2:]
+        return self.output
+
+
+FILTERS = {'dampening': DampeningFilter, 'one_euro': OneEuroFilter, 'kalman': KalmanFilter}
+
+
+# CursorEngine class:
+# -------------------
+# Holds the selected cursor filter. With 'predict' the filtered target is moved ahead along the
+# estimated velocity by the latency passed to update() (at most 'max_lead' seconds), to make up for the
+# time between capture and the cursor move. Filters without a velocity estimate are not predicted.
+class CursorEngine:
+
+    def __init__(self, name='dampening', predict=False, max_lead=0.1, **options):
+        self.predict = predict
+        self.max_lead = max_lead
+        self.select(name, **options)
+
+    def select(self, name, **options):
+        if name not in FILTERS:
+            raise ValueError(f"Unknown cursor filter {name!r}, expected one of {', '.join(FILTERS)}")
+        self.name = name
+        self.filter = FILTERS[name](**options)
+
+    def reset(self):
+        self.filter.reset()
+
+    def update(self, point, t, current=None, latency=0.0):
+        output = self.filter.update(point, t, current)
+        if self.predict and latency > 0:
+            output = output + self.filter.velocity * min(latency, self.max_lead)
+        return float(output[0]), float(output[1])
@@ -1,21 +1,25 @@
-import cv2
-import mediapipe as mp
-import pyautogui
 import math
 from enum import IntEnum
-from ctypes import cast, POINTER
-from comtypes import CLSCTX_ALL
-from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume
-from google.protobuf.json_format import MessageToDict
-import json
+import os
+import tempfile
+import time
+import threading
+from types import MappingProxyType, SimpleNamespace
 import numpy as np
+from pipeline import HandPipeline
+from landmarks import NUM_LANDMARKS, landmarks_to_array, classify
+from input_dispatch import InputDispatcher
+from volume import VolumeController
+from traces import TraceWriter
+from metrics import Metrics
+from tracker import HandTracker
+from cursor_filters import CursorEngine
+from pinch import PinchEngine
+from temporal import TemporalEngine
+from tracing import TRACER
 
 # import screen_brightness_control as sbcontrol
 
-pyautogui.FAILSAFE = False
-mp_drawing = mp.solutions.drawing_utils
-mp_hands = mp.solutions.hands
-
 # Gesture Encodings 
 class Gest(IntEnum):
     # Binary Encoded
@@ -36,6 +40,19 @@ class Gest(IntEnum):
     PINCH_MAJOR = 35
     PINCH_MINOR = 36
 
+    # Dynamic gestures (see temporal.py)
+    SWIPE_LEFT = 40
+    SWIPE_RIGHT = 41
+    SWIPE_UP = 42
+    SWIPE_DOWN = 43
+    CIRCLE_CW = 44
+    CIRCLE_CCW = 45
+
+GESTURE_NAMES = {gesture.value: gesture.name for gesture in Gest}
+
+# Results without hands, returned for frames skipped while idle
+NO_HANDS = SimpleNamespace(multi_hand_landmarks=None, multi_handedness=None)
+
 # Multi-handedness Labels
 class HLabel(IntEnum):
     MINOR = 0
@@ -43,21 +60,30 @@ class HLabel(IntEnum):
 
 # HandRecog class methods:
 # ------------------------
-# Convert Mediapipe Landmarks to recognizable Gestures. The get_signed_dist, get_dist, and get_dz 
-# are methods that calculate distances between two points in different ways. They use the detected 
-# landmarks' x, y, and z coordinates to find distances, which helps in gesture recognition.
+# Convert Mediapipe Landmarks to recognizable Gestures. The landmarks of a hand are copied once per
+# frame into a (21, 3) array and the finger states and gesture features are computed in one batched
+# NumPy pass (see landmarks.py). Each hand owns a TemporalEngine (see temporal.py) that keeps its
+# recent landmarks and gestures, decides the stable gesture (by confidence-weighted voting, or by the
+# frame-count debounce for classifiers without confidences) and recognizes dynamic gestures (swipes,
+# circles). The get_signed_dist, get_dist, and get_dz methods calculate single distances between two
+# points directly from the detected landmarks' x, y, and z coordinates.
 class HandRecog:
     
     def __init__(self, hand_label):
         self.finger = 0
         self.ori_gesture = Gest.PALM
-        self.prev_gesture = Gest.PALM
-        self.frame_count = 0
+        self.current_gesture = Gest.PALM
+        self.confidence = 1.0
+        self.motion_gesture = None
         self.hand_result = None
         self.hand_label = hand_label
+        self.landmarks = np.zeros((NUM_LANDMARKS, 3), np.float32)
+        self.temporal = TemporalEngine()
     
     def update_hand_result(self, hand_result):
         self.hand_result = hand_result
+        if hand_result is not None:
+            landmarks_to_array(hand_result, self.landmarks)
 
     def get_signed_dist(self, point):
         sign = -1
@@ -77,322 +103,581 @@ class HandRecog:
     def get_dz(self,point):
         return abs(self.hand_result.landmark[point[0]].z - self.hand_result.landmark[point[1]].z)
     
-    # set_finger_state:
-    # This method calculates the finger state (open or closed) based on the distances between
-    # certain landmarks. For each finger, the distance ratio between two sets of landmarks is
-    # calculated, and if the ratio exceeds a threshold, the finger is considered open. The
-    # binary representation of open fingers is stored in the 'self.finger' variable.
-    # ------------
-    # Function to find Gesture Encoding using current finger_state.
-    # Finger_state: 1 if finger is open, else 0
-    def set_finger_state(self):
-        if self.hand_result == None:
+    # set_finger_states:
+    # Computes the finger states and the raw gestures of several hands in a single batched pass. For
+    # each finger the ratio of the signed tip-knuckle and knuckle-wrist distances decides whether it is
+    # open; the binary representation of open fingers is stored in 'finger' and the gesture it encodes
+    # (including PINCH_MAJOR, PINCH_MINOR, V_GEST and TWO_FINGER_CLOSED) in 'current_gesture'. The
+    # gesture of every hand is then fed to its TemporalEngine with the frame's capture time 'stamp',
+    # which updates 'ori_gesture' and sets 'motion_gesture' to the dynamic gesture completed in this
+    # frame, if any. Hands without a result keep their previous state. 'classifier' can replace the
+    # threshold classifier, e.g. with GestureModel.classify (see gesture_model.py); if its owner
+    # reports 'last_confidence', the stable gesture is voted on with it, otherwise debounced.
+    @staticmethod
+    def set_finger_states(hands, classifier=classify, stamp=None):
+        hands = [hand for hand in hands if hand.hand_result is not None]
+        if not hands:
             return
+        if stamp is None:
+            stamp = time.monotonic()
+        if len(hands) == 1:
+            batch = hands[0].landmarks
+        else:
+            batch = np.stack([hand.landmarks for hand in hands])
+        gestures, fingers = classifier(batch, [hand.hand_label == HLabel.MINOR for hand in hands])
+        confidences = getattr(getattr(classifier, '__self__', None), 'last_confidence', None)
+        confidences = [None] * len(hands) if confidences is None else confidences.tolist()
+        for hand, gesture, finger, confidence in zip(hands, gestures.tolist(), fingers.tolist(), confidences):
+            hand.finger = finger
+            hand.current_gesture = gesture
+            hand.confidence = 1.0 if confidence is None else confidence
+            hand.ori_gesture, hand.motion_gesture = hand.temporal.update(hand.landmarks, stamp, gesture, confidence)
 
-        points = [[8,5,0],[12,9,0],[16,13,0],[20,17,0]]
-        self.finger = 0
-        self.finger = self.finger | 0 #thumb
-        for idx,point in enumerate(points):
-            
-            dist = self.get_signed_dist(point[:2])
-            dist2 = self.get_signed_dist(point[1:])
-            
-            try:
-                ratio = round(dist/dist2,1)
-            except:
-                ratio = round(dist/0.01,1)
-
-            self.finger = self.finger << 1
-            if ratio > 0.5 :
-                self.finger = self.finger | 1
+    # set_finger_state:
+    # Finger_state: 1 if finger is open, else 0. Single hand version of set_finger_states.
+    def set_finger_state(self):
+        HandRecog.set_finger_states([self])
     
     # get_gesture:
-    # This method identifies the gesture based on the finger states and some additional
-    # conditions. Depending on the finger states and distances between certain landmarks,
-    # it classifies gestures such as PINCH_MAJOR, PINCH_MINOR, V_GEST, and TWO_FINGER_CLOSED.
-    # The method also handles fluctuations due to noise by maintaining a frame count for
-    # consistent gestures.
+    # This method returns the stable gesture decided by the TemporalEngine in set_finger_state(s),
+    # which smooths out fluctuations due to noise: a new gesture is only reported once it was seen in
+    # more than 4 consecutive frames or, with classifier confidences, once its confidence-weighted
+    # votes over the last frames outweigh those of the previous one.
     def get_gesture(self):
         if self.hand_result == None:
             return Gest.PALM
+        return self.ori_gesture
 
-        current_gesture = Gest.PALM
-        if self.finger in [Gest.LAST3,Gest.LAST4] and self.get_dist([8,4]) < 0.05:
-            if self.hand_label == HLabel.MINOR :
-                current_gesture = Gest.PINCH_MINOR
-            else:
-                current_gesture = Gest.PINCH_MAJOR
-
-        elif Gest.FIRST2 == self.finger :
-            point = [[8,12],[5,9]]
-            dist1 = self.get_dist(point[0])
-            dist2 = self.get_dist(point[1])
-            ratio = dist1/dist2
-            if ratio > 1.7:
-                current_gesture = Gest.V_GEST
+
+
+# Output an action drives; two hands whose actions drive the same output conflict. Other actions are a
+# group of their own.
+ACTION_GROUPS = {
+    'move_mouse': 'cursor', 'handle_drag': 'cursor', 'handle_left_click': 'cursor',
+    'handle_right_click': 'cursor', 'handle_double_click': 'cursor',
+    'handle_scroll': 'scroll', 'scroll_up': 'scroll', 'scroll_down': 'scroll', 'scroll_left': 'scroll',
+    'scroll_right': 'scroll',
+    'handle_system_volume': 'volume',
+}
+
+# HandRules class:
+# ----------------
+# Which actions the hands may run in the same frame, from the rule lines of the mappings file:
+#
+#   @minor:handle_scroll,handle_system_volume   actions the minor hand runs ('*' every action)
+#   @conflict:cursor=major,scroll=minor         hand that wins when both actions drive that output
+#   @conflict:*=minor                           any two actions conflict (one action per frame)
+#
+# The major hand runs every mapped action. Conflicting actions without a rule go to the major hand.
+# The defaults let the minor hand scroll while the major hand does anything else; '@conflict:*=minor'
+# restores the former single action per frame, in which a scrolling minor hand stops the major hand.
+class HandRules:
+
+    def __init__(self, minor=('handle_scroll',), conflicts=None):
+        self.minor = set(minor) if minor is not None else None
+        self.conflicts = dict(conflicts or {})
+
+    # parse:
+    # Rules from the '@rule:values' lines of a mappings file, other lines are ignored.
+    @staticmethod
+    def parse(lines):
+        rules = HandRules()
+        for line in lines:
+            line = line.strip()
+            if not line.startswith('@'):
+                continue
+            rule, _, value = line[1:].partition(':')
+            values = [v.strip() for v in value.split(',') if v.strip()]
+            if rule == 'minor':
+                rules.minor = None if '*' in values else set(values)
+            elif rule == 'conflict':
+                for v in values:
+                    group, _, hand = v.partition('=')
+                    if hand not in ('major', 'minor'):
+                        print(f"Error: Unknown hand {hand!r} in conflict rule {v!r}.")
+                        continue
+                    rules.conflicts[group] = hand
             else:
-                if self.get_dz([8,12]) < 0.1:
-                    current_gesture =  Gest.TWO_FINGER_CLOSED
-                else:
-                    current_gesture =  Gest.MID
-            
+                print(f"Error: Unknown rule @{rule} in mappings.")
+        return rules
+
+    def allows(self, label, action):
+        return label == HLabel.MAJOR or self.minor is None or action in self.minor
+
+    # resolve:
+    # Removes the losing hand from an {HLabel: action name} dictionary if the two actions conflict.
+    def resolve(self, actions):
+        major, minor = actions.get(HLabel.MAJOR), actions.get(HLabel.MINOR)
+        if major is None or minor is None:
+            return actions
+        group = ACTION_GROUPS.get(major, major)
+        if group == ACTION_GROUPS.get(minor, minor):
+            winner = self.conflicts.get(group, self.conflicts.get('*', 'major'))
+        elif '*' in self.conflicts:
+            winner = self.conflicts['*']
         else:
-            current_gesture =  self.finger
-        
-        if current_gesture == self.prev_gesture:
-            self.frame_count += 1
-        else:
-            self.frame_count = 0
+            return actions
+        del actions[HLabel.MINOR if winner == 'major' else HLabel.MAJOR]
+        return actions
+
+
+# ActionChannel class:
+# --------------------
+# The action state of one hand: the action it ran in the last frame, whether a click is armed ('flag',
+# set by move_mouse), whether it holds the left button for a drag ('grabflag') and its pinch (start
+# point, flags and its own PinchEngine), so that one hand can move the cursor while the other one
+# scrolls or changes the volume.
+class ActionChannel:
+
+    def __init__(self, label, pinch):
+        self.label = label
+        self.action = None
+        self.flag = False
+        self.grabflag = False
+        self.pinchmajorflag = False
+        self.pinchminorflag = False
+        self.pinchstartxcoord = None
+        self.pinchstartycoord = None
+        self.pinch = pinch
+
+
+
+# MappingSnapshot class:
+# ----------------------
+# One loaded version of a mappings file: the {gesture name: action name} 'names', the dispatch 'table'
+# and the 'rules'. Never changed once built; the dictionaries are read-only views.
+class MappingSnapshot:
+    __slots__ = ('names', 'table', 'rules')
+
+    def __init__(self, names=None, table=None, rules=None):
+        self.names = MappingProxyType(dict(names or {}))
+        self.table = MappingProxyType(dict(table or {}))
+        self.rules = rules if rules is not None else HandRules()
+
+    # lookup:
+    # Returns the bound action method for a gesture (Gest member or name), or None if it is not mapped.
+    def lookup(self, gesture):
+        if isinstance(gesture, str):
+            gesture = Gest.__members__.get(gesture)
+        return self.table.get(gesture)
+
+
+# MappingRegistry class:
+# ----------------------
+# Keeps the parsed contents of 'mappings.txt' in memory as a gesture -> bound action method dispatch
+# table, and its rule lines as HandRules. The file is parsed once and parsed again only when its
+# mtime/size changes (checked at most every 'check_interval' seconds) or when a new mapping is written
+# through save(). Names, table and rules of a load form one MappingSnapshot that replaces the previous
+# one with a single reference assignment, so a reader that takes the snapshot once (current()) sees the
+# table and the rules of the same load, never a mix of the old and the new file.
+class MappingRegistry:
+
+    def __init__(self, owner, path='mappings.txt', check_interval=1.0):
+        self.owner = owner
+        self.path = path
+        self.check_interval = check_interval
+        self.snapshot = MappingSnapshot()
+        self.loaded = False
+        self._stamp = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    # parse:
+    # Converts the 'GESTURE:action' lines of a mappings file into a {gesture name: action name} dictionary.
+    # Rule lines ('@...', see HandRules) are skipped, and so are malformed lines, which are appended to
+    # 'bad' if given.
+    @staticmethod
+    def parse(lines, bad=None):
+        mappings = {}
+        for line in lines:
+            if line.strip() and not line.lstrip().startswith('@'):
+                parts = line.strip().split(':')
+                if len(parts) != 2:
+                    if bad is not None:
+                        bad.append(line.strip())
+                    continue
+                gesture, action = parts
+                mappings[gesture] = action
+        return mappings
+
+    # build_table:
+    # Resolves gesture names to Gest members and action names to bound methods of the owner. Gestures
+    # without an action are skipped, unknown names are reported once here instead of on every frame.
+    def build_table(self, mappings):
+        table = {}
+        for gesture, action in mappings.items():
+            if gesture not in Gest.__members__:
+                print(f"Error: Unknown gesture {gesture} in {self.path}.")
+                continue
+            if not action:
+                continue
+            action_method = getattr(self.owner, action, None)
+            if action_method is None:
+                print(f"Error: {action} method not found in {type(self.owner).__name__} class.")
+                continue
+            table[Gest[gesture]] = action_method
+        return table
+
+    # reload:
+    # Parses the mappings file and atomically swaps in the new dispatch table and rules. Malformed lines
+    # (e.g. of a file an editor is still writing) are reported once per change of the file; if there
+    # are any, the previous snapshot stays in use, unless nothing was loaded yet.
+    def reload(self):
+        with self._lock:
+            stamp = self._file_stamp()
+            try:
+                with open(self.path, 'r') as f:
+                    lines = f.readlines()
+            except OSError as e:
+                print(f"Error: Could not read {self.path}: {e}")
+                lines = []
+            bad = []
+            names = self.parse(lines, bad)
+            for line in bad:
+                print(f"Error: Malformed line {line!r} in {self.path}.")
+            if not bad or not self.loaded:
+                self.snapshot = MappingSnapshot(names, self.build_table(names), HandRules.parse(lines))
+                self.loaded = True
+            self._stamp = stamp
+            self._next_check = time.monotonic() + self.check_interval
+
+    # save:
+    # Writes new mapping lines to a temporary file of its own, atomically replaces the mappings file with
+    # it and reloads the dispatch table.
+    def save(self, lines):
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + '.',
+                                        dir=os.path.dirname(os.path.abspath(self.path)))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.writelines(lines)
+            # mkstemp creates the file readable by the owner only; keep the permissions of the original
+            if os.path.exists(self.path):
+                os.chmod(tmp_path, os.stat(self.path).st_mode & 0o777)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.reload()
+
+    def invalidate(self):
+        self._stamp = None
+        self._next_check = 0.0
+
+    # refresh:
+    # Reloads the table if it was invalidated or if the file changed on disk since the last load.
+    def refresh(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        if self._stamp is None or self._file_stamp() != self._stamp:
+            self.reload()
 
-        self.prev_gesture = current_gesture
+    # current:
+    # The up-to-date snapshot, to be used for everything decided from one version of the mappings.
+    def current(self):
+        self.refresh()
+        return self.snapshot
 
-        if self.frame_count > 4 :
-            self.ori_gesture = current_gesture
-        return self.ori_gesture
+    @property
+    def names(self):
+        return self.snapshot.names
+
+    @property
+    def table(self):
+        return self.snapshot.table
+
+    @property
+    def rules(self):
+        return self.snapshot.rules
+
+    # lookup:
+    # Returns the bound action method for a gesture (Gest member or name), or None if it is not mapped.
+    def lookup(self, gesture):
+        return self.current().lookup(gesture)
 
 
 
 # Controller class: Executes commands according to detected gestures
 # --------------------------
+# Mouse events are not sent to the OS directly but handed to an InputDispatcher, which injects them
+# on its own thread (PyAutoGUI by default), so the recognition loop never blocks on the OS. Every
+# session has its own Controller: the gesture state, the output sinks (input dispatcher, volume
+# controller, cursor filter) and the mapping profile are instance attributes, and handle_hands holds
+# the instance lock, so several sessions can run side by side. Each hand acts through its own
+# ActionChannel; the action methods work on the channel of the hand they run for ('channel'). Without
+# 'realtime' (offline replays) the pinch engines run on the frame stamps (see advance()) instead of
+# their own clock.
 class Controller:
-    tx_old = 0
-    ty_old = 0
-    trial = True
-    flag = False
-    grabflag = False
-    pinchmajorflag = False
-    pinchminorflag = False
-    pinchstartxcoord = None
-    pinchstartycoord = None
-    pinchdirectionflag = None
-    prevpinchlv = 0
-    pinchlv = 0
-    framecount = 0
-    prev_hand = None
-    pinch_threshold = 0.3
+
+    def __init__(self, dispatcher=None, volume=None, cursor=None, mappings_path='mappings.txt', realtime=True):
+        self.tx_old = 0
+        self.ty_old = 0
+        self.trial = True
+        self.swipe_scroll = 300
+        self.dispatcher = dispatcher if dispatcher is not None else InputDispatcher()
+        self.unmapped_reported = set()
+        self.volume = volume if volume is not None else VolumeController()
+        self.cursor = cursor if cursor is not None else CursorEngine()
+        self.realtime = realtime
+        self.channels = {label: ActionChannel(label, PinchEngine(self.dispatcher, self.volume, realtime=realtime))
+                         for label in (HLabel.MAJOR, HLabel.MINOR)}
+        self.channel = self.channels[HLabel.MAJOR]
+        self.mappings = MappingRegistry(self, mappings_path)
+        self.lock = threading.RLock()
+
+    # stop:
+    # Stops the pinch engines of the channels.
+    def stop(self):
+        for channel in self.channels.values():
+            channel.pinch.stop()
+
+    # advance:
+    # Offline: runs the pinch engines up to the stamp of the frame just handled.
+    def advance(self, stamp):
+        if not self.realtime:
+            for channel in self.channels.values():
+                channel.pinch.advance(stamp)
+
+    # settle:
+    # Offline: releases the pinches and lets the pinch engines run out (the glide of a scroll).
+    def settle(self):
+        if not self.realtime:
+            for channel in self.channels.values():
+                channel.pinch.settle()
+
+    # pinch_outputs:
+    # Scroll and volume changes emitted by the pinch engines so far.
+    def pinch_outputs(self):
+        return sum(channel.pinch.outputs for channel in self.channels.values())
 
     # getpinchylv and getpinchxlv:
     # These methods calculate the y and x level differences of the pinch gesture by comparing the
-    # coordinates of landmark 8 (tip of the index finger) to the starting coordinates of the pinch.
-    def getpinchylv(hand_result):
-        dist = round((Controller.pinchstartycoord - hand_result.landmark[8].y)*10,1)
+    # coordinates of landmark 8 (tip of the index finger) to the starting coordinates of the pinch,
+    # in tenths of the frame (not rounded, the pinch engine turns them into a continuous speed).
+    def getpinchylv(self, hand_result):
+        dist = (self.channel.pinchstartycoord - hand_result.landmark[8].y)*10
         return dist
 
-    def getpinchxlv(hand_result):
-        dist = round((hand_result.landmark[8].x - Controller.pinchstartxcoord)*10,1)
+    def getpinchxlv(self, hand_result):
+        dist = (hand_result.landmark[8].x - self.channel.pinchstartxcoord)*10
         return dist
-    
-    # changesystemvolume:
-    # This method adjusts the system volume based on the pinch level calculated from the pinch gesture.
-    def changesystemvolume():
-        devices = AudioUtilities.GetSpeakers()
-        interface = devices.Activate(IAudioEndpointVolume._iid_, CLSCTX_ALL, None)
-        volume = cast(interface, POINTER(IAudioEndpointVolume))
-        currentVolumeLv = volume.GetMasterVolumeLevelScalar()
-        currentVolumeLv += Controller.pinchlv/50.0
-        if currentVolumeLv > 1.0:
-            currentVolumeLv = 1.0
-        elif currentVolumeLv < 0.0:
-            currentVolumeLv = 0.0
-        volume.SetMasterVolumeLevelScalar(currentVolumeLv, None)
 
     
     # get_position:
     # This method calculates the cursor position based on the hand_result, specifically landmark 9
-    # (between index finger and thumb). It stabilizes the cursor using dampening techniques by
-    # taking into account the previous cursor position and distance traveled.
-    def get_position(hand_result):
+    # (between index finger and thumb). The screen point of the landmark is smoothed by the selected
+    # cursor filter (see cursor_filters.py; by default the original dampening relative to the previous
+    # cursor target) using the capture time of the frame, and predicted ahead by the time since capture
+    # if the engine is set to. Screen size and cursor target come from the dispatcher's cache instead
+    # of being queried from the OS every frame.
+    def get_position(self, hand_result):
         point = 9
-        position = [hand_result.landmark[point].x ,hand_result.landmark[point].y]
-        sx,sy = pyautogui.size()
-        x_old,y_old = pyautogui.position()
-        x = int(position[0]*sx)
-        y = int(position[1]*sy)
-        if Controller.prev_hand is None:
-            Controller.prev_hand = x,y
-        delta_x = x - Controller.prev_hand[0]
-        delta_y = y - Controller.prev_hand[1]
-
-        distsq = delta_x**2 + delta_y**2
-        ratio = 1
-        Controller.prev_hand = [x,y]
-
-        if distsq <= 25:
-            ratio = 0
-        elif distsq <= 900:
-            ratio = 0.07 * (distsq ** (1/2))
-        else:
-            ratio = 2.1
-        x , y = x_old + delta_x*ratio , y_old + delta_y*ratio
-        return (x,y)
+        sx,sy = self.dispatcher.screen_size()
+        x = hand_result.landmark[point].x*sx
+        y = hand_result.landmark[point].y*sy
+        now = time.monotonic()
+        stamp = self.dispatcher.frame_stamp
+        if stamp is None:
+            stamp = now
+        return self.cursor.update((x, y), stamp, self.dispatcher.position(), now - stamp)
 
     # pinch_control_init:
-    # This method initializes the pinch control by setting starting x and y coordinates, pinch level,
-    # previous pinch level, and frame count.
-    def pinch_control_init(hand_result):
-        Controller.pinchstartxcoord = hand_result.landmark[8].x
-        Controller.pinchstartycoord = hand_result.landmark[8].y
-        Controller.pinchlv = 0
-        Controller.prevpinchlv = 0
-        Controller.framecount = 0
+    # This method initializes the pinch control by setting the starting x and y coordinates of the pinch.
+    def pinch_control_init(self, hand_result):
+        self.channel.pinchstartxcoord = hand_result.landmark[8].x
+        self.channel.pinchstartycoord = hand_result.landmark[8].y
 
-    
     # pinch_control:
-    # This method handles pinch control actions, which can be either vertical or horizontal based on
-    # the detected hand gesture. It maintains a frame count for consistent pinch gestures.
-    def pinch_control(hand_result, controlVertical):
-        if Controller.framecount == 5:
-            Controller.framecount = 0
-            Controller.pinchlv = Controller.prevpinchlv
-            
-            if Controller.pinchdirectionflag == False:
-                controlVertical() #y
-
-        lvx =  Controller.getpinchxlv(hand_result)
-        lvy =  Controller.getpinchylv(hand_result)
-            
-        if abs(lvy) > abs(lvx) and abs(lvy) > Controller.pinch_threshold:
-            Controller.pinchdirectionflag = False
-            if abs(Controller.prevpinchlv - lvy) < Controller.pinch_threshold:
-                Controller.framecount += 1
-            else:
-                Controller.prevpinchlv = lvy
-                Controller.framecount = 0
-
-        elif abs(lvx) > Controller.pinch_threshold:
-            Controller.pinchdirectionflag = True
-            if abs(Controller.prevpinchlv - lvx) < Controller.pinch_threshold:
-                Controller.framecount += 1
-            else:
-                Controller.prevpinchlv = lvx
-                Controller.framecount = 0
-
-    @classmethod
-    def handle_drag(cls, hand_result):
-        x, y = cls.get_position(hand_result)
-        if not cls.grabflag:
-            cls.grabflag = True
-            pyautogui.mouseDown(button="left")
-        pyautogui.moveTo(x, y, duration=0.1)
-
-    @classmethod
-    def handle_left_click(cls, hand_result):
-        if cls.flag:
-            pyautogui.click()
-            cls.flag = False
-
-    @classmethod
-    def handle_right_click(cls, hand_result):
-        if cls.flag:
-            pyautogui.click(button='right')
-            cls.flag = False
-
-    @classmethod
-    def handle_double_click(cls, hand_result):
-        if cls.flag:
-            pyautogui.doubleClick()
-            cls.flag = False
-
-    @classmethod
-    def handle_scroll(cls, hand_result):
-        # Extract the index finger and thumb landmarks
-        thumb_tip = hand_result.landmark[cls.THUMB_TIP]
-        index_tip = hand_result.landmark[cls.INDEX_TIP]
-
-        # Calculate the distance between the thumb and index finger
-        distance = math.sqrt((thumb_tip.x - index_tip.x)**2 + (thumb_tip.y - index_tip.y)**2)
-
-        # Define a threshold for the pinch gesture
-        pinch_threshold = 0.03
-
-        if distance < pinch_threshold:
-            # Calculate the vertical movement of the hand
-            hand_movement = hand_result.landmark[cls.WRIST].y - hand_result.landmark[cls.MIDDLE_TIP].y
-            scroll_amount = int(hand_movement * 500)
-            pyautogui.scroll(scroll_amount)
-
-
-    @classmethod
-    def handle_system_volume(cls, hand_result):
-        if cls.pinchmajorflag == False:
-            cls.pinch_control_init(hand_result)
-            cls.pinchmajorflag = True
-        cls.pinch_control(hand_result, cls.changesystemvolume)
-
-    @classmethod
-    def handle_palm(cls, hand_result):
+    # This method hands the displacement of the pinch since it started to the PinchEngine of the
+    # channel, which turns it into a scroll or volume speed and emits the changes on its own clock.
+    # 'mode' is 'scroll' (vertical and horizontal) or 'volume' (vertical only).
+    def pinch_control(self, hand_result, mode):
+        lvx = self.getpinchxlv(hand_result)
+        lvy = self.getpinchylv(hand_result)
+        self.channel.pinch.update(mode, lvx / 10.0, lvy / 10.0, self.dispatcher.frame_stamp)
+
+    # release:
+    # Ends what the last action of a channel holds (another action or no hand): a pinch (scrolling
+    # glides to a stop, the volume stops) or the left button of a drag.
+    def release(self, channel):
+        channel.action = None
+        if channel.pinchmajorflag or channel.pinchminorflag:
+            channel.pinchmajorflag = False
+            channel.pinchminorflag = False
+            channel.pinch.release()
+        if channel.grabflag:
+            channel.grabflag = False
+            self.dispatcher.mouse_up(button='left')
+
+    # release_all:
+    # Releases the channels of both hands, e.g. when no hand is detected or detection stops.
+    def release_all(self):
+        with self.lock:
+            for channel in self.channels.values():
+                self.release(channel)
+
+    def handle_drag(self, hand_result):
+        x, y = self.get_position(hand_result)
+        if not self.channel.grabflag:
+            self.channel.grabflag = True
+            self.dispatcher.mouse_down(button="left")
+        self.dispatcher.move_to(x, y)
+
+    def handle_left_click(self, hand_result):
+        if self.channel.flag:
+            self.dispatcher.click()
+            self.channel.flag = False
+
+    def handle_right_click(self, hand_result):
+        if self.channel.flag:
+            self.dispatcher.click(button='right')
+            self.channel.flag = False
+
+    def handle_double_click(self, hand_result):
+        if self.channel.flag:
+            self.dispatcher.double_click()
+            self.channel.flag = False
+
+    # handle_scroll / handle_system_volume:
+    # Scroll (vertically or horizontally) or change the volume by moving the hand while pinching,
+    # relative to where the pinch started.
+    def handle_scroll(self, hand_result):
+        if self.channel.pinchminorflag == False:
+            self.pinch_control_init(hand_result)
+            self.channel.pinchminorflag = True
+        self.pinch_control(hand_result, 'scroll')
+
+    def handle_system_volume(self, hand_result):
+        if self.channel.pinchmajorflag == False:
+            self.pinch_control_init(hand_result)
+            self.channel.pinchmajorflag = True
+        self.pinch_control(hand_result, 'volume')
+
+    # scroll_up / scroll_down / scroll_left / scroll_right:
+    # Scroll by one 'swipe_scroll' step, e.g. bound to the swipe gestures.
+    def scroll_up(self, hand_result):
+        self.dispatcher.scroll(self.swipe_scroll)
+
+    def scroll_down(self, hand_result):
+        self.dispatcher.scroll(-self.swipe_scroll)
+
+    def scroll_left(self, hand_result):
+        self.dispatcher.hscroll(-self.swipe_scroll)
+
+    def scroll_right(self, hand_result):
+        self.dispatcher.hscroll(self.swipe_scroll)
+
+    def handle_palm(self, hand_result):
         pass  # Placeholder for "PALM" gesture, you can add the code for the desired action here
 
-    @classmethod
-    def move_mouse(cls, hand_result):
-        cls.flag = True
-        x, y = cls.get_position(hand_result)
-        pyautogui.moveTo(x, y, duration = 0.1)    
+    def move_mouse(self, hand_result):
+        self.channel.flag = True
+        x, y = self.get_position(hand_result)
+        self.dispatcher.move_to(x, y)
 
     # read_mappings: 
-    # This method reads the gesture mappings from a 'mappings.txt' file and converts it to a dictionary.
-    @classmethod
-    def read_mappings(cls):
-        with open('mappings.txt', 'r') as f:
-            lines = f.readlines()
-
-        mappings = {}
-        for line in lines:
-            if line.strip():
-                gesture, action = line.strip().split(':')
-                mappings[gesture] = action
-        return mappings
+    # This method returns the current gesture mappings as a {gesture name: action name} dictionary.
+    # The file is only parsed again by the MappingRegistry when it has changed on disk.
+    def read_mappings(self):
+        self.mappings.refresh()
+        return self.mappings.names.copy()
 
     
     # execute_action:
-    # This method takes a gesture name as input and executes the corresponding action method based on the gesture mappings.
-    @classmethod
-    def execute_action(cls, gesture_name, hand_result):
-        mappings = cls.read_mappings()
-        action_name = mappings.get(gesture_name)
-        
-        if action_name is not None:
-            action_method = getattr(cls, action_name, None)
-            if action_method is not None:
-                action_method(hand_result)
-            else:
-                print(f"Error: {action_name} method not found in Controller class.")
+    # This method takes a gesture name as input and executes the corresponding action method using the
+    # cached dispatch table of the MappingRegistry. An unmapped gesture is reported once, not on every
+    # frame it is held.
+    def execute_action(self, gesture_name, hand_result):
+        action_method = self.action_for(gesture_name)
+        if action_method is not None:
+            action_method(hand_result)
+
+    # action_for:
+    # The action method a gesture (Gest value or name) runs, or None: the pinches always scroll and
+    # change the volume, the other gestures run the action they are mapped to in 'snapshot' (default:
+    # the current mappings).
+    def action_for(self, gesture, snapshot=None):
+        if isinstance(gesture, str):
+            gesture = Gest.__members__.get(gesture, gesture)
+        elif gesture in Gest._value2member_map_:
+            gesture = Gest(gesture)
         else:
-            print(f"Error: Gesture {gesture_name} not found in mappings.")
-    
+            # Finger combinations without a Gest member can not be mapped to an action
+            return None
+        if gesture == Gest.PINCH_MINOR:
+            return self.handle_scroll
+        if gesture == Gest.PINCH_MAJOR:
+            return self.handle_system_volume
+        if snapshot is None:
+            snapshot = self.mappings.current()
+        action_method = snapshot.lookup(gesture)
+        name = getattr(gesture, 'name', gesture)
+        if action_method is None and name not in self.unmapped_reported:
+            self.unmapped_reported.add(name)
+            print(f"Error: Gesture {name} not found in mappings.")
+        return action_method
+
+    # handle_event:
+    # Executes the action mapped to a dynamic gesture (swipe, circle) of hand 'label' once, in the
+    # frame it was completed. Unmapped dynamic gestures are ignored.
+    def handle_event(self, gesture, hand_result, label=HLabel.MAJOR):
+        with self.lock:
+            action_method = self.mappings.lookup(Gest(gesture))
+            if action_method is not None:
+                self.channel = self.channels[label]
+                try:
+                    action_method(hand_result)
+                finally:
+                    self.channel = self.channels[HLabel.MAJOR]
+
+    # handle_hands:
+    # Executes the actions of the hands of one frame. 'hands' maps the HLabel of every present hand to
+    # its (gesture, hand_result). The minor hand only runs the actions the rules of the mappings file
+    # allow it, and if the actions of both hands conflict the rules pick one (see HandRules); otherwise
+    # each action runs on the channel of its hand, independently of the other hand. A channel whose
+    # action changed (or whose hand is gone) first releases what its previous action held. Holds the
+    # controller's lock, so a session can be reconfigured from another thread. The actions and the rules
+    # of a frame come from the same MappingSnapshot. Returns the {HLabel: action name} executed.
+    def handle_hands(self, hands):
+        with self.lock:
+            snapshot = self.mappings.current()
+            methods = {}
+            for label, (gesture, hand_result) in hands.items():
+                action_method = self.action_for(gesture, snapshot)
+                if action_method is not None:
+                    methods[label] = action_method
+            rules = snapshot.rules
+            actions = rules.resolve({label: method.__name__ for label, method in methods.items()
+                                     if rules.allows(label, method.__name__)})
+            try:
+                for label, channel in self.channels.items():
+                    action = actions.get(label)
+                    if action != channel.action:
+                        self.release(channel)
+                        channel.action = action
+                    if action is not None:
+                        self.channel = channel
+                        methods[label](hands[label][1])
+            finally:
+                self.channel = self.channels[HLabel.MAJOR]
+            return actions
+
     # handle_controls:
-    # This method executes different actions based on the detected hand gestures, such as moving the
-    # cursor, clicking, double-clicking, scrolling, and changing system volume. The actions are
-    # performed using the PyAutoGUI library and involve calculations based on hand landmarks.
-     # handle_controls:
-    # This method has been updated to use the execute_action method to execute the appropriate action for a given gesture.
-    @classmethod
-    def handle_controls(cls, gesture, hand_result):
-        if gesture.name is not None:
-             # Check if the binary encoding of the gesture is in the allowed set
-            allowed_encodings = {0, 1, 2, 4, 7, 8, 12, 15, 16, 31, 33, 34, 35, 36}
-            #print(gesture.name)
-            #if gesture.binary_encoding in allowed_encodings:
-            if gesture == Gest.PINCH_MINOR:
-                if cls.pinchminorflag == False:
-                    cls.pinch_control_init(hand_result)
-                    cls.pinchminorflag = True
-                #cls.pinch_control(hand_result, cls.scrollHorizontal, cls.scrollVertical)
-                cls.handle_scroll(hand_result)
-            elif gesture == Gest.PINCH_MAJOR:
-                if cls.pinchmajorflag == False:
-                    cls.pinch_control_init(hand_result)
-                    cls.pinchmajorflag = True
-                cls.pinch_control(hand_result, cls.changesystemvolume)
-            else:
+    # This method executes the action of a single (major) hand's gesture, such as moving the cursor,
+    # clicking, double-clicking, scrolling, and changing system volume (see handle_hands).
+    def handle_controls(self, gesture, hand_result):
+        return self.handle_hands({HLabel.MAJOR: (gesture, hand_result)})
+
+
 
-                gesture_name = gesture.name
-                cls.pinchmajorflag=False
-                cls.pinchminorflag=False
-                cls.execute_action(gesture_name, hand_result)
-            #else:
-              #  print(f"Gesture {gesture.name} with binary encoding {gesture.binary_encoding} is not allowed.")
-      
 '''
 ----------------------------------------  Main Class  ----------------------------------------
     Entry point of Gesture Controller
@@ -401,121 +686,206 @@ class Controller:
 # GestureController class methods:
 # --------------------------------
 class GestureController:
-    gc_mode = 0
-    cap = None
-    CAM_HEIGHT = None
-    CAM_WIDTH = None
-    hr_major = None  # Right Hand by default
-    hr_minor = None  # Left hand by default
-    dom_hand = True
 
     # __init__:
-    # Initializes the GestureController object by setting the mode, capturing video from the default
-    # camera, and retrieving the camera's frame height and width.
-    def __init__(self):
-        GestureController.gc_mode = 1
-        GestureController.cap = cv2.VideoCapture(0)
-        GestureController.CAM_HEIGHT = GestureController.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
-        GestureController.CAM_WIDTH = GestureController.cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+    # Initializes the GestureController object by setting the mode and attaching the shared camera
+    # producer. Frames are taken from the producer's ring buffer, the controller never reads the
+    # capture device itself. The detection pipeline and the HandRecog objects are created once here
+    # and keep their state across frames; 'pipeline_options' are passed on to HandPipeline. For offline
+    # runs the camera can be omitted and another pipeline (e.g. a TracePipeline) passed in. All state is
+    # per instance: every session has its own GestureController and Controller ('controller'). With an
+    # IdleMonitor ('idle') the controller stops running detection while nobody is in front of the camera.
+    # 'classifier' replaces the threshold gesture classifier (see HandRecog.set_finger_states). The
+    # controller records into 'metrics' if given, e.g. Metrics that exist before the session starts.
+    def __init__(self, camera=None, pipeline=None, controller=None, idle=None, classifier=None, metrics=None,
+                 **pipeline_options):
+        self.gc_mode = 1
+        self.camera = camera
+        self.CAM_HEIGHT = None
+        self.CAM_WIDTH = None
+        if camera is not None:
+            self.CAM_HEIGHT = camera.height
+            self.CAM_WIDTH = camera.width
+        self.hr_major = None  # Right Hand by default
+        self.hr_minor = None  # Left hand by default
+        self.dom_hand = True
+        self.controller = controller if controller is not None else Controller()
+        self.pipeline = pipeline if pipeline is not None else HandPipeline(**pipeline_options)
+        self.tracker = HandTracker(lambda: HandRecog(HLabel.MAJOR))
+        self.idle_major = HandRecog(HLabel.MAJOR)
+        self.idle_minor = HandRecog(HLabel.MINOR)
+        self.handmajor = self.idle_major
+        self.handminor = self.idle_minor
+        self.timing_report_every = 300
+        self.recorder = None
+        self.last_gesture = None
+        self.last_actions = {}
+        self.stale_after = 0.1
+        self.landmark_stream = None
+        self.idle = idle
+        self.classifier = classifier if classifier is not None else classify
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.pipeline.timer.metrics = self.metrics
+        if idle is not None:
+            idle.metrics = self.metrics
+        self.controller.dispatcher.latency_observer = lambda latency: self.metrics.observe('action_dispatch', latency)
+
+    # start_recording / stop_recording:
+    # Record the detection results of every processed frame into a landmark trace file (see traces.py).
+    def start_recording(self, path):
+        self.stop_recording()
+        self.recorder = TraceWriter(path)
+
+    def stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
 
     # classify_hands:
-    # This static method classifies the detected hands as left or right, and updates the hr_major and
-    # hr_minor attributes based on the handedness.
-    @staticmethod
-    def classify_hands(results):
-        left, right = None, None
-        try:
-            handedness_dict = MessageToDict(results.multi_handedness[0])
-            if handedness_dict['classification'][0]['label'] == 'Right':
-                right = results.multi_hand_landmarks[0]
-            else:
-                left = results.multi_hand_landmarks[0]
-        except:
-            pass
+    # This method associates the detected hands with the hands tracked in previous frames (see
+    # tracker.py) and decides which one is the major and which the minor hand from their smoothed
+    # handedness. Every tracked hand owns its HandRecog, so a hand keeps its gesture state when MediaPipe
+    # reorders the hands or its label flickers. Sets handmajor/handminor (an idle HandRecog without a
+    # result if that hand is absent) and the hr_major and hr_minor attributes.
+    def classify_hands(self, results):
+        self.tracker.update(results)
+        major, minor = self.tracker.roles(self.dom_hand)
+        self.handmajor = major.state if major is not None else self.idle_major
+        self.handminor = minor.state if minor is not None else self.idle_minor
+        self.handmajor.hand_label = HLabel.MAJOR
+        self.handminor.hand_label = HLabel.MINOR
+        self.handmajor.update_hand_result(major.hand_result if major is not None else None)
+        self.handminor.update_hand_result(minor.hand_result if minor is not None else None)
+        self.hr_major = self.handmajor.hand_result
+        self.hr_minor = self.handminor.hand_result
+
+    # stream_hands:
+    # (track id, role, handedness, landmarks) of the major and minor hand for the landmark stream.
+    def stream_hands(self):
+        hands = []
+        for track in self.tracker.tracks:
+            if track.visible and track.state is self.handmajor:
+                hands.append((track.track_id, HLabel.MAJOR, track.label, track.state.landmarks))
+            elif track.visible and track.state is self.handminor:
+                hands.append((track.track_id, HLabel.MINOR, track.label, track.state.landmarks))
+        return hands
 
-        try:
-            handedness_dict = MessageToDict(results.multi_handedness[1])
-            if handedness_dict['classification'][0]['label'] == 'Right':
-                right = results.multi_hand_landmarks[1]
+    # process_frame:
+    # This method processes one camera frame: it runs the detection pipeline, updates the tracked hands
+    # and classifies both hands in one batched pass, and hands the gestures of both to the handle_hands
+    # method of the Controller class, which runs the action of each hand on its own channel
+    # ('last_actions' are the actions run). 'stamp' is the capture time of the frame,
+    # which action latencies are measured from; a pipeline with frames in flight (ProcessPipeline)
+    # returns the results of an earlier frame, and their own 'stamp' is used for them instead. The hands and the gesture are published to the
+    # landmark stream, if one is attached. While the IdleMonitor is idle the frame only goes through its
+    # motion check and results without hands are returned. The MediaPipe results are returned.
+    def process_frame(self, frame, stamp=None):
+        if stamp is None:
+            stamp = time.monotonic()
+        idle = self.idle if frame is not None else None
+        if idle is not None and idle.idle and not idle.check(frame, stamp):
+            self.metrics.count('frames_idle')
+            return NO_HANDS
+        self.controller.dispatcher.begin_frame(stamp)
+        results = self.pipeline.process(frame, stamp)
+        if idle is not None:
+            idle.update(frame, stamp, bool(results.multi_hand_landmarks))
+        results_stamp = getattr(results, 'stamp', None)
+        if results_stamp is not None and results_stamp != stamp:
+            stamp = results_stamp
+            self.controller.dispatcher.begin_frame(stamp)
+        if self.recorder is not None:
+            self.recorder.write(results, stamp=stamp)
+
+        timer = self.pipeline.timer
+        t = time.perf_counter()
+        self.classify_hands(results)
+        t1 = time.perf_counter()
+        if results.multi_hand_landmarks:
+            HandRecog.set_finger_states([self.handmajor, self.handminor], self.classifier, stamp)
+            hands = {hand.hand_label: (hand.get_gesture(), hand.hand_result)
+                     for hand in (self.handmajor, self.handminor) if hand.hand_result is not None}
+            t2 = time.perf_counter()
+
+            self.last_actions = self.controller.handle_hands(hands)
+            for hand in (self.handmajor, self.handminor):
+                if hand.motion_gesture is not None:
+                    self.controller.handle_event(hand.motion_gesture, hand.hand_result, hand.hand_label)
+                    self.metrics.count_gesture(GESTURE_NAMES[hand.motion_gesture])
+            t3 = time.perf_counter()
+            timer.add('classify_hands', t1 - t, t1)
+            timer.add('hand_recog', t2 - t1, t2)
+            timer.add('controls', t3 - t2, t3)
+            # the gesture reported is the major hand's, unless only the minor hand acted
+            if HLabel.MINOR in self.last_actions and HLabel.MAJOR not in self.last_actions:
+                gest_name = self.handminor.get_gesture()
             else:
-                left = results.multi_hand_landmarks[1]
-        except:
-            pass
-
-        if GestureController.dom_hand == True:
-            GestureController.hr_major = right
-            GestureController.hr_minor = left
+                gest_name = self.handmajor.get_gesture()
+            self.last_gesture = gest_name
+            self.metrics.count_gesture(GESTURE_NAMES.get(gest_name, str(gest_name)))
         else:
-            GestureController.hr_major = left
-            GestureController.hr_minor = right
-
-    # process_frame:
-    # This method processes a video frame, detects hand landmarks, updates the HandRecog objects for
-    # major and minor hands, and calls the handle_controls method of the Controller class to perform
-    # actions based on the detected gestures. The processed frame with hand landmarks is returned.
-    def process_frame(self, frame, gesture_detection_active):
-        handmajor = HandRecog(HLabel.MAJOR)
-        handminor = HandRecog(HLabel.MINOR)
-
-        with mp_hands.Hands(max_num_hands = 2,min_detection_confidence=0.5, min_tracking_confidence=0.5) as hands:
-            while GestureController.cap.isOpened() and GestureController.gc_mode:
-                gesture_detection_active.wait()  
-               
-                #applying resizing to speed up the image processing
-                frame = cv2.resize(frame, (100, 100))
-
-                #Apply a Gaussian blur to the input frame to reduce noise and improve hand detection.
-                #frame = cv2.GaussianBlur(frame, (5, 5), 0)
-
-                #Background subtraction: to separate the hand from the background, 
-                # making it easier to detect and track the hand. 
-                #This method is the MOG2 background subtractor.
-                fgbg = cv2.createBackgroundSubtractorMOG2()
-                fgmask = fgbg.apply(frame)
-
-                #Morphological operations: Apply morphological operations, 
-                #such as dilation and erosion, to clean up the binary image 
-                #resulting from background subtraction or other segmentation methods.
-                kernel = np.ones((5, 5), np.uint8)
-                dilation = cv2.dilate(fgmask, kernel, iterations=1)
-                erosion = cv2.erode(dilation, kernel, iterations=1)
-                frame = erosion    
-
-                success, image = self.cap.read()
-
-                if not success:
+            self.last_gesture = None
+            self.last_actions = {}
+            self.controller.cursor.reset()
+            self.controller.release_all()
+        self.controller.advance(stamp)
+        if self.landmark_stream is not None and self.landmark_stream.subscribers:
+            self.landmark_stream.publish(stamp, self.last_gesture, self.stream_hands())
+        self.metrics.frame()
+        return results
+
+    # run:
+    # Processes the frames published by the camera producer while gesture detection is active. Frames
+    # the loop was too slow to pick up are counted as dropped, frames older than 'stale_after' seconds
+    # when processing starts as stale. A stale frame is skipped instead of processed when a newer one
+    # has been published in the meantime (or its ring slot was already reused). Every 'timing_report_every' frames the per-stage timings of the
+    # pipeline are printed. While tracing (see tracing.py) every frame is tagged with its sequence number.
+    def run(self, gesture_detection_active):
+        seq = 0
+        reported = 0
+        metrics = self.metrics
+        try:
+            while self.camera.is_running() and self.gc_mode:
+                if not gesture_detection_active.is_set():
+                    # a pinch or drag must not stay held while detection is paused
+                    self.controller.release_all()
+                    gesture_detection_active.wait()
+                    if self.idle is not None:
+                        self.idle.reset()
+
+                new_seq, frame = self.camera.wait_frame(seq)
+                if frame is None:
                     print("Ignoring empty camera frame.")
                     continue
-                
-                image = cv2.cvtColor(cv2.flip(image, 1), cv2.COLOR_BGR2RGB)
-                image.flags.writeable = False
-                results = hands.process(image)
-                
-                image.flags.writeable = True
-                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-
-                if results.multi_hand_landmarks:                   
-                    GestureController.classify_hands(results)
-                    handmajor.update_hand_result(GestureController.hr_major)
-                    handminor.update_hand_result(GestureController.hr_minor)
-
-                    handmajor.set_finger_state()
-                    handminor.set_finger_state()
-                    gest_name = handminor.get_gesture()
-
-                    if gest_name == Gest.PINCH_MINOR:
-                        Controller.handle_controls(Gest(gest_name), handminor.hand_result)
-                    else:
-                        gest_name = handmajor.get_gesture()
-                        Controller.handle_controls(Gest(gest_name), handmajor.hand_result)
-                    
-                    for hand_landmarks in results.multi_hand_landmarks:
-                        mp_drawing.draw_landmarks(image, hand_landmarks, mp_hands.HAND_CONNECTIONS)
-                else:
-                    Controller.prev_hand = None
-                
-                if cv2.waitKey(5) & 0xFF == 13:
-                    break
-        
-                # Return the annotated image.
-        return image
\ No newline at end of file
+                if seq and new_seq > seq + 1:
+                    metrics.count('frames_dropped', new_seq - seq - 1)
+                seq = new_seq
+
+                stamp = self.camera.timestamp(seq)
+                if stamp is None:
+                    metrics.count('frames_skipped_stale')
+                    continue
+                age = time.monotonic() - stamp
+                metrics.observe('frame_age', age)
+                if age > self.stale_after:
+                    metrics.count('frames_stale')
+                    if self.camera.latest()[0] > seq:
+                        metrics.count('frames_skipped_stale')
+                        continue
+
+                tracing = TRACER.enabled
+                if tracing:
+                    TRACER.begin_frame(seq, stamp)
+                    t = time.perf_counter()
+                self.process_frame(frame, stamp)
+                if tracing:
+                    TRACER.span('process_frame', t, time.perf_counter(), 'frame')
+                # idle frames do not count as pipeline frames: report each count once
+                frames = self.pipeline.timer.frames
+                if self.timing_report_every and frames % self.timing_report_every == 0 and frames != reported:
+                    reported = frames
+                    print(self.pipeline.timer.report())
+        finally:
+            self.controller.release_all()
+            self.stop_recording()
+            self.pipeline.close()
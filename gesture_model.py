@@ -0,0 +1,253 @@
+import argparse
+import numpy as np
+from landmarks import NUM_LANDMARKS, PINCH_MAJOR, PINCH_MINOR, classify
+from traces import read_trace
+
+# Learned gesture classifier
+# --------------------------
+# Alternative to the threshold classifier of landmarks.py: a small multilayer perceptron (one hidden
+# ReLU layer, softmax output) in plain NumPy, trained on recorded landmark traces.
+#
+# The features of a hand are made independent of the hand size, the camera distance, the position in
+# the image and mirroring (left/right hands): the landmarks are taken relative to the wrist and scaled
+# by the wrist -> middle knuckle distance, then all 210 pairwise 3D distances plus the relative y
+# (orientation) and z (depth) coordinates of the 20 other landmarks are used. The model is hand
+# agnostic: PINCH_MINOR is learned as PINCH_MAJOR and told apart by the hand's role, as in
+# landmarks.classify.
+#
+#   python gesture_model.py train --trace fist.jsonl:FIST --trace palm.jsonl:PALM --out gesture_model.npz
+#   python gesture_model.py train --trace session.jsonl --teacher --out gesture_model.npz
+#   python gesture_model.py evaluate --model gesture_model.npz --trace test.jsonl:V_GEST
+#
+# Every hand of a trace given as PATH:GESTURE is labelled with that gesture (record one trace per
+# gesture); with --teacher unlabelled traces are labelled by the threshold classifier.
+
+PAIR_I, PAIR_J = np.triu_indices(NUM_LANDMARKS, 1)
+NUM_FEATURES = len(PAIR_I) + 2 * (NUM_LANDMARKS - 1)
+
+
+# landmark_features:
+# (hands, NUM_FEATURES) float32 feature matrix of a (21, 3) or (hands, 21, 3) landmark array.
+def landmark_features(landmarks):
+    pts = np.asarray(landmarks, np.float32)
+    if pts.ndim == 2:
+        pts = pts[None]
+    rel = pts - pts[:, :1]
+    scale = np.sqrt(rel[:, 9, 0] ** 2 + rel[:, 9, 1] ** 2)
+    rel = rel / np.maximum(scale, 1e-6)[:, None, None]
+    diff = rel[:, PAIR_I] - rel[:, PAIR_J]
+    dist = np.sqrt((diff * diff).sum(axis=2))
+    return np.concatenate([dist, rel[:, 1:, 1], rel[:, 1:, 2]], axis=1)
+
+
+# augment:
+# 'copies' randomly scaled, rotated (in the image plane), shifted and jittered copies of a
+# (hands, 21, 3) landmark array, for training.
+def augment(landmarks, copies, seed=0):
+    rng = np.random.default_rng(seed)
+    out = [landmarks]
+    for _ in range(copies):
+        n = len(landmarks)
+        angle = rng.uniform(-0.35, 0.35, n)
+        cos, sin = np.cos(angle), np.sin(angle)
+        scale = rng.uniform(0.5, 2.0, n)[:, None]
+        rel = landmarks - landmarks[:, :1]
+        x = (rel[..., 0] * cos[:, None] - rel[..., 1] * sin[:, None]) * scale
+        y = (rel[..., 0] * sin[:, None] + rel[..., 1] * cos[:, None]) * scale
+        z = rel[..., 2] * scale
+        copy = np.stack([x, y, z], axis=2) + landmarks[:, :1] + rng.normal(0, 0.05, (n, 1, 3)) * [1, 1, 0]
+        copy += rng.normal(0, 0.002, copy.shape) * scale[..., None]
+        out.append(copy.astype(np.float32))
+    return np.concatenate(out)
+
+
+# GestureModel class:
+# -------------------
+# The trained network and the feature standardization. predict() classifies a whole batch of hands
+# in one pass and returns the gesture codes with their confidences; probabilities() the confidence of
+# every gesture in 'classes'. classify() has the signature of landmarks.classify, so a model can be
+# passed to GestureController as its classifier. Below 'min_confidence' the threshold classifier
+# decides instead. The probabilities of the last classify() call are kept in 'last_probabilities' and
+# the confidence of each hand's gesture in 'last_confidence' (HandRecog weights its votes with it).
+class GestureModel:
+
+    def __init__(self, classes, mean, std, w1, b1, w2, b2, min_confidence=0.0):
+        self.classes = np.asarray(classes, np.int64)
+        self.mean = np.asarray(mean, np.float32)
+        self.std = np.asarray(std, np.float32)
+        self.w1 = np.asarray(w1, np.float32)
+        self.b1 = np.asarray(b1, np.float32)
+        self.w2 = np.asarray(w2, np.float32)
+        self.b2 = np.asarray(b2, np.float32)
+        self.min_confidence = min_confidence
+        self.last_probabilities = None
+        self.last_confidence = None
+
+    # train:
+    # Fits a model to (hands, 21, 3) landmarks and their gesture codes with mini-batch Adam on the
+    # softmax cross-entropy (plus L2 'weight_decay'). 'log' is called with (epoch, loss) every 50 epochs.
+    @classmethod
+    def train(cls, landmarks, labels, hidden=32, epochs=300, learning_rate=0.005, weight_decay=1e-4,
+              batch_size=256, seed=0, log=None):
+        labels = np.where(np.asarray(labels) == PINCH_MINOR, PINCH_MAJOR, labels)
+        classes, y = np.unique(labels, return_inverse=True)
+        x = landmark_features(landmarks)
+        mean, std = x.mean(axis=0), x.std(axis=0) + 1e-6
+        x = (x - mean) / std
+
+        rng = np.random.default_rng(seed)
+        params = [rng.normal(0, np.sqrt(2.0 / x.shape[1]), (x.shape[1], hidden)).astype(np.float32),
+                  np.zeros(hidden, np.float32),
+                  rng.normal(0, np.sqrt(1.0 / hidden), (hidden, len(classes))).astype(np.float32),
+                  np.zeros(len(classes), np.float32)]
+        moments = [np.zeros_like(p) for p in params]
+        velocities = [np.zeros_like(p) for p in params]
+        step = 0
+        for epoch in range(1, epochs + 1):
+            order = rng.permutation(len(x))
+            total = 0.0
+            for start in range(0, len(x), batch_size):
+                batch = order[start:start + batch_size]
+                xb, yb = x[batch], y[batch]
+                h = np.maximum(xb @ params[0] + params[1], 0)
+                probs = softmax(h @ params[2] + params[3])
+                total += -np.log(probs[np.arange(len(yb)), yb] + 1e-9).sum()
+
+                dlogits = probs
+                dlogits[np.arange(len(yb)), yb] -= 1
+                dlogits /= len(yb)
+                dh = (dlogits @ params[2].T) * (h > 0)
+                grads = [xb.T @ dh + weight_decay * params[0], dh.sum(axis=0),
+                         h.T @ dlogits + weight_decay * params[2], dlogits.sum(axis=0)]
+                step += 1
+                for p, g, m, v in zip(params, grads, moments, velocities):
+                    m += 0.1 * (g - m)
+                    v += 0.001 * (g * g - v)
+                    p -= learning_rate * (m / (1 - 0.9 ** step)) / (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)
+            if log is not None and (epoch % 50 == 0 or epoch == epochs):
+                log(epoch, total / len(x))
+        return cls(classes, mean, std, *params)
+
+    def probabilities(self, landmarks):
+        x = (landmark_features(landmarks) - self.mean) / self.std
+        h = np.maximum(x @ self.w1 + self.b1, 0)
+        return softmax(h @ self.w2 + self.b2)
+
+    # predict:
+    # (gesture codes, confidences) of a batch of hands.
+    def predict(self, landmarks):
+        probs = self.probabilities(landmarks)
+        best = probs.argmax(axis=1)
+        return self.classes[best], probs[np.arange(len(best)), best]
+
+    # classify:
+    # Drop-in replacement for landmarks.classify: returns the gesture code of every hand in the batch
+    # and the finger states, which are still computed by the threshold code.
+    def classify(self, landmarks, minor):
+        threshold, finger = classify(landmarks, minor)
+        probs = self.probabilities(landmarks)
+        self.last_probabilities = probs
+        best = probs.argmax(axis=1)
+        gesture = self.classes[best]
+        gesture = np.where((gesture == PINCH_MAJOR) & np.asarray(minor), PINCH_MINOR, gesture)
+        confidence = probs[np.arange(len(best)), best]
+        if self.min_confidence:
+            gesture = np.where(confidence >= self.min_confidence, gesture, threshold)
+        self.last_confidence = confidence
+        return gesture, finger
+
+    def save(self, path):
+        np.savez(path, classes=self.classes, mean=self.mean, std=self.std, w1=self.w1, b1=self.b1, w2=self.w2,
+                 b2=self.b2)
+
+    @classmethod
+    def load(cls, path, min_confidence=0.0):
+        with np.load(path) as data:
+            return cls(data['classes'], data['mean'], data['std'], data['w1'], data['b1'], data['w2'], data['b2'],
+                       min_confidence)
+
+
+def softmax(logits):
+    e = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+# load_traces:
+# (landmarks (hands, 21, 3), labels) of all hands in the traces. 'specs' are PATH or PATH:GESTURE; the
+# hands of an unlabelled trace are labelled by the threshold classifier if 'teacher' is set.
+def load_traces(specs, teacher=False):
+    from gesture_detection import Gest
+    hands, labels = [], []
+    for spec in specs:
+        path, gesture = spec, None
+        if ':' in spec and spec.rsplit(':', 1)[1] in Gest.__members__:
+            path, name = spec.rsplit(':', 1)
+            gesture = Gest[name].value
+        elif not teacher:
+            raise ValueError(f"No gesture given for {spec!r}: use PATH:GESTURE or --teacher")
+        trace_hands = [hand['landmarks'] for record in read_trace(path) for hand in record['hands']]
+        if not trace_hands:
+            continue
+        trace_hands = np.array(trace_hands, np.float32)
+        hands.append(trace_hands)
+        if gesture is None:
+            labels.append(classify(trace_hands, np.zeros(len(trace_hands), bool))[0])
+        else:
+            labels.append(np.full(len(trace_hands), gesture))
+    if not hands:
+        raise ValueError("The traces contain no hands")
+    return np.concatenate(hands), np.concatenate(labels)
+
+
+# accuracy_report:
+# Prints the accuracy of the model and of the threshold classifier per gesture.
+def accuracy_report(model, landmarks, labels):
+    from gesture_detection import GESTURE_NAMES
+    labels = np.where(labels == PINCH_MINOR, PINCH_MAJOR, labels)
+    minor = np.zeros(len(labels), bool)
+    predicted, _ = model.predict(landmarks)
+    threshold, _ = classify(landmarks, minor)
+    print(f"{'gesture':20s} {'hands':>7s} {'model':>7s} {'threshold':>10s}")
+    for code in np.unique(labels):
+        mask = labels == code
+        print(f"{GESTURE_NAMES.get(int(code), str(code)):20s} {mask.sum():7d} "
+              f"{(predicted[mask] == code).mean():7.1%} {(threshold[mask] == code).mean():10.1%}")
+    print(f"{'all':20s} {len(labels):7d} {(predicted == labels).mean():7.1%} {(threshold == labels).mean():10.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Learned gesture classifier')
+    sub = parser.add_subparsers(dest='command', required=True)
+    train = sub.add_parser('train', help='train a model on landmark traces')
+    train.add_argument('--trace', action='append', required=True, help='PATH or PATH:GESTURE (repeatable)')
+    train.add_argument('--out', default='gesture_model.npz')
+    train.add_argument('--teacher', action='store_true', help='label unlabelled traces with the threshold classifier')
+    train.add_argument('--hidden', type=int, default=32)
+    train.add_argument('--epochs', type=int, default=300)
+    train.add_argument('--augment', type=int, default=4, help='augmented copies of every hand')
+    train.add_argument('--holdout', type=float, default=0.2, help='fraction of hands kept for validation')
+    evaluate = sub.add_parser('evaluate', help='accuracy of a model on labelled traces')
+    evaluate.add_argument('--model', required=True)
+    evaluate.add_argument('--trace', action='append', required=True, help='PATH:GESTURE (repeatable)')
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        landmarks, labels = load_traces(args.trace, args.teacher)
+        order = np.random.default_rng(0).permutation(len(labels))
+        split = int(len(order) * (1 - args.holdout))
+        train_idx, test_idx = order[:split], order[split:]
+        x = augment(landmarks[train_idx], args.augment)
+        y = np.tile(labels[train_idx], args.augment + 1)
+        model = GestureModel.train(x, y, args.hidden, args.epochs,
+                                   log=lambda epoch, loss: print(f"epoch {epoch:4d}  loss {loss:.4f}"))
+        model.save(args.out)
+        print(f"saved {args.out} ({len(model.classes)} gestures, {len(train_idx)} training hands)")
+        if len(test_idx):
+            accuracy_report(model, landmarks[test_idx], labels[test_idx])
+    else:
+        model = GestureModel.load(args.model)
+        accuracy_report(model, *load_traces(args.trace))
+
+
+if __name__ == '__main__':
+    main()
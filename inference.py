@@ -0,0 +1,471 @@
+import atexit
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Connection, answer_challenge, deliver_challenge
+import numpy as np
+from traces import results_from_record
+
+# Process-pool inference
+# ----------------------
+# Runs hand detection in separate worker processes, so MediaPipe no longer competes for the GIL with
+# capture, the video feed encoder and Flask. Frames are copied into slots of a shared memory ring that
+# the workers map as well; only (seq, slot) travels over the connection to a worker, and only the
+# landmarks ((hands, 21, 3) float32), the handedness and the stage timings come back. Workers are
+# started as plain 'python inference.py worker ADDRESS' processes, so they never import the app module;
+# the key they authenticate with is written to their stdin rather than passed on the command line,
+# where other users could read it.
+#
+# An InferencePool can be shared by several sessions (cameras): every worker keeps a separate
+# HandPipeline, with its own MediaPipe tracking state, per session it serves.
+
+
+# worker_main:
+# Entry point of a worker process. Connects back to the pool and serves the sessions ('clients')
+# opened on it: maps their shared frame ring, runs their HandPipeline on every frame it is sent and
+# returns the landmarks, until it receives 'stop'. The authentication key is read from stdin as hex.
+def worker_main(address):
+    authkey = sys.stdin.readline().strip()
+    from pipeline import HandPipeline
+    from multiprocessing import resource_tracker
+    # Workers only exist to run MediaPipe: load it right away instead of when the first session opens
+    import mediapipe
+
+    conn = Client(parse_address(address), authkey=bytes.fromhex(authkey))
+    clients = {}
+    try:
+        while True:
+            message = conn.recv()
+            kind = message[0]
+            if kind == 'stop':
+                break
+            if kind == 'open':
+                _, client, shm_name, shape, dtype, options = message
+                shm = shared_memory.SharedMemory(name=shm_name)
+                try:
+                    # The pool owns the segment; keep this process' resource tracker from unlinking it
+                    resource_tracker.unregister(shm._name, 'shared_memory')
+                except Exception:
+                    pass
+                clients[client] = (shm, np.ndarray(shape, dtype, buffer=shm.buf), HandPipeline(**options))
+            elif kind == 'close':
+                shm, slots, pipeline = clients.pop(message[1])
+                pipeline.close()
+                del slots
+                shm.close()
+            elif kind == 'frame':
+                _, client, seq, slot, stamp = message
+                _, slots, pipeline = clients[client]
+                pipeline.timer.last.clear()
+                results = pipeline.process(slots[slot], stamp)
+                hands = np.zeros((0, 21, 3), np.float32)
+                handedness = []
+                if results.multi_hand_landmarks:
+                    hands = np.array([[(lm.x, lm.y, lm.z) for lm in hand.landmark]
+                                      for hand in results.multi_hand_landmarks], np.float32)
+                    for classification_list in results.multi_handedness or []:
+                        classification = classification_list.classification[0]
+                        handedness.append((classification.label, classification.score))
+                conn.send((client, seq, slot, hands, handedness, dict(pipeline.timer.last)))
+    except (EOFError, OSError):
+        # the pool went away
+        pass
+    finally:
+        for shm, slots, pipeline in clients.values():
+            pipeline.close()
+        clients.clear()
+        conn.close()
+
+
+# parse_address:
+# The connection address of a WorkerListener from its 'address' string.
+def parse_address(address):
+    if address.startswith('tcp:'):
+        host, port = address[4:].rsplit(':', 1)
+        return host, int(port)
+    return address
+
+
+# WorkerListener class:
+# ---------------------
+# The socket workers connect back to: a Unix socket in a private temporary directory, or a loopback TCP
+# port where there are no Unix sockets. Works like multiprocessing's Listener (the connections are
+# authenticated with 'authkey' the same way, so workers connect with Client), but accept() takes a
+# timeout.
+class WorkerListener:
+
+    def __init__(self, authkey):
+        self.authkey = authkey
+        self.directory = None
+        if sys.platform != 'win32' and hasattr(socket, 'AF_UNIX'):
+            self.directory = tempfile.mkdtemp(prefix='gesture-inference-')
+            self.address = os.path.join(self.directory, 'listener')
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.bind(self.address)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.bind(('127.0.0.1', 0))
+            self.address = 'tcp:%s:%d' % self.sock.getsockname()
+        self.sock.listen()
+
+    # accept:
+    # Returns the next authenticated connection, or None if no worker connected within 'timeout' seconds.
+    def accept(self, timeout):
+        self.sock.settimeout(timeout)
+        try:
+            sock, _ = self.sock.accept()
+        except socket.timeout:
+            return None
+        sock.setblocking(True)
+        conn = Connection(sock.detach())
+        try:
+            deliver_challenge(conn, self.authkey)
+            answer_challenge(conn, self.authkey)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def close(self):
+        self.sock.close()
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# InferencePool class:
+# --------------------
+# A set of 'workers' worker processes (default: one per CPU core) shared by any number of sessions.
+# attach() registers a session on the least loaded worker(s), so throughput scales with the number of
+# cores as sessions are added. A reader thread per worker routes the results to the queue of the
+# session they belong to. The processes are started on first use; start() raises RuntimeError if a
+# worker exits or not all of them connect within 'start_timeout' seconds. A worker that goes away later
+# is marked lost: the queues of its sessions get a (None, worker) message and attach() no longer picks
+# it (there is no restart; attach() raises RuntimeError once all workers are lost).
+class InferencePool:
+
+    def __init__(self, workers=None, start_timeout=60.0):
+        self.size = workers or os.cpu_count() or 1
+        self.start_timeout = start_timeout
+        self.procs = []
+        self.conns = []
+        self.send_locks = []
+        self.load = [0] * self.size
+        self.clients = {}
+        self.client_workers = {}
+        self.lost = set()
+        self.next_client = 1
+        self.lock = threading.Lock()
+        self.started = False
+        atexit.register(self.close)
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            authkey = os.urandom(16)
+            self.lost = set()
+            try:
+                with WorkerListener(authkey) as listener:
+                    for _ in range(self.size):
+                        proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'worker',
+                                                 listener.address], stdin=subprocess.PIPE, text=True)
+                        self.procs.append(proc)
+                        proc.stdin.write(authkey.hex() + '\n')
+                        proc.stdin.close()
+                    conns = self._accept(listener)
+            except Exception:
+                self._kill()
+                raise
+            for worker, conn in enumerate(conns):
+                self.conns.append(conn)
+                self.send_locks.append(threading.Lock())
+                threading.Thread(target=self._read, args=(worker, conn), name=f'inference-reader-{worker}',
+                                 daemon=True).start()
+            self.started = True
+
+    # _accept:
+    # Accepts the connections of all workers, checking the worker processes in between.
+    def _accept(self, listener):
+        deadline = time.monotonic() + self.start_timeout
+        conns = []
+        try:
+            while len(conns) < self.size:
+                conn = listener.accept(0.25)
+                if conn is not None:
+                    conns.append(conn)
+                    continue
+                for proc in self.procs:
+                    if proc.poll() is not None:
+                        raise RuntimeError(f"Inference worker exited with code {proc.returncode} while starting")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Only {len(conns)} of {self.size} inference workers started within "
+                                       f"{self.start_timeout:g} s")
+        except Exception:
+            for conn in conns:
+                conn.close()
+            raise
+        return conns
+
+    # _kill:
+    # Stops the worker processes of a start() that failed.
+    def _kill(self):
+        procs, self.procs = self.procs, []
+        for proc in procs:
+            proc.kill()
+            proc.wait()
+
+    def _read(self, worker, conn):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                self._worker_lost(worker, conn)
+                return
+            results = self.clients.get(message[0])
+            if results is not None:
+                results.put(message[1:])
+
+    # _worker_lost:
+    # The connection to 'worker' ended. Unless the pool closed it, the sessions it serves are told.
+    def _worker_lost(self, worker, conn):
+        with self.lock:
+            if worker >= len(self.conns) or self.conns[worker] is not conn:
+                return
+            self.lost.add(worker)
+            queues = [self.clients[client] for client, workers in self.client_workers.items()
+                      if worker in workers and client in self.clients]
+        for results in queues:
+            results.put((None, worker))
+
+    def send(self, worker, message):
+        with self.send_locks[worker]:
+            self.conns[worker].send(message)
+
+    # attach:
+    # Opens a session with its shared frame ring on the 'count' least loaded workers. Returns
+    # (client id, result queue, worker indices).
+    def attach(self, shm_name, shape, dtype, options, count=1):
+        self.start()
+        with self.lock:
+            available = [w for w in range(self.size) if w not in self.lost]
+            if not available:
+                raise RuntimeError("All inference workers exited")
+            client = self.next_client
+            self.next_client += 1
+            workers = sorted(available, key=lambda w: (self.load[w], w))[:count]
+            for worker in workers:
+                self.load[worker] += 1
+            results = self.clients[client] = queue.Queue()
+            self.client_workers[client] = workers
+        for worker in workers:
+            self.send(worker, ('open', client, shm_name, shape, dtype, options))
+        return client, results, workers
+
+    def detach(self, client, workers):
+        with self.lock:
+            self.clients.pop(client, None)
+            self.client_workers.pop(client, None)
+            for worker in workers:
+                self.load[worker] -= 1
+        for worker in workers:
+            try:
+                self.send(worker, ('close', client))
+            except (OSError, EOFError, IndexError):
+                pass
+
+    def close(self):
+        with self.lock:
+            conns, procs = self.conns, self.procs
+            self.conns, self.procs, self.send_locks = [], [], []
+            self.started = False
+        for conn in conns:
+            try:
+                conn.send(('stop',))
+            except (OSError, EOFError):
+                pass
+        for proc in procs:
+            try:
+                proc.wait(timeout=5.0)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        for conn in conns:
+            conn.close()
+
+
+# ProcessPipeline class:
+# ----------------------
+# Stand-in for HandPipeline that hands the frames of one session to worker processes running a
+# HandPipeline with 'pipeline_options'. Without a 'pool' it starts a private pool of 'workers'
+# processes and uses all of them; with a shared pool it uses 'workers' of the pool's processes. Up to
+# 'depth' frames (default: one per worker) are in flight; process() submits the new frame and returns
+# the results of the oldest one, so results always come back in frame order and detection overlaps
+# with the gesture logic of the previous frame. The results carry the capture time of the frame they
+# belong to as 'stamp', which lags the frame just submitted by up to 'depth' frames. When all slots are busy process() waits for the oldest
+# frame (back-pressure) instead of queueing more. Until the first results arrive, process() returns
+# results without hands. The timings reported by the workers are added to self.timer, the copy into
+# the ring as 'transport' and the time spent waiting for results as 'wait'. When a session is spread
+# over several workers every worker only sees every n-th frame, so MediaPipe's tracking (and ROI or
+# landmark prediction) work best with a single worker per session. If a worker of the session exits or
+# sends no results for 'result_timeout' seconds, the error is printed once ('failed') and from then on
+# process() returns results without hands and counts the frame in 'errors'.
+class ProcessPipeline:
+
+    def __init__(self, workers=1, depth=None, pool=None, result_timeout=10.0, **pipeline_options):
+        from pipeline import StageTimer
+        self.own_pool = pool is None
+        self.pool = pool if pool is not None else InferencePool(workers)
+        self.workers = workers
+        self.depth = depth or workers
+        self.result_timeout = result_timeout
+        self.options = pipeline_options
+        self.timer = StageTimer()
+        self.results = None
+        self.failed = None
+        self.errors = 0
+        self.shape = None
+        self.shm = None
+        self.slots = None
+        self.client = None
+        self.assigned = []
+        self.queue = None
+        self.free = []
+        self.pending = deque()
+        self.ready = {}
+        self.in_flight = {}
+        self.seq = 0
+        self.closed = False
+        atexit.register(self.close)
+
+    def start(self, shape, dtype):
+        self.close()
+        slots_shape = (self.depth,) + tuple(shape)
+        nbytes = int(np.prod(slots_shape)) * np.dtype(dtype).itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self.slots = np.ndarray(slots_shape, dtype, buffer=self.shm.buf)
+        self.shape = tuple(shape)
+        self.free = list(range(self.depth))
+        self.client, self.queue, self.assigned = self.pool.attach(self.shm.name, slots_shape, np.dtype(dtype).str,
+                                                                  self.options, self.workers)
+        self.in_flight = {worker: 0 for worker in self.assigned}
+        self.closed = False
+
+    # warm_up:
+    # Starts the worker processes of the pool (they load MediaPipe as they start).
+    def warm_up(self):
+        self.pool.start()
+
+    def close(self):
+        self.closed = True
+        if self.client is not None:
+            self.pool.detach(self.client, self.assigned)
+            self.client = None
+        if self.own_pool:
+            self.pool.close()
+        self.pending, self.ready = deque(), {}
+        if self.shm is not None:
+            self.slots = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+        self.shape = None
+
+    # fail:
+    # Hand detection of this session stopped working: reports 'reason' once.
+    def fail(self, reason):
+        if self.failed is None:
+            self.failed = reason
+            print(f"Error: Hand detection failed: {reason}")
+
+    # collect:
+    # Waits for the results of the oldest frame in flight and returns them as MediaPipe-like results, or
+    # None if the worker was lost.
+    def collect(self):
+        seq, worker, stamp = self.pending.popleft()
+        while seq not in self.ready:
+            try:
+                message = self.queue.get(timeout=self.result_timeout)
+            except queue.Empty:
+                self.fail(f"no results for frame {seq} from inference worker {worker} "
+                          f"within {self.result_timeout:g} s")
+                return None
+            if message[0] is None:
+                self.fail(f"inference worker {message[1]} exited")
+                return None
+            got_seq, slot, hands, handedness, timings = message
+            self.ready[got_seq] = (slot, hands, handedness, timings)
+        slot, hands, handedness, timings = self.ready.pop(seq)
+        self.in_flight[worker] -= 1
+        self.free.append(slot)
+        for stage, ms in timings.items():
+            self.timer.add(stage, ms / 1000.0)
+        record = {'hands': [{'label': label, 'score': score, 'landmarks': landmarks.tolist()}
+                            for landmarks, (label, score) in zip(hands, handedness)]}
+        results = results_from_record(record)
+        results.stamp = stamp
+        return results
+
+    def process(self, frame, stamp=None):
+        if stamp is None:
+            stamp = time.monotonic()
+        if self.closed and self.seq:
+            return results_from_record({'hands': []})
+        if self.failed is None and self.shape != frame.shape:
+            try:
+                self.start(frame.shape, frame.dtype)
+            except RuntimeError as e:
+                self.fail(str(e))
+        self.timer.frames += 1
+
+        results = None
+        try:
+            if self.failed is None and len(self.pending) >= self.depth:
+                t = time.perf_counter()
+                results = self.collect()
+                self.timer.add('wait', time.perf_counter() - t)
+            if self.failed is not None:
+                self.errors += 1
+                return self._empty()
+            t = time.perf_counter()
+            slot = self.free.pop()
+            np.copyto(self.slots[slot], frame)
+            self.seq += 1
+            worker = min(self.assigned, key=lambda w: (self.in_flight[w], (w - self.seq) % len(self.assigned)))
+            self.pool.send(worker, ('frame', self.client, self.seq, slot, stamp))
+            self.in_flight[worker] += 1
+            self.pending.append((self.seq, worker, stamp))
+            self.timer.add('transport', time.perf_counter() - t)
+        except (OSError, EOFError, IndexError, TypeError) as e:
+            # close() was called from another thread (e.g. at exit) while this frame was in flight
+            if self.closed:
+                pass
+            elif isinstance(e, (OSError, EOFError)):
+                self.fail(f"lost the connection to the inference workers ({e!r})")
+            else:
+                raise
+
+        if results is None:
+            return self._empty()
+        self.results = results
+        return results
+
+    def _empty(self):
+        self.results = results_from_record({'hands': []})
+        return self.results
+
+
+if __name__ == '__main__' and len(sys.argv) == 3 and sys.argv[1] == 'worker':
+    worker_main(sys.argv[2])
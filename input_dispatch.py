@@ -0,0 +1,338 @@
+import threading
+import time
+from collections import deque
+from tracing import TRACER
+
+
+# PyAutoGuiBackend class:
+# -----------------------
+# Injects mouse events into the OS through PyAutoGUI. pyautogui is imported when the backend is
+# created, and every call passes _pause=False so PyAutoGUI does not sleep after it.
+class PyAutoGuiBackend:
+
+    def __init__(self):
+        import pyautogui
+        pyautogui.FAILSAFE = False
+        self.pg = pyautogui
+
+    def size(self):
+        return tuple(self.pg.size())
+
+    def position(self):
+        return tuple(self.pg.position())
+
+    def move_to(self, x, y):
+        self.pg.moveTo(x, y, _pause=False)
+
+    def mouse_down(self, button='left'):
+        self.pg.mouseDown(button=button, _pause=False)
+
+    def mouse_up(self, button='left'):
+        self.pg.mouseUp(button=button, _pause=False)
+
+    def click(self, button='left'):
+        self.pg.click(button=button, _pause=False)
+
+    def double_click(self):
+        self.pg.doubleClick(_pause=False)
+
+    def scroll(self, amount):
+        self.pg.scroll(amount, _pause=False)
+
+    def hscroll(self, amount):
+        self.pg.hscroll(amount, _pause=False)
+
+
+# RecordingBackend class:
+# -----------------------
+# Fake backend that records every call as (time.monotonic(), name, args) instead of touching the OS.
+# Used to test the dispatcher and to measure gesture -> action latency.
+class RecordingBackend:
+
+    def __init__(self, screen=(1920, 1080), position=(0, 0), max_calls=100000):
+        self.screen = tuple(screen)
+        self.cursor = tuple(position)
+        self.calls = deque(maxlen=max_calls)
+
+    def _record(self, name, *args):
+        self.calls.append((time.monotonic(), name, args))
+
+    def size(self):
+        return self.screen
+
+    def position(self):
+        return self.cursor
+
+    def move_to(self, x, y):
+        self.cursor = (x, y)
+        self._record('move_to', x, y)
+
+    def mouse_down(self, button='left'):
+        self._record('mouse_down', button)
+
+    def mouse_up(self, button='left'):
+        self._record('mouse_up', button)
+
+    def click(self, button='left'):
+        self._record('click', button)
+
+    def double_click(self):
+        self._record('double_click')
+
+    def scroll(self, amount):
+        self._record('scroll', amount)
+
+    def hscroll(self, amount):
+        self._record('hscroll', amount)
+
+
+# InputDispatcher class:
+# ----------------------
+# Runs OS input injection on its own worker thread so the recognition loop never waits for the OS.
+# Commands go into a bounded queue; a move replaces a move that is still waiting at the tail of the
+# queue, so only the latest cursor target is kept, and a scroll is added to a scroll of the same
+# direction waiting there. When the queue is full the oldest move, or else the oldest scroll, is
+# dropped; button events are never dropped (the queue grows past 'max_queue' if it holds nothing
+# else), so no button stays pressed. Moves are not executed as one blocking
+# moveTo(duration=0.1) but interpolated over 'move_duration' seconds on the worker's own clock, at
+# 'rate' steps per second. Other commands (clicks, scrolls) are executed in order, after the cursor
+# reached the target of the moves queued before them. Screen size and cursor position are cached; the
+# OS cursor position is read again every 'geometry_ttl' seconds while no move is pending, so the
+# physical mouse is picked up.
+# Each command carries a time stamp (by default the one given to begin_frame()) and the delay until
+# its first OS call is kept in 'latencies' and passed to 'latency_observer' if one is set. A backend
+# call that raises is counted in 'errors' and printed (repeats of the same error only once), and the
+# worker goes on with the next command.
+class InputDispatcher:
+
+    def __init__(self, backend=None, rate=120, move_duration=0.1, max_queue=64, geometry_ttl=5.0):
+        self.backend = backend
+        self.rate = rate
+        self.move_duration = move_duration
+        self.max_queue = max_queue
+        self.geometry_ttl = geometry_ttl
+        self.latencies = deque(maxlen=1000)
+        self.latency_observer = None
+        self.coalesced = 0
+        self.dropped = 0
+        self.errors = 0
+        self._last_error = None
+        self.frame_stamp = None
+        self.running = False
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._size = None
+        self._size_time = 0.0
+        self._target = None
+        self._target_time = 0.0
+        self._cursor = None
+        self._motion = None
+
+    def _get_backend(self):
+        if self.backend is None:
+            self.backend = PyAutoGuiBackend()
+        return self.backend
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return self
+            self._get_backend()
+            self.running = True
+            self._thread = threading.Thread(target=self._run, name='input-dispatcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    # begin_frame:
+    # Sets the time stamp (e.g. capture time of the frame being processed) that commands submitted
+    # from now on are measured against.
+    def begin_frame(self, stamp):
+        self.frame_stamp = stamp
+
+    # screen_size:
+    # Cached screen size, refreshed every 'geometry_ttl' seconds.
+    def screen_size(self):
+        now = time.monotonic()
+        if self._size is None or now - self._size_time > self.geometry_ttl:
+            self._size = self._get_backend().size()
+            self._size_time = now
+        return self._size
+
+    # position:
+    # Position the cursor is heading to: the latest submitted target, or the OS cursor position if no
+    # move has been submitted for 'geometry_ttl' seconds and none is pending.
+    def position(self):
+        now = time.monotonic()
+        if self._target is None or now - self._target_time > self.geometry_ttl:
+            with self._cond:
+                idle = self._motion is None and not any(cmd[0] == 'move_to' for cmd in self._queue)
+                if idle:
+                    # the worker starts its next move from the OS position as well
+                    self._cursor = None
+            if idle or self._target is None:
+                self._target = self._get_backend().position()
+                self._target_time = now
+        return self._target
+
+    def submit(self, name, *args, stamp=None):
+        if stamp is None:
+            stamp = self.frame_stamp if self.frame_stamp is not None else time.monotonic()
+        if self._thread is None:
+            self.start()
+        cmd = (name, args, stamp)
+        with self._cond:
+            tail = self._queue[-1] if self._queue else None
+            if name == 'move_to' and tail is not None and tail[0] == 'move_to':
+                self._queue[-1] = cmd
+                self.coalesced += 1
+            elif name in ('scroll', 'hscroll') and tail is not None and tail[0] == name:
+                # the merged scroll keeps the stamp of the older one, its latency counts from there
+                self._queue[-1] = (name, (tail[1][0] + args[0],), tail[2])
+                self.coalesced += 1
+            else:
+                if len(self._queue) >= self.max_queue:
+                    self._make_room()
+                self._queue.append(cmd)
+            self._cond.notify()
+
+    # _make_room:
+    # Drops the oldest queued move, or else the oldest scroll, from the full queue (with the lock held).
+    def _make_room(self):
+        for names in (('move_to',), ('scroll', 'hscroll')):
+            for i, cmd in enumerate(self._queue):
+                if cmd[0] in names:
+                    del self._queue[i]
+                    self.dropped += 1
+                    return
+
+    def move_to(self, x, y, stamp=None):
+        self._target = (x, y)
+        self._target_time = time.monotonic()
+        self.submit('move_to', x, y, stamp=stamp)
+
+    def mouse_down(self, button='left', stamp=None):
+        self.submit('mouse_down', button, stamp=stamp)
+
+    def mouse_up(self, button='left', stamp=None):
+        self.submit('mouse_up', button, stamp=stamp)
+
+    def click(self, button='left', stamp=None):
+        self.submit('click', button, stamp=stamp)
+
+    def double_click(self, stamp=None):
+        self.submit('double_click', stamp=stamp)
+
+    def scroll(self, amount, stamp=None):
+        self.submit('scroll', amount, stamp=stamp)
+
+    def hscroll(self, amount, stamp=None):
+        self.submit('hscroll', amount, stamp=stamp)
+
+    # flush:
+    # Waits until all queued commands have been executed and the cursor reached its target.
+    def flush(self, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._cond:
+                if not self._queue and self._motion is None:
+                    return True
+            time.sleep(1.0 / self.rate)
+        return False
+
+    def queue_depth(self):
+        return len(self._queue)
+
+    def _record_latency(self, stamp):
+        latency = time.monotonic() - stamp
+        self.latencies.append(latency)
+        if self.latency_observer is not None:
+            self.latency_observer(latency)
+
+    # _call:
+    # Calls the backend method 'name' and traces it as part of the frame of 'stamp'. Returns
+    # (True, result), or (False, None) if the backend raised.
+    def _call(self, name, args, stamp=None):
+        t = time.perf_counter() if TRACER.enabled else None
+        try:
+            result = getattr(self.backend, name)(*args)
+        except Exception as e:
+            self.errors += 1
+            message = f"Error: Input command {name}{args} failed: {e!r}"
+            if message != self._last_error:
+                print(message)
+                self._last_error = message
+            return False, None
+        if t is not None:
+            TRACER.span(name, t, time.perf_counter(), 'dispatch', TRACER.frame_of(stamp))
+        return True, result
+
+    def _finish_motion(self):
+        if self._motion is not None:
+            x, y = self._motion[1]
+            self._call('move_to', (int(x), int(y)))
+            self._cursor = (x, y)
+            self._motion = None
+
+    def _execute(self, cmd, now):
+        name, args, stamp = cmd
+        target = None
+        if name == 'move_to':
+            target = (float(args[0]), float(args[1]))
+            if self._cursor is None:
+                ok, position = self._call('position', ())
+                self._cursor = position if ok else target
+            # (start position, target, start time, stamp waiting for its first OS call)
+            self._motion = (self._cursor, target, now, stamp)
+            return
+        self._finish_motion()
+        if self._call(name, args, stamp)[0]:
+            self._record_latency(stamp)
+
+    def _step_motion(self, now):
+        start, target, t0, stamp = self._motion
+        alpha = 1.0 if self.move_duration <= 0 else min(1.0, (now - t0) / self.move_duration)
+        x = start[0] + (target[0] - start[0]) * alpha
+        y = start[1] + (target[1] - start[1]) * alpha
+        ok = self._call('move_to', (int(x), int(y)), stamp)[0]
+        self._cursor = (x, y)
+        if stamp is not None:
+            if ok:
+                self._record_latency(stamp)
+            self._motion = (start, target, t0, None)
+        if alpha >= 1.0:
+            self._motion = None
+
+    def _run(self):
+        period = 1.0 / self.rate
+        next_tick = time.monotonic()
+        while True:
+            with self._cond:
+                while self.running and not self._queue and self._motion is None:
+                    self._cond.wait()
+                if not self.running:
+                    break
+                commands = list(self._queue)
+                self._queue.clear()
+
+            now = time.monotonic()
+            for cmd in commands:
+                self._execute(cmd, now)
+            if self._motion is not None:
+                self._step_motion(now)
+                next_tick = max(next_tick + period, now)
+                delay = next_tick - time.monotonic()
+                with self._cond:
+                    # A new command wakes the worker before the next interpolation step is due
+                    if delay > 0 and not self._queue and self.running:
+                        self._cond.wait(delay)
+            else:
+                next_tick = time.monotonic()
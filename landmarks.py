@@ -0,0 +1,174 @@
+import math
+import numpy as np
+
+# Landmark feature extraction
+# ---------------------------
+# Vectorized versions of the distance/ratio computations HandRecog used to do one landmark at a time.
+# Landmarks are converted once per frame into a contiguous (21, 3) float32 array; a batch of hands is a
+# (hands, 21, 3) array and is classified in a single NumPy pass. The arithmetic is done in float64 on
+# the float32 landmark values, which is exactly what the scalar Python code did with the protobuf
+# fields, so the classifications are identical. The NumPy call overhead outweighs the vectorization for
+# the one or two hands of a frame, so classify() computes batches of up to SCALAR_MAX_HANDS hands with
+# plain float arithmetic instead (classify_scalar), with the same results.
+
+NUM_LANDMARKS = 21
+
+# Bit of index, middle, ring and pinky in the finger state
+FINGER_BITS = np.array([8, 4, 2, 1])
+
+# Gesture codes, same values as gesture_detection.Gest
+FIRST2 = 12
+LAST3 = 7
+LAST4 = 15
+V_GEST = 33
+TWO_FINGER_CLOSED = 34
+PINCH_MAJOR = 35
+PINCH_MINOR = 36
+MID = 4
+
+# round(ratio, 1) > 0.5 holds exactly for ratio >= float('0.55'): that double lies just above 0.55,
+# so it rounds up to 0.6, while the double below it rounds down to 0.5.
+FINGER_OPEN_RATIO = 0.55
+PINCH_DIST = 0.05
+V_RATIO = 1.7
+CLOSED_DZ = 0.1
+
+# Largest batch classify() computes without NumPy (see benchmarks/bench_landmarks.py)
+SCALAR_MAX_HANDS = 2
+
+# (tip, knuckle) of index, middle, ring and pinky, most significant finger bit first
+FINGER_POINTS = ((8, 5), (12, 9), (16, 13), (20, 17))
+
+
+# Wire format of a NormalizedLandmarkList whose landmarks all have x, y and z set and nothing else:
+# per landmark the field tag and length (15) of the message, then the tag and the 4 little endian bytes
+# of each float, 17 bytes in all. LANDMARK_TAGS are the offsets of the tags and the
+# length with the bytes expected there in all landmarks.
+LANDMARK_BYTES = 17
+LANDMARK_DTYPE = np.dtype({'names': ['x', 'y', 'z'], 'formats': ['<f4'] * 3, 'offsets': [3, 8, 13],
+                           'itemsize': LANDMARK_BYTES})
+LANDMARK_TAGS = tuple((offset, byte * NUM_LANDMARKS)
+                      for offset, byte in ((0, b'\n'), (1, b'\x0f'), (2, b'\r'), (7, b'\x15'), (12, b'\x1d')))
+
+
+# landmarks_to_array:
+# Copies the x, y, z fields of a MediaPipe NormalizedLandmarkList into a (21, 3) float32 array. An
+# existing array can be passed as 'out' to avoid allocating one per frame. Reading the fields one by one
+# through protobuf costs about 1 us per landmark, so the floats are read from the serialized message
+# when it has the plain layout of LANDMARK_DTYPE (a field that is 0.0 is left out of the message and
+# the layout check fails); otherwise, and for other landmark objects, field by field.
+def landmarks_to_array(hand_result, out=None):
+    if out is None:
+        out = np.empty((NUM_LANDMARKS, 3), np.float32)
+    serialize = getattr(hand_result, 'SerializeToString', None)
+    if serialize is not None:
+        data = serialize()
+        if len(data) == NUM_LANDMARKS * LANDMARK_BYTES and all(data[offset::LANDMARK_BYTES] == tags
+                                                               for offset, tags in LANDMARK_TAGS):
+            fields = np.frombuffer(data, LANDMARK_DTYPE)
+            out[:, 0] = fields['x']
+            out[:, 1] = fields['y']
+            out[:, 2] = fields['z']
+            return out
+    out[:] = [(lm.x, lm.y, lm.z) for lm in hand_result.landmark]
+    return out
+
+
+# Landmark pairs measured in one pass: the four tip->knuckle pairs, the four knuckle->wrist pairs,
+# then index tip->thumb tip (pinch), index tip->middle tip and index knuckle->middle knuckle (V ratio).
+# PAIR_MATRIX @ landmarks gives the (a - b) coordinate differences of all pairs in a single matmul;
+# with only +1/-1/0 coefficients the result is exactly a - b.
+PAIRS_A = [8, 12, 16, 20, 5, 9, 13, 17, 8, 8, 5]
+PAIRS_B = [5, 9, 13, 17, 0, 0, 0, 0, 4, 12, 9]
+PAIR_MATRIX = np.zeros((len(PAIRS_A), NUM_LANDMARKS))
+PAIR_MATRIX[np.arange(len(PAIRS_A)), PAIRS_A] += 1
+PAIR_MATRIX[np.arange(len(PAIRS_B)), PAIRS_B] -= 1
+
+
+# gesture_features:
+# Computes everything the threshold classifier looks at in one pass over a (21, 3) or (hands, 21, 3)
+# landmark array. Returns a dict of (hands,) arrays: 'finger' state (binary encoded open/closed state
+# of index..pinky, thumb bit always 0), 'pinch' distance between index and thumb tips, 'v_ratio' of the
+# index/middle tip spread to the knuckle spread and 'dz' depth difference of the index and middle tips.
+def gesture_features(landmarks):
+    pts = np.asarray(landmarks, np.float64)
+    if pts.ndim == 2:
+        pts = pts[None]
+    d = np.matmul(PAIR_MATRIX, pts)
+    sq = d[..., :2] ** 2
+    dist = np.sqrt(sq[..., 0] + sq[..., 1])
+
+    # signed distances, positive only when the first point is higher in the image (a.y < b.y)
+    signed = np.copysign(dist[:, :8], -d[:, :8, 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = signed[:, :4] / np.where(signed[:, 4:] == 0, 0.01, signed[:, 4:])
+        v_ratio = dist[:, 9] / dist[:, 10]
+    return {
+        'finger': (ratio >= FINGER_OPEN_RATIO) @ FINGER_BITS,
+        'pinch': dist[:, 8],
+        'v_ratio': v_ratio,
+        'dz': np.abs(d[:, 9, 2]),
+    }
+
+
+# finger_states:
+# Returns the binary encoded finger states for a (21, 3) or (hands, 21, 3) landmark array, as an int
+# array of shape (hands,).
+def finger_states(landmarks):
+    return gesture_features(landmarks)['finger']
+
+
+# classify_scalar:
+# classify() of one hand, given as a list of 21 [x, y, z] floats: returns (gesture, finger). Every
+# step mirrors the NumPy path in float64, including the sign of zero differences and the 0.01
+# substitute for a zero knuckle distance.
+def classify_scalar(pts, minor):
+    finger = 0
+    for tip, knuckle in FINGER_POINTS:
+        t, k, w = pts[tip], pts[knuckle], pts[0]
+        dy = t[1] - k[1]
+        a = math.copysign(math.sqrt((t[0] - k[0]) ** 2 + dy ** 2), -dy)
+        dy = k[1] - w[1]
+        b = math.copysign(math.sqrt((k[0] - w[0]) ** 2 + dy ** 2), -dy)
+        finger = finger << 1 | (a / (b if b != 0 else 0.01) >= FINGER_OPEN_RATIO)
+    if finger in (LAST3, LAST4):
+        # not math.hypot, which can differ from the NumPy path in the last bit
+        pinch = math.sqrt((pts[8][0] - pts[4][0]) ** 2 + (pts[8][1] - pts[4][1]) ** 2)
+        if pinch < PINCH_DIST:
+            return (PINCH_MINOR if minor else PINCH_MAJOR), finger
+    if finger == FIRST2:
+        spread = math.sqrt((pts[8][0] - pts[12][0]) ** 2 + (pts[8][1] - pts[12][1]) ** 2)
+        knuckles = math.sqrt((pts[5][0] - pts[9][0]) ** 2 + (pts[5][1] - pts[9][1]) ** 2)
+        if knuckles:
+            v_ratio = spread / knuckles
+        else:
+            v_ratio = math.inf if spread else math.nan
+        if v_ratio > V_RATIO:
+            return V_GEST, finger
+        if abs(pts[8][2] - pts[12][2]) < CLOSED_DZ:
+            return TWO_FINGER_CLOSED, finger
+        return MID, finger
+    return finger, finger
+
+
+# classify:
+# Returns the raw (not debounced) gesture code of every hand in the batch together with the finger
+# states, as int arrays of shape (hands,). 'minor' is a bool per hand telling whether it is the minor
+# hand, which decides between PINCH_MINOR and PINCH_MAJOR.
+def classify(landmarks, minor):
+    landmarks = np.asarray(landmarks)
+    if landmarks.ndim == 2 or len(landmarks) <= SCALAR_MAX_HANDS:
+        hands = landmarks.tolist()
+        if landmarks.ndim == 2:
+            hands = [hands]
+        results = [classify_scalar(pts, bool(m)) for pts, m in zip(hands, minor)]
+        return np.array([r[0] for r in results]), np.array([r[1] for r in results])
+    f = gesture_features(landmarks)
+    finger = f['finger']
+    pinch = ((finger == LAST3) | (finger == LAST4)) & (f['pinch'] < PINCH_DIST)
+    two = ~pinch & (finger == FIRST2)
+    gesture = np.where(pinch, np.where(minor, PINCH_MINOR, PINCH_MAJOR), finger)
+    if two.any():
+        spread = np.where(f['v_ratio'] > V_RATIO, V_GEST, np.where(f['dz'] < CLOSED_DZ, TWO_FINGER_CLOSED, MID))
+        gesture = np.where(two, spread, gesture)
+    return gesture, finger
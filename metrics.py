@@ -0,0 +1,184 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+
+# Pipeline metrics
+# ----------------
+# Lightweight always-on instrumentation: fixed-bucket latency histograms, a rolling frame rate,
+# counters and gauges read on demand. Recording a value is a bisect plus two additions, so it can stay
+# enabled in production. Metrics are exported in the Prometheus text format (/metrics) and as JSON
+# (/stats).
+
+# Latency buckets in seconds, from 0.1 ms to 1 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+BUILTIN_GAUGES = {'fps': 'Processed frames per second.', 'uptime_seconds': 'Seconds since the metrics were created.'}
+
+
+# Histogram class:
+# ----------------
+# Cumulative-style histogram over fixed upper bounds (plus +Inf). quantile() estimates a quantile by
+# linear interpolation inside the bucket it falls in.
+class Histogram:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+# RollingRate class:
+# ------------------
+# Events per second over the last 'window' events.
+class RollingRate:
+
+    def __init__(self, window=60):
+        self.times = deque(maxlen=window)
+
+    def tick(self, now=None):
+        self.times.append(time.monotonic() if now is None else now)
+
+    def rate(self):
+        if len(self.times) < 2:
+            return 0.0
+        span = self.times[-1] - self.times[0]
+        if span <= 0 or time.monotonic() - self.times[-1] > 2.0:
+            return 0.0
+        return (len(self.times) - 1) / span
+
+
+# Metrics class:
+# --------------
+# Registry of everything exported: per-stage latency histograms, named latency histograms (frame age,
+# action dispatch), the processed frame rate, counters (frames, dropped and stale frames, gestures by
+# name) and gauges, which are callables evaluated when the metrics are read.
+class Metrics:
+
+    def __init__(self, prefix='gesture'):
+        self.prefix = prefix
+        self.started = time.time()
+        self.stages = {}
+        self.latencies = {}
+        self.fps = RollingRate()
+        self.counters = Counter()
+        self.gestures = Counter()
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def observe_stage(self, stage, seconds):
+        hist = self.stages.get(stage)
+        if hist is None:
+            hist = self.stages[stage] = Histogram()
+        hist.observe(seconds)
+
+    def observe(self, name, seconds):
+        hist = self.latencies.get(name)
+        if hist is None:
+            hist = self.latencies[name] = Histogram()
+        hist.observe(seconds)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def count_gesture(self, name):
+        self.gestures[name] += 1
+
+    def frame(self, now=None):
+        self.fps.tick(now)
+        self.counters['frames_processed'] += 1
+
+    # add_gauge:
+    # Registers a callable returning the current value of a gauge (e.g. a queue depth).
+    def add_gauge(self, name, help_text, fn):
+        self.gauges[name] = (help_text, fn)
+
+    def _gauge_values(self):
+        values = {'fps': self.fps.rate(), 'uptime_seconds': time.time() - self.started}
+        for name, (_, fn) in list(self.gauges.items()):
+            try:
+                values[name] = fn()
+            except Exception:
+                values[name] = None
+        return values
+
+    # snapshot:
+    # JSON-serializable view of all metrics; latencies in milliseconds.
+    def snapshot(self):
+        def summary(hist):
+            def ms(v):
+                return None if v is None else round(v * 1000.0, 3)
+            return {'count': hist.count, 'mean_ms': ms(hist.sum / hist.count if hist.count else None),
+                    'p50_ms': ms(hist.quantile(0.5)), 'p95_ms': ms(hist.quantile(0.95)),
+                    'p99_ms': ms(hist.quantile(0.99))}
+
+        with self._lock:
+            return {
+                'gauges': self._gauge_values(),
+                'counters': dict(self.counters),
+                'gestures': dict(self.gestures),
+                'stages': {stage: summary(h) for stage, h in list(self.stages.items())},
+                'latencies': {name: summary(h) for name, h in list(self.latencies.items())},
+            }
+
+    # render_prometheus:
+    # All metrics in the Prometheus text exposition format.
+    def render_prometheus(self):
+        p = self.prefix
+        lines = []
+
+        def histogram(name, help_text, label, hists):
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} histogram")
+            for key, hist in hists:
+                cumulative = 0
+                for bound, n in zip(hist.buckets + (float('inf'),), hist.counts):
+                    cumulative += n
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{p}_{name}_bucket{{{label}="{key}",le="{le}"}} {cumulative}')
+                lines.append(f'{p}_{name}_sum{{{label}="{key}"}} {hist.sum}')
+                lines.append(f'{p}_{name}_count{{{label}="{key}"}} {hist.count}')
+
+        with self._lock:
+            histogram('stage_seconds', 'Time spent per frame in each pipeline stage.', 'stage',
+                      list(self.stages.items()))
+            histogram('latency_seconds', 'End-to-end latencies (frame age, action dispatch).', 'kind',
+                      list(self.latencies.items()))
+
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {p}_{name}_total counter")
+                lines.append(f"{p}_{name}_total {value}")
+
+            lines.append(f"# HELP {p}_gestures_total Frames in which each gesture was acted upon.")
+            lines.append(f"# TYPE {p}_gestures_total counter")
+            for name, value in sorted(self.gestures.items()):
+                lines.append(f'{p}_gestures_total{{gesture="{name}"}} {value}')
+
+            for name, value in self._gauge_values().items():
+                if value is None:
+                    continue
+                help_text = self.gauges[name][0] if name in self.gauges else BUILTIN_GAUGES[name]
+                lines.append(f"# HELP {p}_{name} {help_text}")
+                lines.append(f"# TYPE {p}_{name} gauge")
+                lines.append(f"{p}_{name} {float(value)}")
+        return '\n'.join(lines) + '\n'
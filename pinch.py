@@ -0,0 +1,196 @@
+import math
+import threading
+import time
+
+# Pinch engine
+# ------------
+# Continuous scrolling and volume control with a pinch. While a pinch is held, its displacement from
+# where it started (normalized frame units, see Controller.pinch_control) sets a target velocity:
+# nothing inside the 'deadzone', beyond it proportional to the distance past the deadzone, along the
+# dominant axis only. The output velocity follows the target with the time constant 'response' and,
+# once the pinch is released, keeps gliding and slows down with the time constant 'glide' (inertia;
+# scrolling only, the volume stops at once).
+#
+# The output runs on the engine's own clock at 'rate' ticks per second, independent of the camera and
+# inference rate: every tick integrates the velocities into per-output accumulators and emits at most
+# one change - the largest accumulated one of at least one output step - as a single scroll, hscroll or
+# volume change, so every tick makes at most one OS call. What is not emitted stays accumulated.
+# Offline (replays, regression runs) the engine has no thread and runs on the frame stamps instead:
+# the caller advances it to the stamp of every frame.
+
+# outputs: (vertical output, horizontal output) of a pinch mode
+MODES = {'scroll': ('scroll', 'hscroll'), 'volume': ('volume', None)}
+
+
+# PinchEngine class:
+# ------------------
+# 'dispatcher' (InputDispatcher) receives the scroll and hscroll amounts (wheel units), 'volume'
+# (VolumeController) the volume changes (fraction of the range). 'gains' is the speed per unit of
+# displacement past the deadzone, 'steps' the smallest change emitted, per output; a gliding output
+# stops below 'min_speed' steps per second. A pinch without an update for 'hold_timeout' seconds (e.g.
+# detection was stopped) counts as released. With 'realtime' the worker thread is started by the first
+# update() and sleeps while nothing moves; otherwise advance() runs the ticks due up to a frame stamp
+# and settle() lets the outputs run out at the end.
+class PinchEngine:
+
+    def __init__(self, dispatcher, volume, rate=60, deadzone=0.03, response=0.08, glide=0.35,
+                 gains=None, steps=None, min_speed=5.0, hold_timeout=0.3, realtime=True):
+        self.dispatcher = dispatcher
+        self.volume = volume
+        self.rate = rate
+        self.deadzone = deadzone
+        self.response = response
+        self.glide = glide
+        self.gains = dict({'scroll': 8000.0, 'hscroll': 8000.0, 'volume': 1.5}, **(gains or {}))
+        self.steps = dict({'scroll': 1, 'hscroll': 1, 'volume': 0.005}, **(steps or {}))
+        self.min_speed = min_speed
+        self.hold_timeout = hold_timeout
+        self.realtime = realtime
+        self.targets = dict.fromkeys(self.gains, 0.0)
+        self.velocity = dict.fromkeys(self.gains, 0.0)
+        self.pending = dict.fromkeys(self.gains, 0.0)
+        self.held = False
+        self.updated = None
+        self.stamp = None
+        self.ticks = 0
+        self.outputs = 0
+        self.running = False
+        self._last_tick = None
+        self._next_tick = None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self.running = True
+                self._thread = threading.Thread(target=self._run, name='pinch-engine', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    # update:
+    # Sets the target velocities from the displacement (dx to the right, dy upwards) of a pinch in
+    # 'mode' ('scroll' or 'volume'). 'stamp' is the capture time of the frame, the next change emitted
+    # is measured against it.
+    def update(self, mode, dx, dy, stamp=None):
+        vertical, horizontal = MODES[mode]
+        if horizontal is not None and abs(dx) > abs(dy):
+            axis, distance = horizontal, dx
+        else:
+            axis, distance = vertical, dy
+        excess = max(abs(distance) - self.deadzone, 0.0)
+        if self.realtime and self._thread is None:
+            self.start()
+        with self._cond:
+            for output in self.targets:
+                self.targets[output] = 0.0
+            self.targets[axis] = math.copysign(excess * self.gains[axis], distance)
+            self.held = True
+            self.updated = time.monotonic() if self.realtime or stamp is None else stamp
+            self.stamp = stamp
+            self._cond.notify()
+
+    # release:
+    # The pinch ended: scrolling glides to a stop, the volume stops.
+    def release(self):
+        with self._cond:
+            self._release()
+
+    def _release(self):
+        if self.held:
+            self.held = False
+            for output in self.targets:
+                self.targets[output] = 0.0
+            self.velocity['volume'] = 0.0
+
+    def moving(self):
+        return self.held or any(self.velocity.values())
+
+    # tick:
+    # One output step at time 'now'. Returns (output, amount) of the change emitted, or None.
+    def tick(self, now):
+        with self._cond:
+            dt = 1.0 / self.rate if self._last_tick is None else min(now - self._last_tick, 2.0 / self.rate)
+            self._last_tick = now
+            self.ticks += 1
+            if self.held and now - self.updated > self.hold_timeout:
+                self._release()
+            tau = self.response if self.held else self.glide
+            alpha = 1.0 if tau <= 0 else 1.0 - math.exp(-dt / tau)
+            for output, target in self.targets.items():
+                v = self.velocity[output]
+                v += (target - v) * alpha
+                if target == 0.0 and abs(v) < self.min_speed * self.steps[output]:
+                    v = 0.0
+                self.velocity[output] = v
+                self.pending[output] += v * dt
+            output = max(self.pending, key=lambda o: abs(self.pending[o]) / self.steps[o])
+            steps = int(self.pending[output] / self.steps[output])
+            if not steps:
+                if not self.moving():
+                    # leftovers below one step are dropped once everything stopped
+                    for o in self.pending:
+                        self.pending[o] = 0.0
+                return None
+            amount = steps * self.steps[output]
+            self.pending[output] -= amount
+            self.outputs += 1
+            # the first change after a frame is measured against its capture time, later ones against the tick
+            stamp, self.stamp = (self.stamp if self.stamp is not None else now), None
+        if output == 'volume':
+            self.volume.change(amount)
+        elif output == 'scroll':
+            self.dispatcher.scroll(amount, stamp=stamp)
+        else:
+            self.dispatcher.hscroll(amount, stamp=stamp)
+        return output, amount
+
+    # advance:
+    # Offline: runs the ticks due up to the frame stamp 'now', 'rate' per second of stamps. The first
+    # tick after the outputs stopped is at 'now'.
+    def advance(self, now):
+        period = 1.0 / self.rate
+        while True:
+            if not self.moving():
+                self._next_tick = None
+                self._last_tick = None
+                return
+            if self._next_tick is None:
+                self._next_tick = now
+            if self._next_tick > now:
+                return
+            self.tick(self._next_tick)
+            self._next_tick += period
+
+    # settle:
+    # Offline: releases the pinch and runs the ticks until the outputs stopped (at most 'max_seconds' of
+    # the engine clock), as if the frames had gone on without a pinch.
+    def settle(self, max_seconds=10.0):
+        self.release()
+        if self._next_tick is not None:
+            self.advance(self._next_tick + max_seconds)
+
+    def _run(self):
+        period = 1.0 / self.rate
+        next_tick = time.monotonic()
+        while True:
+            with self._cond:
+                while self.running and not self.moving():
+                    self._last_tick = None
+                    self._cond.wait()
+                if not self.running:
+                    break
+            now = time.monotonic()
+            self.tick(now)
+            next_tick = max(next_tick + period, now)
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
@@ -0,0 +1,454 @@
+import time
+import cv2
+import numpy as np
+from camera import BufferPool
+from prediction import LandmarkPredictor
+from tracing import TRACER
+
+# Handedness as seen in the mirrored frame
+MIRRORED_LABELS = {'Left': 'Right', 'Right': 'Left'}
+
+
+# StageTimer class:
+# -----------------
+# Keeps an exponential moving average (and the last value) of the time spent in each pipeline stage,
+# in milliseconds. If 'metrics' is set, every timing is also recorded in its stage histograms.
+class StageTimer:
+
+    def __init__(self, alpha=0.05, metrics=None):
+        self.alpha = alpha
+        self.metrics = metrics
+        self.avg = {}
+        self.last = {}
+        self.frames = 0
+
+    # add:
+    # Records 'seconds' spent in 'stage', which ended at 'end' (time.perf_counter(), default now; only
+    # used for the trace).
+    def add(self, stage, seconds, end=None):
+        if self.metrics is not None:
+            self.metrics.observe_stage(stage, seconds)
+        if TRACER.enabled:
+            TRACER.stage(stage, seconds, end)
+        ms = seconds * 1000.0
+        self.last[stage] = ms
+        prev = self.avg.get(stage)
+        self.avg[stage] = ms if prev is None else prev + self.alpha * (ms - prev)
+
+    def report(self):
+        total = sum(self.avg.values())
+        parts = [f"{stage} {ms:.2f}ms" for stage, ms in self.avg.items()]
+        return f"per-frame stage timings ({self.frames} frames): " + ", ".join(parts) + f", total {total:.2f}ms"
+
+
+# AdaptiveResolution class:
+# -------------------------
+# Chooses the scale at which frames are handed to detection so that the per-frame pipeline time fits
+# the budget of 'target_fps' on the machine it runs on. The scale steps down through 'scales' when the
+# moving average of the frame time exceeds the budget, and back up when it stays below 'headroom' of
+# the budget. After every change the average is left to settle for 'patience' frames.
+class AdaptiveResolution:
+
+    def __init__(self, target_fps, scales=(1.0, 0.75, 0.5, 0.375, 0.25), alpha=0.1, headroom=0.6,
+                 patience=30):
+        self.budget = 1.0 / target_fps
+        self.scales = scales
+        self.alpha = alpha
+        self.headroom = headroom
+        self.patience = patience
+        self.index = 0
+        self.avg = None
+        self.settle = 0
+
+    @property
+    def scale(self):
+        return self.scales[self.index]
+
+    def update(self, seconds):
+        self.avg = seconds if self.avg is None else self.avg + self.alpha * (seconds - self.avg)
+        if self.settle > 0:
+            self.settle -= 1
+            return
+        if self.avg > self.budget and self.index < len(self.scales) - 1:
+            self.index += 1
+        elif self.avg < self.budget * self.headroom and self.index > 0:
+            self.index -= 1
+        else:
+            return
+        self.settle = self.patience
+        self.avg = None
+
+
+# foreground_fraction:
+# Fraction of foreground pixels in the MOG2 mask of a (downscaled) frame after dilation and erosion.
+# A 'learning_rate' of 1 replaces the background model by the frame. The masks are kept in 'buffers'.
+def foreground_fraction(fgbg, kernel, small, buffers, learning_rate=-1):
+    shape = small.shape[:2]
+    fgmask = fgbg.apply(small, buffers.get('fgmask', shape), learning_rate)
+    mask = cv2.dilate(fgmask, kernel, dst=buffers.get('dilated', shape), iterations=1)
+    mask = cv2.erode(mask, kernel, dst=fgmask, iterations=1)
+    return cv2.countNonZero(mask) / float(mask.size)
+
+
+# IdleMonitor class:
+# ------------------
+# Power-saving state of a GestureController. After 'idle_after' processed frames in a row without
+# hands the controller goes idle: frames are no longer handed to the detection pipeline, instead only
+# 'check_fps' frames per second are downscaled to 'motion_size' and checked for motion with a MOG2
+# background model (the background is reset to the frame the controller went idle on). As soon as more
+# than 'wake_motion' of the pixels moved, full detection resumes on that frame.
+#
+# If 'metrics' is set, the time spent on motion checks is recorded as the 'idle_check' stage, the
+# transitions are counted ('idle_entered', 'idle_wakeups') and the wake-up latency is observed: the
+# time from the last motion check that saw nothing to the first frame with hands after waking up,
+# an upper bound of how long a hand entering the picture waited for detection.
+class IdleMonitor:
+
+    def __init__(self, idle_after=90, check_fps=5, wake_motion=0.01, motion_size=(64, 48), metrics=None):
+        self.idle_after = idle_after
+        self.check_period = 1.0 / check_fps
+        self.wake_motion = wake_motion
+        self.motion_size = motion_size
+        self.metrics = metrics
+        self.fgbg = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+        self.kernel = np.ones((3, 3), np.uint8)
+        self.buffers = BufferPool()
+        self.idle = False
+        self.empty_frames = 0
+        self.last_check = None
+        self.last_quiet = None
+        self.waking = False
+        self.checks = 0
+        self.idle_seconds = 0.0
+        self.idle_cpu = 0.0
+        self._idle_since = None
+
+    # update:
+    # Called with every frame that went through detection; goes idle after 'idle_after' frames
+    # without hands.
+    def update(self, frame, stamp, has_hands):
+        if has_hands:
+            self.empty_frames = 0
+            if self.waking:
+                self.waking = False
+                if self.metrics is not None and self.last_quiet is not None:
+                    self.metrics.observe('wake_latency', stamp - self.last_quiet)
+            return
+        self.empty_frames += 1
+        if self.empty_frames >= self.idle_after:
+            self.idle = True
+            self.waking = False
+            self.empty_frames = 0
+            self.last_check = self.last_quiet = stamp
+            self._idle_since = (time.monotonic(), time.process_time())
+            foreground_fraction(self.fgbg, self.kernel, self.downscale(frame), self.buffers, 1.0)
+            if self.metrics is not None:
+                self.metrics.count('idle_entered')
+
+    def downscale(self, frame):
+        small = self.buffers.get('small', (self.motion_size[1], self.motion_size[0]) + frame.shape[2:])
+        return cv2.resize(frame, self.motion_size, dst=small, interpolation=cv2.INTER_AREA)
+
+    # check:
+    # Called with every frame while idle. Returns True if the controller woke up and the frame has to
+    # go through detection.
+    def check(self, frame, stamp):
+        if stamp - self.last_check < self.check_period:
+            return False
+        self.last_check = stamp
+        self.checks += 1
+        t = time.perf_counter()
+        motion = foreground_fraction(self.fgbg, self.kernel, self.downscale(frame), self.buffers)
+        if self.metrics is not None:
+            self.metrics.observe_stage('idle_check', time.perf_counter() - t)
+        if motion <= self.wake_motion:
+            self.last_quiet = stamp
+            return False
+        self.wake()
+        if self.metrics is not None:
+            self.metrics.count('idle_wakeups')
+        return True
+
+    # wake:
+    # Leaves the idle state (e.g. on motion or when detection is restarted).
+    def wake(self):
+        if not self.idle:
+            return
+        self.idle = False
+        self.waking = True
+        self.empty_frames = 0
+        started, cpu = self._idle_since
+        self.idle_seconds += time.monotonic() - started
+        self.idle_cpu += time.process_time() - cpu
+        self._idle_since = None
+
+    # reset:
+    # Leaves the idle state without measuring a wake-up latency, e.g. when detection is resumed after a
+    # pause.
+    def reset(self):
+        self.wake()
+        self.waking = False
+
+    # totals:
+    # (seconds spent idle, CPU seconds the whole process used meanwhile), including the current idle
+    # period.
+    def totals(self):
+        seconds, cpu = self.idle_seconds, self.idle_cpu
+        since = self._idle_since
+        if since is not None:
+            seconds += time.monotonic() - since[0]
+            cpu += time.process_time() - since[1]
+        return seconds, cpu
+
+    # cpu_percent:
+    # CPU usage of the process while idle, in percent of one core.
+    def cpu_percent(self):
+        seconds, cpu = self.totals()
+        return 100.0 * cpu / seconds if seconds > 0 else 0.0
+
+
+# HandPipeline class:
+# -------------------
+# Long-lived hand detection pipeline. The MediaPipe Hands graph, the MOG2 background model and the
+# morphology kernel are created once and reused for every frame, so MediaPipe keeps its tracking state
+# between frames. The images detection runs on are written into reusable buffers (a BufferPool) and are
+# not mirrored: MediaPipe sees the camera image, and the landmarks and handedness are mirrored instead
+# of the pixels. Every preprocessing stage is optional and feeds into detection:
+#   detect_size  - (width, height) the frame is resized to before hands.process (landmarks are
+#                  normalized, so they are unaffected)
+#   blur         - Gaussian blur of the detection image to reduce noise
+#   motion_gate  - MOG2 background subtraction + dilation/erosion on a small copy of the frame. When
+#                  less than 'motion_threshold' of the pixels are foreground nothing can have moved,
+#                  so the previous detection result is reused instead of running hands.process again
+#                  (at most 'max_reuse' frames in a row).
+#   roi          - detection runs on a crop around the hands found in the previous frame, enlarged by
+#                  'roi_margin' of the hand size on every side, and the landmarks are mapped back to
+#                  full-frame coordinates. The crop only moves when the hands come close to its border,
+#                  so MediaPipe's own tracking stays valid between frames. When no hand was found the
+#                  whole frame is searched at 'search_scale'; if the crop loses the hands the full
+#                  frame is searched again in the same frame.
+#   target_fps   - an AdaptiveResolution picks the scale of the detection input to reach this rate
+#                  (instead of the fixed detect_size).
+#   detect_every - full inference only runs on every n-th frame, or as soon as the motion level exceeds
+#                  'detect_motion'. On the frames in between the landmarks are predicted by a
+#                  LandmarkPredictor from their velocity, so every frame still gets results.
+class HandPipeline:
+
+    def __init__(self, max_num_hands=2, min_detection_confidence=0.5, min_tracking_confidence=0.5,
+                 detect_size=None, blur=False, motion_gate=False, motion_size=(100, 100),
+                 motion_threshold=0.002, max_reuse=15, roi=False, roi_margin=0.35, roi_min_size=0.2,
+                 search_scale=0.5, target_fps=None, detect_every=1, detect_motion=0.03):
+        # mediapipe takes about a second to import, so it is only imported with the first pipeline
+        import mediapipe as mp
+        self.hands = mp.solutions.hands.Hands(max_num_hands=max_num_hands,
+                                              min_detection_confidence=min_detection_confidence,
+                                              min_tracking_confidence=min_tracking_confidence)
+        self.detect_size = detect_size
+        self.blur = blur
+        self.motion_gate = motion_gate
+        self.motion_size = motion_size
+        self.motion_threshold = motion_threshold
+        self.max_reuse = max_reuse
+        self.fgbg = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+        self.kernel = np.ones((5, 5), np.uint8)
+        self.buffers = BufferPool()
+        self.roi = roi
+        self.roi_margin = roi_margin
+        self.roi_min_size = roi_min_size
+        self.search_scale = search_scale
+        self.adaptive = AdaptiveResolution(target_fps) if target_fps else None
+        self.detect_every = detect_every
+        self.detect_motion = detect_motion
+        self.predictor = LandmarkPredictor() if detect_every > 1 else None
+        self.since_detect = 0
+        self.predicted = 0
+        self.crop = None
+        self.roi_lost = 0
+        self.timer = StageTimer()
+        self.results = None
+        self.reused = 0
+        self.motion = 1.0
+
+    def close(self):
+        self.hands.close()
+
+    # warm_up:
+    # Runs MediaPipe once on a blank frame, so that the first real frame does not pay for the
+    # initialization of the graph. None of the pipeline's own state (motion, ROI, timing) is touched.
+    def warm_up(self, size=(640, 480)):
+        self.hands.process(np.zeros((size[1], size[0], 3), np.uint8))
+
+    # motion_level:
+    # Fraction of foreground pixels in the cleaned-up MOG2 mask of a downscaled copy of the frame.
+    def motion_level(self, frame):
+        small = self.buffers.get('motion', (self.motion_size[1], self.motion_size[0]) + frame.shape[2:])
+        cv2.resize(frame, self.motion_size, dst=small, interpolation=cv2.INTER_AREA)
+        return foreground_fraction(self.fgbg, self.kernel, small, self.buffers)
+
+    # hand_bounds:
+    # (x0, y0, x1, y1) bounding box of all hands of a result in normalized coordinates of the unmirrored
+    # frame, or None without hands.
+    @staticmethod
+    def hand_bounds(results):
+        if results is None or not results.multi_hand_landmarks:
+            return None
+        x0 = y0 = 1.0
+        x1 = y1 = 0.0
+        for hand_landmarks in results.multi_hand_landmarks:
+            for lm in hand_landmarks.landmark:
+                x = 1.0 - lm.x
+                x0, x1 = min(x0, x), max(x1, x)
+                y0, y1 = min(y0, lm.y), max(y1, lm.y)
+        return x0, y0, x1, y1
+
+    # roi_crop:
+    # Pixel rectangle (c0, r0, c1, r1) of the frame to run detection on, based on the hands of the
+    # previous results, or None if the whole frame has to be searched. The current crop is kept while
+    # it still contains the hands with half the margin and is not much larger than needed.
+    def roi_crop(self, width, height):
+        bounds = self.hand_bounds(self.results)
+        if bounds is None:
+            self.crop = None
+            return None
+        x0, y0, x1, y1 = bounds
+        size = max(x1 - x0, y1 - y0)
+        if self.crop is not None:
+            c0, r0, c1, r1 = self.crop
+            inner = self.roi_margin * 0.5 * size
+            if (c0 <= (x0 - inner) * width and c1 >= (x1 + inner) * width and r0 <= (y0 - inner) * height
+                    and r1 >= (y1 + inner) * height
+                    and (c1 - c0) * (r1 - r0) < 4.0 * max(size, self.roi_min_size) ** 2 * width * height):
+                return self.crop
+        pad = self.roi_margin * size
+        cx, cy = (x0 + x1) / 2.0, (y0 + y1) / 2.0
+        half_w = max((x1 - x0) / 2.0 + pad, self.roi_min_size / 2.0)
+        half_h = max((y1 - y0) / 2.0 + pad, self.roi_min_size / 2.0)
+        c0, c1 = int(max(cx - half_w, 0.0) * width), int(min(cx + half_w, 1.0) * width + 0.5)
+        r0, r1 = int(max(cy - half_h, 0.0) * height), int(min(cy + half_h, 1.0) * height + 0.5)
+        if c1 - c0 < 32 or r1 - r0 < 32:
+            self.crop = None
+            return None
+        self.crop = (c0, r0, c1, r1)
+        return self.crop
+
+    # mirror:
+    # Converts the landmarks detected on the unmirrored frame, or on its 'crop', to normalized
+    # coordinates of the whole mirrored frame, in place, and swaps the handedness labels, which MediaPipe
+    # determines assuming a mirrored image. z is scaled like x, which MediaPipe measures it against.
+    @staticmethod
+    def mirror(results, crop, width, height):
+        if crop is None:
+            ox, oy, sx, sy = 1.0, 0.0, 1.0, 1.0
+        else:
+            c0, r0, c1, r1 = crop
+            sx, sy = (c1 - c0) / float(width), (r1 - r0) / float(height)
+            ox, oy = (width - c0) / float(width), r0 / float(height)
+        for hand_landmarks in results.multi_hand_landmarks:
+            for lm in hand_landmarks.landmark:
+                lm.x = ox - lm.x * sx
+                lm.y = oy + lm.y * sy
+                lm.z = lm.z * sx
+        for classification_list in results.multi_handedness or []:
+            for classification in classification_list.classification:
+                classification.label = MIRRORED_LABELS.get(classification.label, classification.label)
+
+    # detect:
+    # Resizes (scale < 1 or detect_size), converts and optionally blurs the frame or its 'crop' into
+    # the pipeline's buffers, runs hand detection on it and returns the results mirrored to the whole
+    # frame (see mirror).
+    def detect(self, frame, scale=1.0, crop=None):
+        timer = self.timer
+        buffers = self.buffers
+        height, width = frame.shape[:2]
+        image = frame
+        if crop is not None:
+            c0, r0, c1, r1 = crop
+            image = frame[r0:r1, c0:c1]
+        size = None
+        if self.detect_size is not None and self.adaptive is None and crop is None:
+            size = tuple(self.detect_size)
+        elif scale < 1.0:
+            size = (max(int(image.shape[1] * scale), 32), max(int(image.shape[0] * scale), 32))
+        if size is not None:
+            t = time.perf_counter()
+            image = cv2.resize(image, size, dst=buffers.get('resized', (size[1], size[0], 3)),
+                               interpolation=cv2.INTER_AREA)
+            timer.add('resize', time.perf_counter() - t)
+
+        t = time.perf_counter()
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=buffers.get('rgb', image.shape))
+        timer.add('convert', time.perf_counter() - t)
+
+        if self.blur:
+            t = time.perf_counter()
+            image = cv2.GaussianBlur(image, (5, 5), 0, dst=buffers.get('blurred', image.shape))
+            timer.add('blur', time.perf_counter() - t)
+
+        t = time.perf_counter()
+        # read-only, so MediaPipe wraps the buffer instead of copying it
+        image.flags.writeable = False
+        results = self.hands.process(image)
+        timer.add('detect', time.perf_counter() - t)
+
+        if results.multi_hand_landmarks:
+            t = time.perf_counter()
+            self.mirror(results, crop, width, height)
+            timer.add('mirror', time.perf_counter() - t)
+        return results
+
+    # process:
+    # Runs the enabled stages on a BGR camera frame and returns the MediaPipe results for the mirrored
+    # frame. 'stamp' is the capture time of the frame (time.monotonic()), which landmark prediction
+    # extrapolates to. Stage timings are recorded in self.timer.
+    def process(self, frame, stamp=None):
+        timer = self.timer
+        timer.frames += 1
+        if stamp is None:
+            stamp = time.monotonic()
+
+        if self.motion_gate or self.predictor is not None:
+            t = time.perf_counter()
+            self.motion = self.motion_level(frame)
+            timer.add('motion', time.perf_counter() - t)
+        if self.motion_gate:
+            if (self.motion < self.motion_threshold and self.results is not None
+                    and self.reused < self.max_reuse):
+                self.reused += 1
+                return self.results
+        self.reused = 0
+
+        if self.predictor is not None:
+            if (self.since_detect < self.detect_every - 1 and self.motion <= self.detect_motion
+                    and self.results is not None):
+                self.since_detect += 1
+                self.predicted += 1
+                t = time.perf_counter()
+                self.results = self.predictor.predict(stamp)
+                timer.add('predict', time.perf_counter() - t)
+                return self.results
+            self.since_detect = 0
+
+        start = time.perf_counter()
+        scale = self.adaptive.scale if self.adaptive is not None else 1.0
+        if not self.roi:
+            results = self.detect(frame, scale)
+        else:
+            height, width = frame.shape[:2]
+            crop = self.roi_crop(width, height)
+            results = None
+            if crop is not None:
+                c0, r0, c1, r1 = crop
+                # crops of hands close to the camera are scaled down like full frames
+                crop_scale = min(1.0, scale * width / float(c1 - c0)) if self.adaptive is not None else 1.0
+                results = self.detect(frame, crop_scale, crop)
+                if not results.multi_hand_landmarks:
+                    self.roi_lost += 1
+                    self.crop = None
+            if not results or not results.multi_hand_landmarks:
+                results = self.detect(frame, min(scale, self.search_scale))
+        if self.adaptive is not None:
+            self.adaptive.update(time.perf_counter() - start)
+        if self.predictor is not None:
+            self.predictor.update(results, stamp)
+        self.results = results
+        return results
@@ -0,0 +1,84 @@
+import copy
+import numpy as np
+from types import SimpleNamespace
+
+# Landmark prediction
+# -------------------
+# Between two runs of hand detection the landmarks are extrapolated with a constant-velocity model,
+# so the gesture logic and the cursor still get a fresh position every frame. Each hand is filtered
+# with the steady-state form of a constant-velocity Kalman filter (an alpha-beta filter) on all 21 x 3
+# coordinates at once.
+
+
+# LandmarkPredictor class:
+# ------------------------
+# update() feeds the results of a detection frame, predict() returns results shaped like the output of
+# hands.process() with the landmarks moved along their estimated velocity to the given time. Detected
+# hands are associated with the filtered ones by wrist distance; hands no longer detected are dropped.
+# Predictions are never extrapolated further than 'max_horizon' seconds past the last detection.
+class LandmarkPredictor:
+
+    def __init__(self, alpha=0.85, beta=0.4, max_horizon=0.25, match_distance=0.3):
+        self.alpha = alpha
+        self.beta = beta
+        self.max_horizon = max_horizon
+        self.match_distance = match_distance
+        self.positions = np.zeros((0, 21, 3))
+        self.velocities = np.zeros((0, 21, 3))
+        self.handedness = None
+        self.messages = []
+        self.stamp = None
+
+    def has_hands(self):
+        return len(self.positions) > 0
+
+    def reset(self):
+        self.positions = np.zeros((0, 21, 3))
+        self.velocities = np.zeros((0, 21, 3))
+        self.messages = []
+        self.handedness = None
+        self.stamp = None
+
+    # update:
+    # Corrects the filter with the landmarks of a detection frame taken at 'stamp' (seconds).
+    def update(self, results, stamp):
+        if not results.multi_hand_landmarks:
+            self.reset()
+            self.stamp = stamp
+            return
+        measured = np.array([[(lm.x, lm.y, lm.z) for lm in hand.landmark] for hand in results.multi_hand_landmarks])
+        positions = measured.copy()
+        velocities = np.zeros_like(measured)
+        dt = stamp - self.stamp if self.stamp is not None else 0.0
+        if len(self.positions) and dt > 0:
+            predicted = self.positions + self.velocities * dt
+            taken = set()
+            for i in range(len(measured)):
+                dist = np.linalg.norm(predicted[:, 0, :2] - measured[i, 0, :2], axis=1)
+                for j in np.argsort(dist):
+                    if j not in taken and dist[j] <= self.match_distance:
+                        taken.add(j)
+                        residual = measured[i] - predicted[j]
+                        positions[i] = predicted[j] + self.alpha * residual
+                        velocities[i] = self.velocities[j] + self.beta * residual / dt
+                        break
+        self.positions, self.velocities = positions, velocities
+        self.handedness = results.multi_handedness
+        if len(self.messages) != len(measured):
+            self.messages = [copy.deepcopy(hand) for hand in results.multi_hand_landmarks]
+        self.stamp = stamp
+
+    # predict:
+    # Results for time 'stamp' extrapolated from the last update. The landmark messages are reused
+    # between calls and overwritten with the predicted coordinates.
+    def predict(self, stamp):
+        if not len(self.positions):
+            return SimpleNamespace(multi_hand_landmarks=None, multi_handedness=None)
+        dt = min(max(stamp - self.stamp, 0.0), self.max_horizon)
+        predicted = (self.positions + self.velocities * dt).tolist()
+        for message, hand in zip(self.messages, predicted):
+            for lm, (x, y, z) in zip(message.landmark, hand):
+                lm.x = x
+                lm.y = y
+                lm.z = z
+        return SimpleNamespace(multi_hand_landmarks=self.messages, multi_handedness=self.handedness)
@@ -0,0 +1,177 @@
+import argparse
+import time
+import traceback
+from collections import Counter
+import cv2
+from camera import open_source
+from gesture_detection import Controller, GestureController, Gest
+from gesture_model import GestureModel
+from input_dispatch import InputDispatcher, RecordingBackend
+from traces import TracePipeline
+from volume import MemoryVolumeBackend, VolumeController
+
+# Offline replay
+# --------------
+# Runs the gesture pipeline without a webcam and without touching the real mouse or volume:
+#
+#   python replay.py record VIDEO_OR_DIR_OR_synthetic TRACE.jsonl   detection + gestures, writes a trace
+#   python replay.py run TRACE.jsonl [--repeat N] [--model M]       gestures/actions only, from a trace
+#
+# Frames are processed one after the other as fast as possible (no frames are dropped) and the
+# throughput, gesture counts and the actions that would have been sent to the OS are reported. An
+# exception raised while processing a frame is counted and the first one of each kind is printed with
+# its frame number, so a bad session can be reproduced without the run stopping at the first error.
+
+
+# offline_controller:
+# Returns (controller, backend, volume): a Controller whose outputs are a RecordingBackend and an
+# in-memory volume, so replays have no side effects. The InputDispatcher moves the cursor immediately
+# ('move_duration' 0) to keep the recording compact, and the pinch engines run on the frame stamps, so
+# pinch scrolling and volume changes do not depend on how fast the frames are processed.
+def offline_controller():
+    backend = RecordingBackend()
+    volume = MemoryVolumeBackend()
+    controller = Controller(InputDispatcher(backend, move_duration=0), VolumeController(lambda: volume),
+                            realtime=False)
+    return controller, backend, volume
+
+
+# process:
+# Processes one frame captured at 'stamp' (default now), recording instead of raising any exception.
+def process(gc, frame, index, gestures, errors, stamp=None):
+    try:
+        gc.process_frame(frame, stamp)
+    except Exception as e:
+        key = f"{type(e).__name__}: {e}"
+        if key not in errors:
+            print(f"Error in frame {index}:")
+            traceback.print_exc()
+        errors[key] += 1
+        return
+    count_gesture(gestures, gc)
+
+
+def summarize(name, frames, elapsed, gestures, errors, controller, backend, volume, timer):
+    controller.settle()
+    controller.stop()
+    controller.dispatcher.flush()
+    controller.volume.flush()
+    actions = Counter(call[1] for call in backend.calls)
+    print(f"{name}: {frames} frames in {elapsed:.3f}s = {frames / max(elapsed, 1e-9):.1f} fps")
+    print(f"  gestures:  {dict(gestures)}")
+    print(f"  actions:   {dict(actions)}")
+    print(f"  volume:    {volume.sets} changes, level {volume.level:.3f}")
+    for error, count in errors.items():
+        print(f"  error:     {count} x {error}")
+    if timer.avg:
+        print(f"  {timer.report()}")
+    return {'frames': frames, 'elapsed': elapsed, 'gestures': dict(gestures), 'actions': dict(actions),
+            'errors': dict(errors)}
+
+
+def count_gesture(gestures, gc):
+    if gc.last_gesture is not None:
+        gesture = gc.last_gesture
+        gestures[Gest(gesture).name if gesture in Gest._value2member_map_ else str(gesture)] += 1
+
+
+# frame_period:
+# Seconds between two frames on the timeline of a recorded source: the frame rate of a video file, 30
+# fps for image directories and synthetic frames (as when they are paced), None for a capture device,
+# whose frames are stamped when they are read.
+def frame_period(source):
+    if isinstance(source, cv2.VideoCapture):
+        return None
+    return getattr(source, 'period', None) or 1.0 / 30
+
+
+# record:
+# Runs detection and the gesture logic over every frame of a source and writes a landmark trace. The
+# frames are stamped on the source's own timeline (frame index x frame period), so the trace keeps the
+# timing of the video however fast detection runs.
+def record(source_spec, trace_path, limit=None, **pipeline_options):
+    controller, backend, volume = offline_controller()
+    source = open_source(source_spec, realtime=False)
+    gc = GestureController(controller=controller, **pipeline_options)
+    gc.timing_report_every = 0
+    gc.start_recording(trace_path)
+    gestures = Counter()
+    errors = Counter()
+    frames = 0
+    period = frame_period(source)
+    start = time.perf_counter()
+    t0 = time.monotonic()
+    try:
+        while source.isOpened() and (limit is None or frames < limit):
+            success, frame = source.read()
+            if not success:
+                break
+            process(gc, frame, frames, gestures, errors, t0 + frames * period if period else None)
+            frames += 1
+    finally:
+        gc.stop_recording()
+        gc.pipeline.close()
+        source.release()
+    return summarize('record', frames, time.perf_counter() - start, gestures, errors, controller, backend, volume,
+                     gc.pipeline.timer)
+
+
+# replay:
+# Drives HandRecog and the Controller from a landmark trace, 'repeat' times in a row, optionally with a
+# learned gesture classifier ('model', see gesture_model.py). Every frame is stamped with its recorded
+# time, so the time-based parts (dynamic gestures, cursor filters) see the recorded timeline however
+# fast the replay runs.
+def replay(trace_path, repeat=1, model=None):
+    controller, backend, volume = offline_controller()
+    pipeline = TracePipeline(trace_path)
+    classifier = GestureModel.load(model).classify if model else None
+    gc = GestureController(pipeline=pipeline, controller=controller, classifier=classifier)
+    gestures = Counter()
+    errors = Counter()
+    frames = 0
+    start = time.perf_counter()
+    t0 = time.monotonic()
+    for _ in range(repeat):
+        pipeline.index = 0
+        for _ in range(len(pipeline)):
+            process(gc, None, pipeline.index, gestures, errors, t0 + pipeline.times[pipeline.index])
+            frames += 1
+        t0 += pipeline.duration
+    return summarize('replay', frames, time.perf_counter() - start, gestures, errors, controller, backend, volume,
+                     pipeline.timer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline replay of the gesture pipeline')
+    sub = parser.add_subparsers(dest='command', required=True)
+    rec = sub.add_parser('record', help='run detection over a video file, image directory or synthetic frames')
+    rec.add_argument('source')
+    rec.add_argument('trace')
+    rec.add_argument('--limit', type=int, default=None, help='stop after this many frames')
+    rec.add_argument('--detect-size', default=None, help='WIDTHxHEIGHT of the detection input')
+    rec.add_argument('--roi', action='store_true', help='detect on a crop around the tracked hands')
+    rec.add_argument('--detect-every', type=int, default=1, help='run detection on every n-th frame only')
+    rec.add_argument('--target-fps', type=float, default=None, help='adapt the detection input resolution')
+    run = sub.add_parser('run', help='replay a landmark trace')
+    run.add_argument('trace')
+    run.add_argument('--repeat', type=int, default=1)
+    run.add_argument('--model', default=None, help='learned gesture classifier instead of the thresholds')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        options = {}
+        if args.detect_size:
+            options['detect_size'] = tuple(int(v) for v in args.detect_size.split('x'))
+        if args.roi:
+            options['roi'] = True
+        if args.detect_every > 1:
+            options['detect_every'] = args.detect_every
+        if args.target_fps:
+            options['target_fps'] = args.target_fps
+        record(args.source, args.trace, args.limit, **options)
+    else:
+        replay(args.trace, args.repeat, args.model)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+import os
+import re
+import threading
+import time
+from camera import CameraProducer
+from cursor_filters import CursorEngine
+from gesture_detection import Controller, GestureController
+from gesture_model import GestureModel
+from inference import ProcessPipeline
+from metrics import Metrics
+from pipeline import HandPipeline, IdleMonitor
+from input_dispatch import InputDispatcher, RecordingBackend
+from streaming import FrameBroadcaster, LandmarkStream
+from volume import MemoryVolumeBackend, VolumeController, make_volume_backend
+
+# Sessions
+# --------
+# A session is one camera stream with its own gesture state: its own CameraProducer,
+# GestureController and Controller, mapping profile (mappings file), output sink and video feed.
+# Sessions share nothing but the (optional) InferencePool their hand detection runs in, so several
+# streams, e.g. kiosks, can be served by one process.
+
+# Output sinks: 'os' injects mouse events and volume changes into the system, 'record' only records
+# them (RecordingBackend / MemoryVolumeBackend), e.g. for sessions that are only watched.
+OUTPUTS = ('os', 'record')
+
+# Mapping profiles and media files are requested by plain name, never by path
+PLAIN_NAME = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.-]*')
+
+
+# inside:
+# The path of the file 'name' + 'suffix' in 'directory', or a ValueError naming 'what' if 'name' is not
+# a plain name or the path resolves to outside of the directory (e.g. through a symbolic link).
+def inside(directory, name, what, suffix=''):
+    if not PLAIN_NAME.fullmatch(name) or '..' in name:
+        raise ValueError(f"Invalid {what} {name!r}")
+    base = os.path.realpath(directory)
+    path = os.path.realpath(os.path.join(base, name + suffix))
+    if os.path.dirname(path) != base:
+        raise ValueError(f"Invalid {what} {name!r}")
+    return path
+
+
+# profile_path:
+# Path of the mapping profile 'name' requested by a client: 'default' is the default mappings file,
+# any other profile must exist as NAME.txt in 'directory'.
+def profile_path(name, directory, default='mappings.txt'):
+    if name == 'default':
+        return default
+    path = inside(directory, name, 'mappings profile', '.txt')
+    if not os.path.isfile(path):
+        raise ValueError(f"Unknown mappings profile {name!r}")
+    return path
+
+
+# client_source:
+# camera.open_source spec of a source requested by a client: a device index, 'synthetic' or
+# 'synthetic:WIDTHxHEIGHT', or the name of a video file or image directory in 'media_dir' (None
+# allows no files).
+def client_source(spec, media_dir=None):
+    spec = str(spec)
+    if re.fullmatch(r'[0-9]+|synthetic(:[0-9]+x[0-9]+)?', spec):
+        return spec
+    if media_dir is None:
+        raise ValueError(f"Invalid source {spec!r}, expected a device index or 'synthetic'")
+    path = inside(media_dir, spec, 'source')
+    if not os.path.exists(path):
+        raise ValueError(f"Unknown source {spec!r}")
+    return path
+
+
+# Session class:
+# --------------
+# 'source' is anything camera.open_source accepts. 'detection_options' are passed on to HandPipeline;
+# with a 'pool' detection runs in the pool's worker processes. Creating a session opens no device and
+# loads no model: start() opens the camera while the detection pipeline is built, then starts the
+# processing loop (paused until 'active' is set) and the video feed. warm_up() builds the pipeline
+# ahead of start() in the background; 'metrics' exist before the session starts. 'idle_options'
+# configure the IdleMonitor that pauses detection while no hands are in view (None keeps detection
+# running).
+# 'gesture_model' is the path of a learned gesture classifier (see gesture_model.py) used instead of
+# the threshold classifier.
+class Session:
+
+    def __init__(self, session_id, source=0, mappings_path='mappings.txt', output='os', pool=None,
+                 detection_options=None, idle_options=None, gesture_model=None, cursor_filter='dampening',
+                 cursor_predict=False, video_quality=80, video_size=None, video_max_fps=30):
+        if output not in OUTPUTS:
+            raise ValueError(f"Unknown output {output!r}, expected one of {', '.join(OUTPUTS)}")
+        self.id = session_id
+        self.source = source
+        self.output = output
+        self.pool = pool
+        self.detection_options = dict(detection_options or {})
+        self.idle_options = idle_options
+        self.classifier = GestureModel.load(gesture_model).classify if gesture_model else None
+        self.active = threading.Event()
+        self.recorded = None
+        if output == 'record':
+            self.recorded = RecordingBackend()
+            memory_volume = MemoryVolumeBackend()
+            dispatcher = InputDispatcher(self.recorded)
+            volume = VolumeController(lambda: memory_volume)
+        else:
+            dispatcher = InputDispatcher()
+            volume = VolumeController(make_volume_backend)
+        self.controller = Controller(dispatcher, volume, CursorEngine(cursor_filter, predict=cursor_predict),
+                                     mappings_path)
+        self.camera = CameraProducer(source)
+        self.gc = None
+        self.broadcaster = None
+        self.landmarks = LandmarkStream()
+        self.metrics = Metrics()
+        self.video_options = dict(quality=video_quality, size=video_size, max_fps=video_max_fps)
+        self.startup = {}
+        self._pipeline = None
+        self._warm_up = None
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self.metrics.add_gauge('started', '1 once the camera is open and detection is set up.',
+                               lambda: int(self.gc is not None))
+        self.metrics.add_gauge('startup_camera_seconds', 'Time to open the camera and read its first frame.',
+                               lambda: self.startup.get('camera'))
+        self.metrics.add_gauge('startup_pipeline_seconds', 'Time to build and warm up the detection pipeline.',
+                               lambda: self.startup.get('pipeline'))
+
+    # warm_up:
+    # Builds the detection pipeline and warms it up (loads the MediaPipe graph and runs it once, or
+    # starts the pool's workers) on a background thread. start() picks the pipeline up.
+    def warm_up(self):
+        if self._warm_up is None and self.gc is None:
+            self._warm_up = threading.Thread(target=self.build_pipeline, name=f'warm-up-{self.id}', daemon=True)
+            self._warm_up.start()
+        return self
+
+    # build_pipeline:
+    # Warm-up thread. Errors are left to start(), which builds the pipeline again to raise them.
+    def build_pipeline(self):
+        t = time.perf_counter()
+        try:
+            if self.pool is not None:
+                pipeline = ProcessPipeline(pool=self.pool, **self.detection_options)
+            else:
+                pipeline = HandPipeline(**self.detection_options)
+            pipeline.warm_up()
+        except Exception as e:
+            print(f"Warm-up of session {self.id} failed: {e}")
+            return
+        self._pipeline = pipeline
+        self.startup['pipeline'] = time.perf_counter() - t
+
+    # start:
+    # Starts the session if it is not running yet; safe to call from several request threads. Raises
+    # ValueError if the source can not be opened or delivers no frame and RuntimeError if hand detection
+    # can not be set up (e.g. the inference workers do not start).
+    def start(self):
+        with self._start_lock:
+            if self.gc is None:
+                self._start()
+        return self
+
+    def _start(self):
+        # The camera opens on this thread while the pipeline is built on the warm-up thread
+        self.warm_up()
+        t = time.perf_counter()
+        self.camera.start()
+        self.startup['camera'] = time.perf_counter() - t
+        if not self.camera.is_running() or self.camera.ring is None:
+            self.camera.stop()
+            raise ValueError(f"Could not read frames from source {str(self.source)!r} of session {self.id}")
+        self._warm_up.join()
+        if self._pipeline is None:
+            self.build_pipeline()
+            if self._pipeline is None:
+                self.camera.stop()
+                raise RuntimeError(f"Could not set up hand detection for session {self.id}")
+        pipeline, self._pipeline = self._pipeline, None
+        idle = IdleMonitor(**self.idle_options) if self.idle_options is not None else None
+        self.gc = GestureController(self.camera, pipeline, self.controller, idle, self.classifier, self.metrics)
+        self.gc.landmark_stream = self.landmarks
+        self._thread = threading.Thread(target=self.gc.run, args=(self.active,), name=f'session-{self.id}',
+                                        daemon=True)
+        self._thread.start()
+        self.broadcaster = FrameBroadcaster(self.camera, annotate=self.draw_hands, **self.video_options).start()
+        self.add_gauges()
+
+    def stop(self):
+        if self._warm_up is not None:
+            self._warm_up.join()
+        if self._pipeline is not None:
+            self._pipeline.close()
+            self._pipeline = None
+        if self.gc is not None:
+            self.gc.gc_mode = 0
+        self.active.set()
+        if self.broadcaster is not None:
+            self.broadcaster.stop()
+        self.landmarks.stop()
+        self.camera.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+        # let go of a held drag or pinch and send the mouse_up before the dispatcher stops
+        self.controller.release_all()
+        self.controller.stop()
+        self.controller.dispatcher.flush()
+        self.controller.dispatcher.stop()
+        self.controller.volume.stop()
+
+    # draw_hands:
+    # Draws the hand landmarks currently tracked by the session's GestureController onto a (flipped)
+    # frame of its video feed.
+    def draw_hands(self, frame):
+        import mediapipe as mp
+        gc = self.gc
+        if gc.hr_major:
+            mp.solutions.drawing_utils.draw_landmarks(frame, gc.hr_major, mp.solutions.hands.HAND_CONNECTIONS)
+        if gc.hr_minor:
+            mp.solutions.drawing_utils.draw_landmarks(frame, gc.hr_minor, mp.solutions.hands.HAND_CONNECTIONS)
+
+    # add_gauges:
+    # Gauges read when the metrics of the session are requested.
+    def add_gauges(self):
+        gc, camera, broadcaster, dispatcher = self.gc, self.camera, self.broadcaster, self.controller.dispatcher
+        landmarks = self.landmarks
+        metrics = self.metrics
+        metrics.add_gauge('camera_fps', 'Capture frame rate.', camera.fps)
+        metrics.add_gauge('camera_read_failures', 'Failed reads from the capture device.', lambda: camera.dropped)
+        metrics.add_gauge('input_queue_depth', 'Commands waiting for the input dispatcher.', dispatcher.queue_depth)
+        metrics.add_gauge('input_moves_coalesced', 'Cursor moves replaced by a newer target.',
+                          lambda: dispatcher.coalesced)
+        metrics.add_gauge('input_commands_dropped', 'Commands dropped because the input queue was full.',
+                          lambda: dispatcher.dropped)
+        metrics.add_gauge('input_command_errors', 'Input commands whose OS call raised an error.',
+                          lambda: dispatcher.errors)
+        metrics.add_gauge('pinch_outputs', 'Scroll and volume changes emitted by the pinch engines.',
+                          self.controller.pinch_outputs)
+        metrics.add_gauge('video_feed_viewers', 'Connected /video_feed clients.', lambda: broadcaster.subscribers)
+        metrics.add_gauge('video_feed_encodes', 'Frames encoded for the video feed.',
+                          lambda: broadcaster.encode_count)
+        metrics.add_gauge('video_feed_frames_skipped', 'Camera frames not sent to the video feed.',
+                          lambda: broadcaster.skipped)
+        metrics.add_gauge('landmark_feed_viewers', 'Connected /landmarks clients.', lambda: landmarks.subscribers)
+        metrics.add_gauge('landmark_feed_records', 'Landmark records encoded for the landmark feed.',
+                          lambda: landmarks.records)
+        metrics.add_gauge('landmark_feed_bytes', 'Bytes encoded for the landmark feed (per viewer).',
+                          lambda: landmarks.bytes_encoded)
+        metrics.add_gauge('hand_tracks_started', 'Hand tracks created since startup.', lambda: gc.tracker.next_id - 1)
+        metrics.add_gauge('detection_scale', 'Scale of the hand detection input.',
+                          lambda: gc.pipeline.adaptive.scale if gc.pipeline.adaptive else 1.0)
+        metrics.add_gauge('detection_roi_lost', 'Frames in which the ROI crop lost the hands.',
+                          lambda: gc.pipeline.roi_lost)
+        metrics.add_gauge('frames_predicted', 'Frames whose landmarks were predicted instead of detected.',
+                          lambda: gc.pipeline.predicted)
+        metrics.add_gauge('detection_errors', 'Frames without detection because an inference worker failed.',
+                          lambda: getattr(gc.pipeline, 'errors', 0))
+        metrics.add_gauge('detection_active', '1 while gesture detection is running.',
+                          lambda: int(self.active.is_set()))
+        if gc.idle is not None:
+            idle = gc.idle
+            metrics.add_gauge('idle', '1 while detection is paused for lack of hands.', lambda: int(idle.idle))
+            metrics.add_gauge('idle_motion_checks', 'Motion checks run while idle.', lambda: idle.checks)
+            metrics.add_gauge('idle_seconds', 'Time spent idle.', lambda: idle.totals()[0])
+            metrics.add_gauge('idle_cpu_percent', 'Process CPU usage while idle, in percent of one core.',
+                              idle.cpu_percent)
+
+    # info:
+    # JSON-serializable description of the session.
+    def info(self):
+        return {'id': self.id, 'source': str(self.source), 'output': self.output,
+                'mappings': self.controller.mappings.path, 'active': self.active.is_set(),
+                'running': self.camera.is_running(), 'width': self.camera.width, 'height': self.camera.height,
+                'fps': self.metrics.fps.rate()}
+
+
+# SessionRegistry class:
+# ----------------------
+# Thread-safe registry of the sessions by id. Sessions created through it share 'pool' and start with
+# the registry's 'defaults' (Session keyword arguments) unless overridden. With start=False a session is
+# only registered; it starts on its first Session.start().
+class SessionRegistry:
+
+    def __init__(self, pool=None, **defaults):
+        self.pool = pool
+        self.defaults = defaults
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.next_id = 1
+
+    def create(self, session_id=None, start=True, **options):
+        with self.lock:
+            if session_id is None:
+                while str(self.next_id) in self.sessions:
+                    self.next_id += 1
+                session_id = str(self.next_id)
+            if session_id in self.sessions:
+                raise ValueError(f"Session {session_id!r} already exists")
+            settings = dict(self.defaults, **options)
+            session = Session(session_id, pool=self.pool, **settings)
+            self.sessions[session_id] = session
+        if not start:
+            return session
+        try:
+            session.start()
+        except Exception:
+            with self.lock:
+                self.sessions.pop(session_id, None)
+            session.stop()
+            raise
+        return session
+
+    def get(self, session_id):
+        return self.sessions.get(session_id)
+
+    def remove(self, session_id):
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.stop()
+        return session
+
+    def list(self):
+        with self.lock:
+            return list(self.sessions.values())
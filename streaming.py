@@ -0,0 +1,233 @@
+import base64
+import struct
+import threading
+import time
+import cv2
+import numpy as np
+from camera import BufferPool
+from tracing import TRACER
+
+CHUNK_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+
+
+# FrameBroadcaster class:
+# -----------------------
+# Annotates and JPEG-encodes each camera frame once and fans the resulting multipart chunk out to every
+# /video_feed subscriber. Only the newest encoded frame is kept: a slow client skips straight to it
+# instead of working through a backlog. Nothing is encoded while there are no subscribers.
+class FrameBroadcaster:
+
+    def __init__(self, camera, annotate=None, quality=80, size=None, max_fps=30, flip=True):
+        self.camera = camera
+        self.annotate = annotate
+        self.quality = quality
+        self.size = size          # (width, height) of the streamed frames, None keeps the camera size
+        self.max_fps = max_fps    # None or 0 streams every camera frame
+        self.flip = flip
+        self.buffers = BufferPool()
+        self.encode_count = 0
+        self.skipped = 0
+        self.subscribers = 0
+        self.running = False
+        self._seq = 0
+        self._chunk = None
+        self._thread = None
+        self._cond = threading.Condition()
+
+    def start(self):
+        if self._thread is None:
+            self.running = True
+            self._thread = threading.Thread(target=self._run, name='frame-broadcaster', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    # encode:
+    # Resizes, flips and annotates a camera frame in the broadcaster's buffers and encodes it into a
+    # ready-to-send multipart chunk. The JPEG is copied once, into the chunk.
+    def encode(self, frame):
+        buffers = self.buffers
+        if self.size is not None and (frame.shape[1], frame.shape[0]) != tuple(self.size):
+            resized = buffers.get('resized', (self.size[1], self.size[0]) + frame.shape[2:])
+            frame = cv2.resize(frame, tuple(self.size), dst=resized, interpolation=cv2.INTER_AREA)
+        if self.flip:
+            frame = cv2.flip(frame, 1, dst=buffers.get('flipped', frame.shape))
+        elif not frame.flags.writeable:
+            copy = buffers.get('copy', frame.shape)
+            np.copyto(copy, frame)
+            frame = copy
+        if self.annotate is not None:
+            self.annotate(frame)
+
+        ret, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)])
+        self.encode_count += 1
+        if not ret:
+            print("Failed to encode the frame")
+            return None
+        return b''.join((CHUNK_HEADER, jpeg.data, b'\r\n'))
+
+    def _run(self):
+        seq = 0
+        next_due = 0.0
+        while self.running and self.camera.is_running():
+            with self._cond:
+                while self.running and self.subscribers == 0:
+                    self._cond.wait(0.5)
+            if not self.running:
+                break
+
+            new_seq, frame = self.camera.wait_frame(seq)
+            if frame is None:
+                continue
+            if new_seq - seq > 1 and seq:
+                self.skipped += new_seq - seq - 1
+            seq = new_seq
+
+            now = time.monotonic()
+            if self.max_fps:
+                if now < next_due:
+                    self.skipped += 1
+                    continue
+                next_due = max(next_due + 1.0 / self.max_fps, now)
+
+            t = time.perf_counter() if TRACER.enabled else None
+            chunk = self.encode(frame)
+            if t is not None:
+                TRACER.span('encode', t, time.perf_counter(), 'video', seq)
+            if chunk is None:
+                continue
+            with self._cond:
+                self._seq += 1
+                self._chunk = chunk
+                self._cond.notify_all()
+
+        self.running = False
+        with self._cond:
+            self._cond.notify_all()
+
+    # subscribe:
+    # Generator yielding the shared encoded chunks to one client. The same bytes object is handed to all
+    # clients; a client that falls behind only ever receives the newest chunk.
+    def subscribe(self, timeout=1.0):
+        with self._cond:
+            self.subscribers += 1
+            self._cond.notify_all()
+        try:
+            seq = 0
+            while self.running:
+                with self._cond:
+                    if self._seq == seq:
+                        self._cond.wait(timeout)
+                    if self._seq == seq or self._chunk is None:
+                        continue
+                    seq, chunk = self._seq, self._chunk
+                yield chunk
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+
+# Landmark stream
+# ---------------
+# Per-frame records of the tracked hands, for viewers (e.g. remote dashboards) that draw the hands
+# themselves instead of watching the video feed. A record is a few hundred bytes instead of a JPEG
+# frame and costs a struct.pack instead of an annotate + encode. Layout (little-endian):
+#
+#   header   uint8 version (1), uint8 number of hands, uint8 gesture code (Gest value, 255 = none),
+#            uint8 reserved, uint32 frame number, uint32 capture time in ms since the stream started
+#   per hand uint16 track id, uint8 role (1 = major, 0 = minor), uint8 handedness (1 = right,
+#            0 = left, 255 = unknown), 21 x (x, y, z) float16 landmarks in normalized coordinates of
+#            the (flipped) video feed frame
+#
+# Records are sent as Server-Sent Events ('id: <frame number>', 'data: <base64 record>').
+RECORD_VERSION = 1
+RECORD_HEADER = struct.Struct('<BBBBII')
+HAND_HEADER = struct.Struct('<HBB')
+NO_GESTURE = 255
+HANDEDNESS_CODES = {'Left': 0, 'Right': 1}
+
+
+# encode_landmarks:
+# Packs one record. 'hands' holds (track id, role, handedness label, (21, 3) landmark array) tuples.
+def encode_landmarks(seq, ms, gesture, hands):
+    parts = [RECORD_HEADER.pack(RECORD_VERSION, len(hands), NO_GESTURE if gesture is None else int(gesture),
+                                0, seq & 0xFFFFFFFF, ms & 0xFFFFFFFF)]
+    for track_id, role, label, landmarks in hands:
+        parts.append(HAND_HEADER.pack(track_id & 0xFFFF, role, HANDEDNESS_CODES.get(label, 255)))
+        parts.append(landmarks.astype('<f2').tobytes())
+    return b''.join(parts)
+
+
+# LandmarkStream class:
+# ---------------------
+# Fans the landmark records published by a GestureController out to every /landmarks subscriber,
+# encoding each record once for all of them. Like FrameBroadcaster only the newest record is kept and
+# nothing is encoded while there are no subscribers. A comment line is sent to idle subscribers every
+# 'keepalive' seconds, so disconnected clients are noticed while no hands are tracked.
+class LandmarkStream:
+
+    def __init__(self, keepalive=15.0):
+        self.keepalive = keepalive
+        self.subscribers = 0
+        self.records = 0
+        self.bytes_encoded = 0
+        self.running = True
+        self.start_time = time.monotonic()
+        self._seq = 0
+        self._event = None
+        self._cond = threading.Condition()
+
+    def stop(self):
+        self.running = False
+        with self._cond:
+            self._cond.notify_all()
+
+    # publish:
+    # Encodes the record of a frame captured at 'stamp' (time.monotonic()) and wakes the subscribers.
+    def publish(self, stamp, gesture, hands):
+        if not self.subscribers:
+            return
+        ms = max(0, int((stamp - self.start_time) * 1000))
+        seq = self._seq + 1
+        record = encode_landmarks(seq, ms, gesture, hands)
+        event = b'id: %d\ndata: %s\n\n' % (seq, base64.b64encode(record))
+        self.records += 1
+        self.bytes_encoded += len(event)
+        with self._cond:
+            self._seq = seq
+            self._event = event
+            self._cond.notify_all()
+
+    # subscribe:
+    # Generator yielding the shared Server-Sent Events to one client.
+    def subscribe(self, timeout=1.0):
+        with self._cond:
+            self.subscribers += 1
+        try:
+            yield b'retry: 2000\n\n'
+            seq = self._seq
+            idle_since = time.monotonic()
+            while self.running:
+                with self._cond:
+                    if self._seq == seq:
+                        self._cond.wait(timeout)
+                    if self._seq == seq or self._event is None:
+                        event = None
+                    else:
+                        seq, event = self._seq, self._event
+                if event is not None:
+                    idle_since = time.monotonic()
+                    yield event
+                elif time.monotonic() - idle_since >= self.keepalive:
+                    idle_since = time.monotonic()
+                    yield b': keepalive\n\n'
+        finally:
+            with self._cond:
+                self.subscribers -= 1
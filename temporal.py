@@ -0,0 +1,250 @@
+import math
+import numpy as np
+from landmarks import NUM_LANDMARKS
+
+# Temporal gesture engine
+# -----------------------
+# Per-hand gesture decisions over time instead of per frame. Every hand keeps the last few frames of
+# its landmarks, gesture codes and classifier confidences in a fixed-size ring buffer
+# (LandmarkHistory). From it
+#
+#   GestureVoter      decides the stable (static) gesture by confidence-weighted, exponentially
+#                     decaying votes: a confident new gesture wins after three frames, an uncertain
+#                     one needs more, a single misclassified frame never does
+#   FrameCountDebounce decides it for classifiers without confidences (the threshold classifier): a
+#                     new gesture must be classified in six consecutive frames
+#   MotionGestures    recognizes dynamic gestures from the trajectory of the hand: swipes (left,
+#                     right, up, down) and circles (clockwise, counter-clockwise)
+#
+# Memory is fixed when a hand is created and the work per frame is bounded by the history size.
+
+# Gesture codes, same values as gesture_detection.Gest
+PALM = 31
+SWIPE_LEFT = 40
+SWIPE_RIGHT = 41
+SWIPE_UP = 42
+SWIPE_DOWN = 43
+CIRCLE_CW = 44
+CIRCLE_CCW = 45
+
+# Highest gesture code + 1, the size of the vote table
+NUM_CODES = 64
+
+
+# LandmarkHistory class:
+# ----------------------
+# Ring buffer of the last 'size' frames of one hand: landmarks (size, 21, 3), capture times, gesture
+# codes and confidences. window() returns the indices of the frames of the last 'seconds', oldest
+# first, without copying anything.
+class LandmarkHistory:
+
+    def __init__(self, size=32):
+        self.size = size
+        self.landmarks = np.zeros((size, NUM_LANDMARKS, 3), np.float32)
+        self.stamps = np.zeros(size)
+        self.gestures = np.zeros(size, np.int16)
+        self.confidences = np.zeros(size, np.float32)
+        self.count = 0
+        self.head = -1
+
+    def clear(self):
+        self.count = 0
+        self.head = -1
+
+    def push(self, landmarks, stamp, gesture, confidence=1.0):
+        self.head = (self.head + 1) % self.size
+        np.copyto(self.landmarks[self.head], landmarks)
+        self.stamps[self.head] = stamp
+        self.gestures[self.head] = gesture
+        self.confidences[self.head] = confidence
+        self.count = min(self.count + 1, self.size)
+
+    def window(self, seconds, since=None):
+        if not self.count:
+            return np.zeros(0, np.intp)
+        idx = (self.head - np.arange(self.count)[::-1]) % self.size
+        start = self.stamps[self.head] - seconds
+        if since is not None:
+            start = max(start, since)
+        return idx[self.stamps[idx] >= start]
+
+
+# FrameCountDebounce class:
+# --------------------------
+# The stable gesture changes once the same gesture was classified in more than 'frames' consecutive
+# frames. Voting with every confidence at 1.0 commits a transitional pose after three frames and switches
+# spuriously far more often under misclassification (see benchmarks/bench_temporal.py), so this is the
+# decider when the classifier reports no confidences.
+class FrameCountDebounce:
+
+    def __init__(self, frames=4, initial=PALM):
+        self.frames = frames
+        self.initial = initial
+        self.prev = initial
+        self.stable = initial
+        self.count = 0
+
+    def reset(self):
+        self.prev = self.stable = self.initial
+        self.count = 0
+
+    def update(self, gesture, confidence=1.0):
+        if gesture == self.prev:
+            self.count += 1
+        else:
+            self.count = 0
+        self.prev = gesture
+        if self.count > self.frames:
+            self.stable = gesture
+        return self.stable
+
+
+# GestureVoter class:
+# -------------------
+# Every frame the vote of each gesture decays by 'decay' and the classified gesture gains its
+# confidence. The stable gesture changes to a gesture once its vote reaches 'decision_weight' and
+# holds at least 'share' of all votes. With the defaults a gesture classified with full confidence
+# takes over on its third frame (FrameCountDebounce needs six), one classified with confidence 0.6 on
+# its fourth; misclassified frames in between count against it only with their confidence. Only used
+# with real classifier confidences.
+class GestureVoter:
+
+    def __init__(self, decay=0.6, decision_weight=1.2, share=0.65, initial=PALM):
+        self.decay = decay
+        self.decision_weight = decision_weight
+        self.share = share
+        self.votes = np.zeros(NUM_CODES)
+        self.initial = initial
+        self.stable = initial
+
+    def reset(self):
+        self.votes[:] = 0
+        self.stable = self.initial
+
+    def update(self, gesture, confidence=1.0):
+        votes = self.votes
+        votes *= self.decay
+        votes[gesture] += confidence
+        if gesture != self.stable and votes[gesture] >= self.decision_weight \
+                and votes[gesture] >= self.share * votes.sum():
+            # the votes that lost must not carry over into the next decision
+            weight = votes[gesture]
+            votes[:] = 0
+            votes[gesture] = weight
+            self.stable = gesture
+        return self.stable
+
+
+# MotionGestures class:
+# ---------------------
+# Recognizes dynamic gestures from the path of landmark 'point' (normalized coordinates of the
+# mirrored frame, so left and right are as seen by the user):
+#   swipe   - within 'swipe_time' seconds the hand moved at least 'swipe_distance' along one axis, at
+#             most 'swipe_ratio' times as far along the other one, on a path at most 'straightness'
+#             times longer than the distance covered and turning by less than 'swipe_turn' radians
+#   circle  - within 'circle_time' seconds the direction of movement turned by at least 'circle_turn'
+#             radians in one sense, over a path of at least 'circle_path', ending close to the start
+# Steps shorter than 'min_step' are ignored for the turning angle (landmark jitter). After a gesture
+# fired, the path before it is ignored and no gesture fires for 'cooldown' seconds.
+class MotionGestures:
+
+    def __init__(self, point=9, swipe_time=0.4, swipe_distance=0.2, swipe_ratio=0.5, straightness=1.3,
+                 swipe_turn=0.6, circle_time=1.5, circle_turn=1.6 * math.pi, circle_path=0.3, min_step=0.004, cooldown=0.5):
+        self.point = point
+        self.swipe_time = swipe_time
+        self.swipe_distance = swipe_distance
+        self.swipe_ratio = swipe_ratio
+        self.straightness = straightness
+        self.swipe_turn = swipe_turn
+        self.circle_time = circle_time
+        self.circle_turn = circle_turn
+        self.circle_path = circle_path
+        self.min_step = min_step
+        self.cooldown = cooldown
+        self.since = None
+
+    def reset(self):
+        self.since = None
+
+    def update(self, history):
+        now = history.stamps[history.head]
+        if self.since is not None and now - self.since < self.cooldown:
+            return None
+        gesture = self.swipe(history) or self.circle(history)
+        if gesture is not None:
+            self.since = now
+        return gesture
+
+    def path(self, history, seconds):
+        idx = history.window(seconds, self.since)
+        return history.landmarks[idx, self.point, :2]
+
+    # turning:
+    # Signed turning angles (radians) between the successive steps of a path that are longer than
+    # 'min_step', and the path length.
+    def turning(self, points):
+        steps = np.diff(points, axis=0)
+        lengths = np.sqrt((steps ** 2).sum(axis=1))
+        steps = steps[lengths >= self.min_step]
+        a, b = steps[:-1], steps[1:]
+        return np.arctan2(a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0], (a * b).sum(axis=1)), lengths.sum()
+
+    def swipe(self, history):
+        points = self.path(history, self.swipe_time)
+        if len(points) < 3:
+            return None
+        dx, dy = points[-1] - points[0]
+        major, minor = (abs(dx), abs(dy)) if abs(dx) >= abs(dy) else (abs(dy), abs(dx))
+        if major < self.swipe_distance or minor > self.swipe_ratio * major:
+            return None
+        turns, length = self.turning(points)
+        if length > self.straightness * math.hypot(dx, dy) or abs(turns.sum()) > self.swipe_turn:
+            return None
+        if abs(dx) >= abs(dy):
+            return SWIPE_RIGHT if dx > 0 else SWIPE_LEFT
+        return SWIPE_DOWN if dy > 0 else SWIPE_UP
+
+    def circle(self, history):
+        points = self.path(history, self.circle_time)
+        if len(points) < 8:
+            return None
+        turns, length = self.turning(points)
+        if len(turns) < 5 or length < self.circle_path:
+            return None
+        turn = turns.sum()
+        if abs(turn) < self.circle_turn:
+            return None
+        if math.hypot(*(points[-1] - points[0])) > 0.25 * length:
+            return None
+        # y points down, so a positive turn is clockwise on the screen
+        return CIRCLE_CW if turn > 0 else CIRCLE_CCW
+
+
+# TemporalEngine class:
+# ---------------------
+# The temporal state of one hand: its LandmarkHistory, GestureVoter, FrameCountDebounce and
+# MotionGestures. update() is called once per frame in which the hand was classified and returns
+# (stable gesture, dynamic gesture or None). The stable gesture is voted on with the classifier's
+# 'confidence', or debounced if it is None.
+class TemporalEngine:
+
+    def __init__(self, history_size=32, voter=None, motion=None, debounce=None):
+        self.history = LandmarkHistory(history_size)
+        self.voter = voter if voter is not None else GestureVoter()
+        self.debounce = debounce if debounce is not None else FrameCountDebounce()
+        self.motion = motion if motion is not None else MotionGestures()
+
+    def reset(self):
+        self.history.clear()
+        self.voter.reset()
+        self.debounce.reset()
+        self.motion.reset()
+
+    def update(self, landmarks, stamp, gesture, confidence=None):
+        if confidence is None:
+            self.history.push(landmarks, stamp, gesture)
+            stable = self.debounce.update(gesture)
+        else:
+            self.history.push(landmarks, stamp, gesture, confidence)
+            stable = self.voter.update(gesture, confidence)
+        return stable, self.motion.update(self.history)
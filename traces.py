@@ -0,0 +1,114 @@
+import json
+import time
+from types import SimpleNamespace
+
+# Landmark traces
+# ---------------
+# A landmark trace records the MediaPipe Hands output of every processed frame, one JSON object per
+# line:
+#
+#   {"seq": 12, "t": 0.4012, "hands": [{"label": "Right", "score": 0.97,
+#                                       "landmarks": [[x, y, z], ... 21 points]}]}
+#
+# 't' is the time in seconds since the first recorded frame and 'hands' is empty when no hand was
+# detected. Traces are written by GestureController (start_recording) or replay.py, and turned back
+# into MediaPipe result messages by results_from_record(), so HandRecog, the hand tracker and Controller
+# can be driven from them without a camera.
+
+
+# TraceWriter class:
+# ------------------
+# Appends the results of one frame at a time to a trace file.
+class TraceWriter:
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, 'w')
+        self.frames = 0
+        self._t0 = None
+
+    def write(self, results, seq=None, stamp=None):
+        if stamp is None:
+            stamp = time.monotonic()
+        if self._t0 is None:
+            self._t0 = stamp
+        hands = []
+        if results is not None and results.multi_hand_landmarks:
+            for i, hand_landmarks in enumerate(results.multi_hand_landmarks):
+                label, score = None, None
+                if results.multi_handedness and i < len(results.multi_handedness):
+                    classification = results.multi_handedness[i].classification[0]
+                    label, score = classification.label, round(classification.score, 4)
+                hands.append({'label': label, 'score': score,
+                              'landmarks': [[lm.x, lm.y, lm.z] for lm in hand_landmarks.landmark]})
+        record = {'seq': self.frames if seq is None else seq, 't': round(stamp - self._t0, 4), 'hands': hands}
+        self.f.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.frames += 1
+
+    def close(self):
+        self.f.close()
+
+
+# read_trace:
+# Yields the records of a trace file as dictionaries.
+def read_trace(path):
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+# results_from_record:
+# Builds an object shaped like the result of hands.process() from a trace record: multi_hand_landmarks
+# is a list of NormalizedLandmarkList and multi_handedness a list of ClassificationList messages (None
+# when there are no hands, like MediaPipe).
+def results_from_record(record):
+    from mediapipe.framework.formats import classification_pb2, landmark_pb2
+
+    landmarks, handedness = [], []
+    for index, hand in enumerate(record['hands']):
+        landmark_list = landmark_pb2.NormalizedLandmarkList()
+        for x, y, z in hand['landmarks']:
+            landmark_list.landmark.add(x=x, y=y, z=z)
+        landmarks.append(landmark_list)
+
+        classification_list = classification_pb2.ClassificationList()
+        if hand['label'] is not None:
+            classification_list.classification.add(index=index, score=hand['score'], label=hand['label'])
+        handedness.append(classification_list)
+    return SimpleNamespace(multi_hand_landmarks=landmarks or None, multi_handedness=handedness or None)
+
+
+# TracePipeline class:
+# --------------------
+# Stand-in for HandPipeline that returns the recorded results of a trace instead of running detection,
+# one record per process() call. The records are converted up front so replay measures the gesture
+# logic only. 'exhausted' is set once the last record was returned. 'times' are the recorded 't' of the
+# records and 'duration' the time one pass over the trace spans (up to one frame after the last record).
+class TracePipeline:
+
+    def __init__(self, path):
+        from pipeline import StageTimer
+        records = list(read_trace(path))
+        self.records = [results_from_record(record) for record in records]
+        self.times = [record.get('t', i / 30.0) for i, record in enumerate(records)]
+        if len(self.times) > 1:
+            self.duration = self.times[-1] * len(self.times) / (len(self.times) - 1)
+        else:
+            self.duration = 1 / 30.0
+        self.index = 0
+        self.exhausted = not self.records
+        self.timer = StageTimer()
+
+    def __len__(self):
+        return len(self.records)
+
+    def process(self, frame=None, stamp=None):
+        results = self.records[self.index]
+        self.index += 1
+        self.exhausted = self.index >= len(self.records)
+        self.timer.frames += 1
+        return results
+
+    def close(self):
+        pass
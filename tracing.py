@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Frame tracing
+# -------------
+# On-demand per-frame tracing for hiccups that aggregate metrics hide. While the process-wide TRACER
+# is enabled, every processed frame is tagged with its sequence number and capture time and the
+# stages record spans (start, end, thread, frame) into a bounded in-memory buffer: capture, the
+# preprocessing stages and hands.process of the pipeline, classify_hands, hand_recog, controls, the OS
+# calls of the input dispatcher and the volume controller and the video feed encode, each on the
+# thread it ran on. export() returns the buffer as Chrome trace JSON, which chrome://tracing and
+# ui.perfetto.dev open.
+#
+# Disabled, a hook costs one attribute check ('if TRACER.enabled'). Set GESTURE_TRACE=1 to trace from
+# startup; the app also toggles tracing through its /trace routes.
+
+
+# Tracer class:
+# -------------
+# Spans are (name, category, start, end, thread id, frame, args) with times on the time.perf_counter()
+# clock; the oldest are dropped beyond 'capacity'. The frame of a span is the one the recording thread
+# is processing (see begin_frame), or looked up by capture time for work queued by a frame and done
+# on another thread.
+class Tracer:
+
+    def __init__(self, capacity=200000):
+        self.enabled = False
+        self.capacity = capacity
+        self.events = deque(maxlen=capacity)
+        self.threads = {}
+        self.frames = {}
+        self.max_frames = 1024
+        self.dropped = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # offset of the time.perf_counter() clock from time.monotonic(), which capture times are taken on
+        self._offset = time.perf_counter() - time.monotonic()
+
+    def start(self, capacity=None):
+        with self._lock:
+            if capacity and capacity != self.capacity:
+                self.capacity = capacity
+                self.events = deque(maxlen=capacity)
+            self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+            self.frames.clear()
+
+    # clock:
+    # A time.monotonic() time stamp on the tracer's clock.
+    def clock(self, stamp):
+        return stamp + self._offset
+
+    # begin_frame:
+    # Called by the thread that is about to process frame 'seq' captured at 'stamp' (time.monotonic()).
+    # Records the capture and tags the spans the thread records from now on with 'seq'.
+    def begin_frame(self, seq, stamp):
+        self._local.frame = seq
+        with self._lock:
+            self.frames[stamp] = seq
+            if len(self.frames) > self.max_frames:
+                del self.frames[next(iter(self.frames))]
+        now = time.perf_counter()
+        self.span('frame_age', self.clock(stamp), now, 'frame', seq, capture=stamp)
+
+    # frame_of:
+    # Sequence number of the frame captured at 'stamp', if it is still known.
+    def frame_of(self, stamp):
+        return self.frames.get(stamp)
+
+    def span(self, name, start, end, category='stage', frame=None, **args):
+        thread = threading.current_thread()
+        tid = thread.ident
+        if tid not in self.threads:
+            self.threads[tid] = thread.name
+        if frame is None:
+            frame = getattr(self._local, 'frame', None)
+        if len(self.events) == self.capacity:
+            self.dropped += 1
+        self.events.append((name, category, start, end, tid, frame, args))
+
+    # stage:
+    # Span of 'seconds' ending at 'end' (default: now), as recorded by the StageTimer.
+    def stage(self, name, seconds, end=None):
+        if end is None:
+            end = time.perf_counter()
+        self.span(name, end - seconds, end)
+
+    # export:
+    # The recorded spans as a Chrome trace (JSON object format), times in microseconds.
+    def export(self):
+        pid = os.getpid()
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'gesture controller'}}]
+        for tid, name in list(self.threads.items()):
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+        for name, category, start, end, tid, frame, args in list(self.events):
+            if frame is not None:
+                args = dict(args, frame=frame)
+            events.append({'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': round(start * 1e6, 1), 'dur': round(max(end - start, 0.0) * 1e6, 1),
+                           'args': args})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'spans_dropped': self.dropped}}
+
+    def dumps(self):
+        return json.dumps(self.export())
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.export(), f)
+
+
+TRACER = Tracer()
+if os.environ.get('GESTURE_TRACE', '0') not in ('', '0'):
+    TRACER.start()
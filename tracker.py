@@ -0,0 +1,132 @@
+# Hand identity tracking
+# ----------------------
+# MediaPipe reports the hands of a frame in no particular order and its handedness label flickers, so
+# deciding major/minor per frame from the label alone swaps the hands every now and then and resets
+# their gesture debouncing. HandTracker keeps a track per physical hand instead: detections are
+# associated with the tracks of the previous frames by wrist position and handedness score, every
+# track gets a stable id, a smoothed handedness and its own per-hand state object (a HandRecog).
+
+
+# TrackedHand class:
+# ------------------
+# One physical hand. 'p_right' is the exponentially smoothed probability that it is a right hand and
+# 'label' the handedness derived from it with hysteresis. 'hand_result' is the landmark list of the
+# current frame (None while the hand is not visible).
+class TrackedHand:
+
+    def __init__(self, track_id, state):
+        self.track_id = track_id
+        self.state = state
+        self.p_right = 0.5
+        self.label = None
+        self.wrist = (0.0, 0.0)
+        self.hand_result = None
+        self.visible = False
+        self.missed = 0
+        self.age = 0
+
+
+# HandTracker class:
+# ------------------
+# Associates the detections of each frame with existing tracks. The cost of matching a detection to a
+# track is the wrist distance (normalized image coordinates) plus 'label_weight' times the difference
+# in right-hand probability; pairs are matched greedily by increasing cost up to 'max_distance'.
+# Unmatched detections start new tracks, tracks unseen for more than 'max_missed' frames are dropped.
+# 'make_state' creates the per-hand state object of a new track.
+class HandTracker:
+
+    def __init__(self, make_state, max_distance=0.3, max_missed=5, label_alpha=0.3, label_weight=0.2,
+                 hysteresis=0.15):
+        self.make_state = make_state
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.label_alpha = label_alpha
+        self.label_weight = label_weight
+        self.hysteresis = hysteresis
+        self.tracks = []
+        self.next_id = 1
+
+    # detections:
+    # (landmark list, wrist (x, y), right-hand probability) for every hand in a hands.process() result,
+    # read straight from the protobuf fields.
+    @staticmethod
+    def detections(results):
+        found = []
+        if not results.multi_hand_landmarks:
+            return found
+        handedness = results.multi_handedness or []
+        for i, hand_landmarks in enumerate(results.multi_hand_landmarks):
+            wrist = hand_landmarks.landmark[0]
+            p_right = 0.5
+            if i < len(handedness) and handedness[i].classification:
+                classification = handedness[i].classification[0]
+                p_right = classification.score if classification.label == 'Right' else 1.0 - classification.score
+            found.append((hand_landmarks, (wrist.x, wrist.y), p_right))
+        return found
+
+    # update:
+    # Updates the tracks with the results of one frame and returns the visible tracks.
+    def update(self, results):
+        found = self.detections(results)
+        pairs = []
+        for d, (_, wrist, p_right) in enumerate(found):
+            for track in self.tracks:
+                dist = ((wrist[0] - track.wrist[0]) ** 2 + (wrist[1] - track.wrist[1]) ** 2) ** 0.5
+                if dist <= self.max_distance:
+                    pairs.append((dist + self.label_weight * abs(p_right - track.p_right), d, track))
+        pairs.sort(key=lambda pair: pair[0])
+
+        matched = {}
+        for _, d, track in pairs:
+            if d not in matched and track not in matched.values():
+                matched[d] = track
+
+        for track in self.tracks:
+            track.visible = False
+            track.hand_result = None
+        for d, (hand_landmarks, wrist, p_right) in enumerate(found):
+            track = matched.get(d)
+            if track is None:
+                track = TrackedHand(self.next_id, self.make_state())
+                track.p_right = p_right
+                self.next_id += 1
+                self.tracks.append(track)
+            else:
+                track.p_right += self.label_alpha * (p_right - track.p_right)
+            track.wrist = wrist
+            track.hand_result = hand_landmarks
+            track.visible = True
+            track.missed = 0
+            track.age += 1
+            if track.label is None or track.p_right > 0.5 + self.hysteresis:
+                track.label = 'Right' if track.p_right >= 0.5 else 'Left'
+            if track.p_right < 0.5 - self.hysteresis:
+                track.label = 'Left'
+
+        for track in self.tracks:
+            if not track.visible:
+                track.missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+        return [track for track in self.tracks if track.visible]
+
+    # roles:
+    # Returns the visible (major, minor) tracks; either may be None. With 'right_major' the right hand is
+    # the major one. If both visible hands carry the same label, the one more likely to be a right hand
+    # counts as the right one.
+    def roles(self, right_major=True):
+        visible = sorted((track for track in self.tracks if track.visible),
+                         key=lambda track: track.p_right, reverse=True)
+        right = left = None
+        for track in visible:
+            if track.label == 'Right' and right is None:
+                right = track
+            elif track.label == 'Left' and left is None:
+                left = track
+        if len(visible) >= 2 and (right is None or left is None):
+            right, left = visible[0], visible[1]
+        if right_major:
+            return right, left
+        return left, right
+
+    def reset(self):
+        self.tracks = []
@@ -0,0 +1,150 @@
+import sys
+import threading
+import time
+from tracing import TRACER
+
+
+# PycawVolumeBackend class:
+# -------------------------
+# Windows master volume through pycaw. comtypes and pycaw are only imported when the backend is created,
+# and the speaker endpoint is looked up and activated once instead of on every change. Must be created
+# and used on the same thread (the VolumeController worker).
+class PycawVolumeBackend:
+
+    def __init__(self):
+        from ctypes import cast, POINTER
+        import comtypes
+        from comtypes import CLSCTX_ALL
+        from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume
+
+        comtypes.CoInitialize()
+        devices = AudioUtilities.GetSpeakers()
+        interface = devices.Activate(IAudioEndpointVolume._iid_, CLSCTX_ALL, None)
+        self.volume = cast(interface, POINTER(IAudioEndpointVolume))
+
+    def get_level(self):
+        return self.volume.GetMasterVolumeLevelScalar()
+
+    def set_level(self, level):
+        self.volume.SetMasterVolumeLevelScalar(level, None)
+
+
+# MemoryVolumeBackend class:
+# --------------------------
+# In-memory volume level for platforms without a volume API, headless runs and benchmarks. Counts the
+# set_level calls it receives.
+class MemoryVolumeBackend:
+
+    def __init__(self, level=0.5):
+        self.level = level
+        self.sets = 0
+
+    def get_level(self):
+        return self.level
+
+    def set_level(self, level):
+        self.level = level
+        self.sets += 1
+
+
+# make_volume_backend:
+# Creates the volume backend for this platform: pycaw on Windows, the in-memory backend elsewhere or if
+# pycaw can not be used.
+def make_volume_backend():
+    if sys.platform == 'win32':
+        try:
+            return PycawVolumeBackend()
+        except Exception as e:
+            print(f"Error: System volume control unavailable ({e}), using in-memory volume.")
+    return MemoryVolumeBackend()
+
+
+# VolumeController class:
+# -----------------------
+# Applies volume changes on a worker thread. change() only adds to a pending delta; the worker applies
+# the accumulated delta at most 'max_rate' times per second with a single set_level call. The current
+# level is read from the backend once and then tracked locally, re-reading it every 'resync_interval'
+# seconds in case it was changed outside this program. The backend is created lazily by
+# 'backend_factory' on the worker thread.
+class VolumeController:
+
+    def __init__(self, backend_factory=make_volume_backend, max_rate=20, resync_interval=2.0):
+        self.backend_factory = backend_factory
+        self.backend = None
+        self.max_rate = max_rate
+        self.resync_interval = resync_interval
+        self.changes = 0
+        self.updates = 0
+        self.level = None
+        self._pending = 0.0
+        self._synced = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._ready = threading.Event()
+        self.running = False
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self.running = True
+                self._thread = threading.Thread(target=self._run, name='volume-controller', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    # change:
+    # Queues a relative volume change (fraction of the full range). Never blocks on the audio API.
+    def change(self, delta):
+        if self._thread is None:
+            self.start()
+        with self._cond:
+            self._pending += delta
+            self.changes += 1
+            self._cond.notify()
+
+    # flush:
+    # Waits until all queued changes have been applied.
+    def flush(self, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        self._ready.wait(timeout)
+        while time.monotonic() < deadline:
+            with self._cond:
+                if self._pending == 0.0:
+                    return True
+            time.sleep(1.0 / self.max_rate)
+        return False
+
+    def _apply(self, delta):
+        now = time.monotonic()
+        if self.level is None or now - self._synced > self.resync_interval:
+            self.level = self.backend.get_level()
+            self._synced = now
+        level = min(1.0, max(0.0, self.level + delta))
+        if level != self.level:
+            t = time.perf_counter() if TRACER.enabled else None
+            self.backend.set_level(level)
+            if t is not None:
+                TRACER.span('set_volume', t, time.perf_counter(), 'dispatch')
+            self.level = level
+            self.updates += 1
+
+    def _run(self):
+        self.backend = self.backend_factory()
+        self._ready.set()
+        period = 1.0 / self.max_rate
+        while True:
+            with self._cond:
+                while self.running and self._pending == 0.0:
+                    self._cond.wait()
+                if not self.running:
+                    break
+                delta, self._pending = self._pending, 0.0
+            self._apply(delta)
+            time.sleep(period)